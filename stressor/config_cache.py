@@ -0,0 +1,155 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+Cache parsed and macro-resolved configuration files on disk.
+"""
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+from stressor import __version__
+from stressor.util import logger
+
+
+def file_digest(data):
+    """Return the SHA-256 hex digest of `data` (bytes)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _get_file_digest(path):
+    try:
+        with open(path, "rb") as f:
+            return file_digest(f.read())
+    except OSError:
+        return None
+
+
+class ConfigCache:
+    """
+    Store the parsed and macro-resolved structure of a configuration file.
+
+    Entries are keyed by the absolute path of the main file and are only
+    valid, if the main file and all recorded dependencies (files that were
+    included by `$load()`) are unchanged.
+    Configurations that use `$env()` are not cached, since environment
+    variables often hold secrets.
+    Activities are *not* cached, since they are instantiated from the
+    resolved structure (which is fast compared to parsing YAML).
+
+    The cache folder defaults to ``$XDG_CACHE_HOME/stressor`` (or
+    ``~/.cache/stressor``) and can be changed by the ``STRESSOR_CACHE_DIR``
+    environment variable. Set ``STRESSOR_CACHE_DIR`` to an empty string to
+    disable caching.
+
+    Errors while accessing the cache are logged and otherwise ignored.
+    """
+
+    #: Incremented when the entry format changes
+    FORMAT_VERSION = 1
+
+    def __init__(self, folder=None):
+        if folder is None:
+            folder = self.get_default_folder()
+        #: (str) Cache folder (None: caching disabled)
+        self.folder = folder or None
+
+    def __str__(self):
+        return f"ConfigCache<{self.folder}>"
+
+    @staticmethod
+    def get_default_folder():
+        folder = os.environ.get("STRESSOR_CACHE_DIR")
+        if folder is not None:
+            return folder
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        return os.path.join(base, "stressor")
+
+    def _get_entry_path(self, path):
+        key = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()
+        return os.path.join(self.folder, f"{key}.pickle")
+
+    def _get_meta(self, digest, macro_names):
+        return {
+            "format_version": self.FORMAT_VERSION,
+            "stressor_version": __version__,
+            "python_version": tuple(sys.version_info[:3]),
+            "digest": digest,
+            "macros": tuple(sorted(macro_names)),
+        }
+
+    @staticmethod
+    def _check_deps(deps):
+        for kind, name, value in deps:
+            if kind == "file":
+                if _get_file_digest(name) != value:
+                    return False
+            else:
+                return False
+        return True
+
+    def get(self, path, digest, macro_names):
+        """Return the cached structure for `path` or None if missing or stale.
+
+        Args:
+            path (str): absolute path of the main configuration file
+            digest (str): current :func:`file_digest` of the main file
+            macro_names (iterable[str]): names of all registered macros
+        """
+        if not self.folder:
+            return None
+        entry_path = self._get_entry_path(path)
+        try:
+            with open(entry_path, "rb") as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring invalid config cache entry {entry_path}: {e}")
+            return None
+        if entry.get("meta") != self._get_meta(digest, macro_names):
+            return None
+        if not self._check_deps(entry["deps"]):
+            return None
+        logger.info(f"Using cached configuration {entry_path}")
+        return entry["config"]
+
+    def put(self, path, digest, macro_names, config, deps):
+        """Store the resolved `config` structure for `path`.
+
+        Args:
+            path (str): absolute path of the main configuration file
+            digest (str): :func:`file_digest` of the main file
+            macro_names (iterable[str]): names of all registered macros
+            config (dict): the parsed and macro-resolved structure
+            deps (list[tuple]): `(kind, name, value)` tuples, see
+                :meth:`stressor.config_manager.ConfigManager.add_dependency`
+        """
+        if not self.folder:
+            return False
+        entry = {
+            "meta": self._get_meta(digest, macro_names),
+            "deps": list(deps),
+            "config": config,
+        }
+        entry_path = self._get_entry_path(path)
+        try:
+            os.makedirs(self.folder, mode=0o700, exist_ok=True)
+            # Write a temp file and rename, so concurrent workers never read
+            # a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, entry_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            logger.warning(f"Could not write config cache entry {entry_path}: {e}")
+            return False
+        logger.debug(f"Wrote config cache entry {entry_path}")
+        return True
@@ -7,16 +7,24 @@ import re
 
 import yaml
 
+from stressor.config_cache import ConfigCache, file_digest
+from stressor.feeder import Feeder
+from stressor.load_profile import KneeFinder, LoadProfile
 from stressor.plugin_manager import PluginManager
 from stressor.plugins.base import ActivityBase, ActivityCompileError
+from stressor.traffic_mix import SequenceMix
 from stressor.util import (
     NO_DEFAULT,
+    LogSampler,
     PathStack,
+    ResultRetention,
     StressorError,
     assert_always,
     check_arg,
     get_dict_attr,
     logger,
+    parse_duration,
+    yaml_load,
 )
 
 VAR_MACRO_REX = re.compile(r"\$\(\s*(\w[\w.:]*)\s*\)")
@@ -111,6 +119,10 @@ class ConfigManager:
             "error": [],
             "warning": [],
         }
+        #: (list[tuple]) `(kind, name, value)` inputs of load-time macros
+        self.dependencies = []
+        #: (bool) True if the resolved config may be cached
+        self.cacheable = True
 
         # if path is not None:
         #     self.read(path)
@@ -177,6 +189,16 @@ class ConfigManager:
         """Shortcut to config_all["sequences"]."""
         return self.config_all["sequences"]
 
+    def add_dependency(self, kind, name, value):
+        """Record an input of a load-time macro (used to validate cache entries).
+
+        Args:
+            kind (str): 'file' (`value` is the content digest)
+            name (str): file path
+            value (str): file digest
+        """
+        self.dependencies.append((kind, name, value))
+
     def has_errors(self, or_warnings=False):
         return bool(self.results["error"] or (or_warnings and self.results["warning"]))
 
@@ -251,8 +273,9 @@ class ConfigManager:
                 f"File version mismatch: expected {self.FILE_VERSION}, but found {file_version}."
             )
 
+        optional_sections = {"feeders"}
         missing = known_sections.difference(sections)
-        extra = sections.difference(known_sections)
+        extra = sections.difference(known_sections, optional_sections)
         if extra or missing:
             raise ConfigurationError(
                 "Configuration file check failed:\n  missing sections: {}\n  invalid sections: {}".format(
@@ -266,11 +289,120 @@ class ConfigManager:
                 self.report_error(
                     f"config.base_url must be an absolute URL ('http(s)://...'): {base_url!r}",
                 )
+            try:
+                LogSampler(cfg["config"].get("log_sampling"))
+            except (TypeError, ValueError) as e:
+                self.report_error(f"{e}", stack="config.log_sampling")
+            random_seed = cfg["config"].get("random_seed")
+            if random_seed is not None and (
+                not isinstance(random_seed, (int, str)) or isinstance(random_seed, bool)
+            ):
+                self.report_error(
+                    f"Expected an int or str, but found {random_seed!r}",
+                    stack="config.random_seed",
+                )
+            try:
+                ResultRetention(cfg["config"].get("result_retention"))
+            except (TypeError, ValueError) as e:
+                self.report_error(f"{e}", stack="config.result_retention")
 
         if _check_type("context", (dict, None)):
             pass
+        if "feeders" in sections and _check_type("feeders", dict):
+            for name, opts in cfg["feeders"].items():
+                try:
+                    Feeder.check_options(name, opts)
+                    self.resolve_path(opts["path"])
+                except ValueError as e:
+                    self.report_error(f"{e}", stack=f"feeders.{name}")
         if _check_type("sessions", dict):
-            pass
+            users = cfg["sessions"].get("users")
+            if isinstance(users, str):
+                from stressor.session_manager import check_users_file
+
+                try:
+                    if not users.lower().endswith((".csv", ".jsonl")):
+                        raise ValueError(
+                            "expected a list or the path of a *.csv or *.jsonl file"
+                        )
+                    feeder = Feeder("users", self.resolve_path(users))
+                    try:
+                        check_users_file(feeder)
+                    finally:
+                        feeder.close()
+                except (OSError, ValueError) as e:
+                    self.report_error(f"{e}", stack="sessions.users")
+            elif isinstance(users, list):
+                from stressor.session_manager import check_user_def
+
+                for idx, user in enumerate(users):
+                    try:
+                        check_user_def(user)
+                    except ValueError as e:
+                        self.report_error(f"{e}", stack=f"sessions.users#{idx:02}")
+            else:
+                self.report_error(
+                    f"Expected a list or a file name, but found {type(users)!r}",
+                    stack="sessions.users",
+                )
+            http_cache = cfg["sessions"].get("http_cache", False)
+            if not isinstance(http_cache, bool) and (
+                not isinstance(http_cache, int) or http_cache <= 0
+            ):
+                self.report_error(
+                    f"Expected a bool or size in MB, but found {http_cache!r}",
+                    stack="sessions.http_cache",
+                )
+            parallel_workers = cfg["sessions"].get("parallel_workers")
+            if parallel_workers is not None and (
+                not isinstance(parallel_workers, int) or parallel_workers < 1
+            ):
+                self.report_error(
+                    f"Expected a positive int, but found {parallel_workers!r}",
+                    stack="sessions.parallel_workers",
+                )
+            throttle = cfg["sessions"].get("throttle")
+            if throttle is not None:
+                from stressor.throttle import Throttle
+
+                try:
+                    Throttle(throttle)
+                except (TypeError, ValueError) as e:
+                    self.report_error(f"{e}", stack="sessions.throttle")
+            if isinstance(users, list):
+                # User attributes may override the throttle settings (users of
+                # CSV/JSONL files are checked when their session starts)
+                from stressor.throttle import Throttle
+
+                for idx, user in enumerate(users):
+                    if not isinstance(user, dict):
+                        continue
+                    opts = {
+                        k: v
+                        for k, v in user.items()
+                        if k in Throttle.KNOWN_ARGS and v not in (None, "")
+                    }
+                    try:
+                        Throttle(opts)
+                    except (TypeError, ValueError) as e:
+                        self.report_error(f"{e}", stack=f"sessions.users#{idx:02}")
+            load_profile = cfg["sessions"].get("load_profile")
+            find_knee = cfg["sessions"].get("find_knee")
+            if load_profile is not None and find_knee is not None:
+                self.report_error(
+                    "`load_profile` and `find_knee` are mutually exclusive",
+                    stack="sessions",
+                )
+            elif load_profile is not None:
+                try:
+                    LoadProfile(load_profile)
+                except (TypeError, ValueError) as e:
+                    self.report_error(f"{e}", stack="sessions.load_profile")
+            elif find_knee is not None:
+                try:
+                    KneeFinder(find_knee)
+                except (TypeError, ValueError) as e:
+                    self.report_error(f"{e}", stack="sessions.find_knee")
 
         #   - sequences must be a dict of dicts.
         #     All entries must contain 'activity'
@@ -320,20 +452,55 @@ class ConfigManager:
                                         stack=stack,
                                     )
 
-        # Scenario list must contain 'sequence' keys and all sequences must exist
+        # Scenario list must contain 'sequence' (or 'mix') keys and all sequences
+        # must exist
         if _check_type("scenario", list):
+            # Mix names are used as keys of the statistics
+            mix_names = set()
             for idx, seq_def in enumerate(cfg["scenario"]):
                 stack = f".scenario#{idx:02}"
-                if not isinstance(seq_def, dict) or "sequence" not in seq_def:
+                if not isinstance(seq_def, dict) or (
+                    ("sequence" in seq_def) == ("mix" in seq_def)
+                ):
                     self.report_error(
-                        "Expected dict with `sequence` key",
+                        "Expected dict with `sequence` or `mix` key",
                         stack=stack,
                     )
+                elif "mix" in seq_def:
+                    mix_name = seq_def.get("name", f"mix_{len(mix_names) + 1}")
+                    if mix_name in mix_names:
+                        self.report_error(
+                            f"`mix`: duplicate name {mix_name!r}", stack=stack
+                        )
+                    mix_names.add(mix_name)
+                    try:
+                        mix = SequenceMix(seq_def["mix"], seq_def.get("transitions"))
+                    except (TypeError, ValueError) as e:
+                        self.report_error(f"{e}", stack=stack)
+                        continue
+                    for name in mix.names:
+                        if name in ("init", "end") or name not in sequence_names:
+                            self.report_error(
+                                f"`mix`: sequence {name!r} is not defined in "
+                                "`sequences` (or reserved)",
+                                stack=stack,
+                            )
+                elif "transitions" in seq_def:
+                    self.report_error("`transitions` requires `mix`", stack=stack)
                 elif seq_def["sequence"] not in sequence_names:
                     self.report_error(
                         "sequence name is not defined in `sequences`",
                         stack=stack,
                     )
+                if isinstance(seq_def, dict) and "pace" in seq_def:
+                    try:
+                        if parse_duration(seq_def["pace"]) < 0:
+                            raise ValueError
+                    except (TypeError, ValueError):
+                        self.report_error(
+                            "`pace` must be a positive duration, e.g. 2.5 or '500ms'",
+                            stack=stack,
+                        )
 
         # TODO:
         #   - if init is given, it must be first?
@@ -341,7 +508,9 @@ class ConfigManager:
         #   - assert_json, assert_match, ...
         return file_version
 
-    def _compile(self, value, parent=None, parent_key=None, stack=None):
+    def _compile(
+        self, value, parent=None, parent_key=None, stack=None, mode="all", scope=None
+    ):
         """Apply load-time conversions after a config file was read.
 
         - Replace activity definitions with instances of :class:`ActvityBase`
@@ -349,6 +518,13 @@ class ConfigManager:
 
         **Note:** Some makros, especially `$(CONTEXT.VAR)` are *not* resolved here,
         because this needs to be done at run-time.
+
+        Args:
+            mode (str): 'macros' only resolves macros (the result can be cached),
+                'activities' only instantiates activities, 'all' does both.
+            scope (str): 'sequences' for the `sequences` dict, 'sequence' for a
+                list of activity definitions, 'activity' for an activity
+                definition (only these may be `parallel:` blocks), else None.
         """
         pm = PluginManager
         assert pm.activity_plugin_map
@@ -360,9 +536,10 @@ class ConfigManager:
             self.stack = PathStack("config")
             stack = self.stack
             # Register sequence names
-            for seq_name in value.get("sequences", {}).keys():
-                # Create an initial statistics dict for sequence_stats[SEQ_NAME]:
-                stats.register_sequence(seq_name)
+            if mode != "macros":
+                for seq_name in value.get("sequences", {}).keys():
+                    # Create an initial statistics dict for sequence_stats[SEQ_NAME]:
+                    stats.register_sequence(seq_name)
 
         if parent_key == "activity":
             path_info = parent.get(parent_key)
@@ -375,7 +552,7 @@ class ConfigManager:
             # Reslove `$name()` macros, which may replace themselves, e.g.
             #   - "GetRequest" -> `GetRequestActivity()`
             #   - "$load()" -> list or dict that needs to be compiled as well
-            if isinstance(value, str) and "$" in value:
+            if isinstance(value, str) and "$" in value and mode != "activities":
                 has_match = False
                 for macro_cls in pm.macro_plugin_map.values():
                     try:
@@ -383,6 +560,8 @@ class ConfigManager:
                         handled, res = macro.match_apply(self, parent, parent_key)
                         if handled:
                             has_match = True
+                            if not macro.cacheable:
+                                self.cacheable = False
                             logger.debug(f"Eval {stack}: {value} => {res}")
                             # Re-init `value` in case the macro replaced it
                             value = parent[parent_key]
@@ -400,14 +579,38 @@ class ConfigManager:
 
             # Resolve lists and dicts recursively:
             if isinstance(value, dict):
+                # A `parallel:` block in a sequence is a `Parallel` activity.
+                # The children are compiled first, because the key is added last
+                is_parallel = (
+                    mode != "macros"
+                    and scope == "activity"
+                    and "parallel" in value
+                    and "activity" not in value
+                )
+                if is_parallel:
+                    value["activity"] = "Parallel"
                 # Macros may change the dictionary size, so iterate over a copy
                 for key, sub_val in tuple(value.items()):
-                    self._compile(sub_val, value, key, stack)
+                    if parent is None:
+                        sub_scope = "sequences" if key == "sequences" else None
+                    elif scope == "sequences" or (is_parallel and key == "parallel"):
+                        sub_scope = "sequence"
+                    else:
+                        sub_scope = None
+                    self._compile(sub_val, value, key, stack, mode, sub_scope)
+                if is_parallel and isinstance(value["activity"], ActivityBase):
+                    # The activity owns the children now, so they are not
+                    # copied with the activity args on every execution
+                    del value["parallel"]
                 return
             elif isinstance(value, (list, tuple)):
                 # Macros may change the list size, so iterate over a copy
+                sub_scope = "activity" if scope == "sequence" else None
                 for idx, elem in enumerate(tuple(value)):
-                    self._compile(elem, value, idx, stack)
+                    self._compile(elem, value, idx, stack, mode, sub_scope)
+                return
+
+            if mode == "macros":
                 return
 
             # Either 'activity' was already an activity name, or a preceeding macro
@@ -432,13 +635,58 @@ class ConfigManager:
 
         return
 
-    def read(self, path, load_files=True):
+    def _mark_result_references(self, cfg):
+        """Set `activity.result_is_referenced` for all sequence activities.
+
+        `context.last_result` is overwritten by every activity and reset at
+        the end of a sequence, so a result is only read if the *next* activity
+        of the same sequence references it.
+        """
+        sequences = cfg.get("sequences")
+        if not isinstance(sequences, dict):
+            return
+        try:
+            policy = ResultRetention(cfg["config"].get("result_retention")).policy
+        except (AttributeError, TypeError, ValueError):
+            policy = None  # Already reported by `validate_config()`
+
+        for seq_name, act_list in sequences.items():
+            if not isinstance(act_list, list):
+                continue
+            activities = [
+                act_def.get("activity") if isinstance(act_def, dict) else None
+                for act_def in act_list
+            ]
+            activities.append(None)
+            for idx, activity in enumerate(activities[:-1]):
+                if not isinstance(activity, ActivityBase):
+                    continue
+                next_activity = activities[idx + 1]
+                activity.result_is_referenced = (
+                    isinstance(next_activity, ActivityBase)
+                    and next_activity.references_last_result()
+                )
+                if activity.result_is_referenced and policy == "none":
+                    self.report_error(
+                        "Activity reads `last_result`, but "
+                        "`config.result_retention` is 'none'",
+                        level="warning",
+                        stack=f"sequences/{seq_name}#{idx + 1:02}",
+                    )
+        return
+
+    def read(self, path, load_files=True, use_cache=False):
         """Read a YAML file into ``self.config_all``.
 
+        Args:
+            use_cache (bool): re-use the parsed and macro-resolved structure
+                from a previous run if the file and its dependencies are
+                unchanged (see :class:`~stressor.config_cache.ConfigCache`)
         Raises:
             ConfigurationError
         """
         check_arg(load_files, bool)
+        check_arg(use_cache, bool)
 
         self.config_all = None
 
@@ -451,22 +699,38 @@ class ConfigManager:
         self.root_folder = os.path.dirname(path)
         self.name = os.path.splitext(os.path.basename(path))[0]
 
-        with open(path) as f:
+        with open(path, "rb") as f:
+            data = f.read()
+
+        cache = ConfigCache() if use_cache else None
+        digest = file_digest(data) if cache else None
+        macro_names = PluginManager.macro_plugin_map.keys()
+        res = cache.get(path, digest, macro_names) if cache else None
+
+        if res is None:
             try:
-                res = yaml.safe_load(f)
+                res = yaml_load(data)
             except yaml.parser.ParserError as e:
                 raise ConfigurationError(f"Could not parse YAML: {e}") from None
 
-        if not isinstance(res, dict) or not res.get("file_version", "").startswith(
-            "stressor#"
-        ):
-            raise ConfigurationError(
-                "Not a `stressor` file (missing 'stressor#VERSION' tag)."
-            )
+            if not isinstance(res, dict) or not str(
+                res.get("file_version", "")
+            ).startswith("stressor#"):
+                raise ConfigurationError(
+                    "Not a `stressor` file (missing 'stressor#VERSION' tag)."
+                )
+
+            self.dependencies = []
+            self.cacheable = True
+            self._compile(res, mode="macros")
+
+            if cache and self.cacheable and not self.has_errors(or_warnings=True):
+                cache.put(path, digest, macro_names, res, self.dependencies)
 
-        self._compile(res)
+        self._compile(res, mode="activities")
 
         self.file_version = self.validate_config(res)
+        self._mark_result_references(res)
 
         if self.results["warning"]:
             logger.error("Compiler warnings:")
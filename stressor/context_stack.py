@@ -2,11 +2,187 @@
 # Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
 """
 """
-from copy import deepcopy
-
 from stressor.util import check_arg, get_dict_attr
 
 
+class ContextFrame(dict):
+    """A dict that only stores its own entries and falls back to a parent.
+
+    Reading a key that was not set in this frame returns the parent's value,
+    so creating a frame is O(1), no matter how large the parent context is.
+    Writes (and deletions) are stored in this frame only, so the parent is
+    never modified (*copy-on-write*).
+
+    Note that only top-level keys are copied on write: nested values (e.g. a
+    list of user dicts) are shared with the parent and must not be modified
+    in-place.
+
+    Lookups of parent entries use a flattened dict of all parent frames that
+    is cached per frame. Writes update the frame's own cache in place and
+    increment its version, so only the flattened dicts of descendant frames
+    are rebuilt (e.g. writing `last_result` to a sequence frame does not copy
+    the session's context).
+
+    Args:
+        parent (dict):
+            The fallback mapping, e.g. another :class:`ContextFrame` or a
+            plain dict that is treated as read-only.
+        data (dict, optional):
+            Initial entries of this frame (shallow copy).
+    """
+
+    __slots__ = ("_deleted", "_flat", "_parent_version", "_version", "parent")
+
+    def __init__(self, parent, data=None):
+        super().__init__(data or ())
+        #: (dict) The fallback mapping
+        self.parent = parent
+        # Keys of the parent that were deleted in this frame
+        self._deleted = set()
+        # Cached result of `flatten()`
+        self._flat = None
+        # Incremented whenever the result of `flatten()` changes
+        self._version = 0
+        # Version of the parent that `_flat` is based on
+        self._parent_version = None
+
+    def __missing__(self, key):
+        # Called by `dict.__getitem__()` if the key is not stored in this frame
+        if key in self._deleted:
+            raise KeyError(key)
+        parent = self.parent
+        if isinstance(parent, ContextFrame):
+            return parent.flatten()[key]
+        return parent[key]
+
+    def flatten(self):
+        """Return a dict of all entries, including the parent's (cached).
+
+        The result must not be modified.
+        """
+        parent = self.parent
+        if isinstance(parent, ContextFrame):
+            parent_flat = parent.flatten()
+            parent_version = parent._version
+        else:
+            parent_flat = parent
+            parent_version = 0
+        flat = self._flat
+        if flat is None or self._parent_version != parent_version:
+            flat = dict(parent_flat)
+            for key in self._deleted:
+                flat.pop(key, None)
+            flat.update(dict.items(self))
+            self._flat = flat
+            self._parent_version = parent_version
+            self._version += 1
+        return flat
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key):
+            return True
+        elif key in self._deleted:
+            return False
+        parent = self.parent
+        if isinstance(parent, ContextFrame):
+            return key in parent.flatten()
+        return key in parent
+
+    def __iter__(self):
+        return iter(self.flatten())
+
+    def __len__(self):
+        return len(self.flatten())
+
+    def __eq__(self, other):
+        return self.flatten() == other
+
+    def __ne__(self, other):
+        return self.flatten() != other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.flatten())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.flatten().keys()
+
+    def values(self):
+        return self.flatten().values()
+
+    def items(self):
+        return self.flatten().items()
+
+    def copy(self):
+        """Return a flat copy as plain dict."""
+        return self.flatten().copy()
+
+    def own_items(self):
+        """Return `(key, value)` pairs that were set in this frame."""
+        return dict.items(self)
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._deleted.discard(key)
+        # Keep our own cache valid, but invalidate the descendants' caches
+        if self._flat is not None:
+            self._flat[key] = value
+        self._version += 1
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        dict.pop(self, key, None)
+        self._deleted.add(key)
+        if self._flat is not None:
+            self._flat.pop(key, None)
+        self._version += 1
+
+    def setdefault(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return default
+
+    def pop(self, key, *args):
+        try:
+            value = self[key]
+        except KeyError:
+            if args:
+                return args[0]
+            raise
+        del self[key]
+        return value
+
+    def popitem(self):
+        """Remove and return the last `(key, value)` pair of :meth:`flatten`."""
+        flat = self.flatten()
+        if not flat:
+            raise KeyError("popitem(): dictionary is empty")
+        key = next(reversed(flat))
+        value = flat[key]
+        del self[key]
+        return key, value
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        self._deleted.update(self.flatten())
+        dict.clear(self)
+        self._flat = None
+        self._version += 1
+
+
 class RunContext:
     """Basically a dict, holding context variables as key/value pairs.
 
@@ -23,7 +199,7 @@ class RunContext:
             a path string for the current scope.
         own_attributes (dict):
             A dict of attributes that are explicitly defined by this instance.
-        all_attributes (dict):
+        all_attributes (:class:`ContextFrame`):
             The aggregated context, created by overloading the parent's context
             with our own ``attributes``
     """
@@ -38,8 +214,10 @@ class RunContext:
                 a path string for the current scope.
             update_attributes (dict):
                 A dict of attributes that are explicitly defined by this instance.
+                The root context does not copy or modify this dict.
             copy_data (bool):
-
+                Create a new scope, so changes are discarded when this frame is
+                popped. Otherwise the parent's context is shared.
         """
         check_arg(parent, RunContext, or_none=True)
         check_arg(name, str, name != "")
@@ -51,16 +229,18 @@ class RunContext:
         if update_attributes is None:
             self.own_attributes = {}
         else:
-            self.own_attributes = deepcopy(update_attributes)
+            self.own_attributes = update_attributes
 
         if parent is None:
-            self.all_attributes = self.own_attributes
+            # Writes are stored in the frame, so the original dict is unchanged
+            # (and may be shared by other sessions)
+            self.all_attributes = ContextFrame(self.own_attributes)
         elif copy_data:
-            # Create a copy of the parent's context, so the original state is
-            # restored on pull
-            self.all_attributes = deepcopy(parent.all_attributes)
-            if self.own_attributes:
-                self.all_attributes.update(self.own_attributes)
+            # Create a new scope on top of the parent's context, so the
+            # original state is restored on pull
+            self.all_attributes = ContextFrame(
+                parent.all_attributes, self.own_attributes
+            )
         else:
             # We only reference the parent context instance, so change will persist
             # after a popping from this stack
@@ -165,12 +345,26 @@ class ContextStack:
         """Return the current aggregated context."""
         return self.context
 
+    def branch(self):
+        """Return a new stack with the same path and an isolated scope on top.
+
+        Used to run activities concurrently: writes to the branch's context
+        are not visible in this stack (see :meth:`ContextFrame.own_items`).
+        """
+        top = self.peek()
+        res = ContextStack()
+        res.ctx_stack = self.ctx_stack[:-1]
+        res._push(RunContext(top, top.name, copy_data=True))
+        return res
+
     def get_attr(self, key_path, context=None):
         check_arg(key_path, str)
         check_arg(context, RunContext, or_none=True)
         if context is None:
             context = self.peek()
-        return get_dict_attr(self.as_dict(), key_path)
+        # Keys of parent frames are looked up in their cached flat dict, so
+        # nested scopes don't slow down lookups
+        return get_dict_attr(context.all_attributes, key_path)
 
     def set_last_part(self, name):
         self.ctx_stack[-1].name = name
@@ -3,15 +3,20 @@
 """
 https://w3c.github.io/web-performance/specs/HAR/Overview.html
 """
+import glob
+import hashlib
+import io
 import json
 import logging
 import os
 import re
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from operator import itemgetter
 from pprint import pformat
 from urllib.parse import urlparse
 
+from stressor.convert.har_stream import SortedSpool, iter_har_entries
 from stressor.util import (
     base_url,
     datetime_to_iso,
@@ -49,6 +54,13 @@ class HarConverter:
             # "text/html",
         ),
         "skip_errors": True,
+        # Parse incrementally and sort with bounded memory (None: automatic, for
+        # files larger than `stream_min_size` bytes)
+        "streaming": None,
+        "stream_min_size": 100 * 1024 * 1024,
+        "sort_run_size": 100_000,  # Entries per sorted run on disk
+        # Worker processes for batch imports (None: number of CPUs)
+        "max_workers": None,
     }
 
     def __init__(self, opts):
@@ -66,6 +78,10 @@ class HarConverter:
         self.opts.update(opts)
         #: (str) Available after `self._parse()`
         self.base_url = None
+        #: (SortedSpool) Used instead of a list when streaming
+        self._spool = None
+        #: (list[dict]) One entry per HAR file in batch mode
+        self.journeys = []
         self.polling_requests = []
         self.static_resources = []
         pl = []
@@ -81,29 +97,188 @@ class HarConverter:
 
         if har_path is not None:
             har_path = os.path.abspath(har_path)
-            if not os.path.isfile(har_path):
-                raise FileNotFoundError(har_path)
-
-            logger.info(f"Parsing {har_path}...")
-            self._parse(har_path)
+            har_paths = self._find_har_files(har_path)
+            if har_paths:
+                self._parse_batch(har_paths)
+            else:
+                logger.info(f"Parsing {har_path}...")
+                self._parse(har_path)
 
             self._postprocess()
 
+        try:
+            self._write_files(har_path, target_folder)
+        finally:
+            if self._spool is not None:
+                self._spool.close()
+        return True
+
+    def iter_entries(self, fspec):
+        """Parse a HAR file and yield the request entries sorted by start time.
+
+        Entries are dicts with keys `start` (timestamp), `method`, `url`, and
+        `elap`, and optional keys like `data`, `headers`, and `cookies` (the
+        latter are lists of `(name, value)` tuples).
+        Large files are parsed incrementally (see `opts.streaming`). The
+        counters, e.g. `prefix_counter`, are complete when the first entry is
+        yielded.
+        """
+        self._parse(fspec)
+        try:
+            yield from self.entries
+        finally:
+            if self._spool is not None:
+                self._spool.close()
+
+    @staticmethod
+    def _get_default_target(har_path):
+        """Return a folder name in the current directory, derived from `har_path`.
+
+        A folder or glob pattern (e.g. 'recordings/*.har') uses the name of the
+        (first non-pattern) folder, and a '_scenario' suffix if the target
+        would be the source folder itself.
+        """
+        if os.path.isfile(har_path):
+            name = os.path.splitext(os.path.basename(har_path))[0].strip(".")
+            return os.path.abspath(f"./{name}")
+        folder = har_path
+        while glob.has_magic(folder):
+            folder = os.path.dirname(folder)
+        folder = os.path.abspath(folder)
+        name = os.path.basename(folder) or "scenario"
+        target_folder = os.path.abspath(f"./{name}")
+        if target_folder == folder:
+            target_folder += "_scenario"
+        return target_folder
+
+    def _write_files(self, har_path, target_folder):
         if target_folder is None:
             assert har_path
-            name = os.path.splitext(os.path.basename(har_path))[0].strip(".")
-            target_folder = f"./{name}"
+            target_folder = self._get_default_target(har_path)
         target_folder = os.path.abspath(target_folder)
         if not os.path.isdir(target_folder):
             logger.info(f"Creating folder {target_folder}...")
             os.mkdir(target_folder)
 
+        if self.journeys:
+            sequence_files = self._group_journeys()
+
         self._init_from_templates(target_folder)
 
-        if har_path is not None:
+        if self.journeys:
+            for file_name, journeys in sequence_files.items():
+                self._write_sequence(
+                    os.path.join(target_folder, file_name),
+                    entries=journeys[0]["entries"],
+                    sources=[j["path"] for j in journeys],
+                )
+        elif har_path is not None:
             fspec = os.path.join(target_folder, "main_sequence.yaml")
             self._write_sequence(fspec)
-        return True
+
+    @staticmethod
+    def _find_har_files(fspec):
+        """Return a list of HAR files for a folder or glob pattern.
+
+        Returns None if `fspec` is a single file.
+        """
+        if os.path.isfile(fspec):
+            return None
+        if os.path.isdir(fspec):
+            res = sorted(glob.glob(os.path.join(fspec, "*.har")))
+        elif glob.has_magic(fspec):
+            res = sorted(p for p in glob.glob(fspec) if os.path.isfile(p))
+        else:
+            res = []
+        if not res:
+            raise FileNotFoundError(fspec)
+        return res
+
+    @staticmethod
+    def _get_sequence_name(path, used):
+        """Derive a unique sequence name from a HAR file name."""
+        name = os.path.splitext(os.path.basename(path))[0]
+        name = re.sub(r"\W+", "_", name).strip("_") or "journey"
+        if not is_yaml_keyword(name):
+            name = f"seq_{name}"
+        res = name
+        i = 1
+        while res in used:
+            i += 1
+            res = f"{name}_{i}"
+        used.add(res)
+        return res
+
+    def _parse_batch(self, har_paths):
+        """Parse multiple HAR files (in parallel) into `self.journeys`.
+
+        URL prefixes are counted over all files, so a common `base_url` is
+        used. Entries that have no response type inherit the type that was
+        recorded for the same URL in another file, so static resources are
+        classified consistently.
+        """
+        opts_list = [dict(self.opts, fspec=path) for path in har_paths]
+        max_workers = self.opts["max_workers"]
+        logger.info(f"Parsing {len(har_paths)} HAR files...")
+        if len(har_paths) == 1 or max_workers == 1:
+            results = list(map(_parse_har_file, opts_list))
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                results = list(pool.map(_parse_har_file, opts_list))
+
+        used_names = {"init", "end"}
+        resp_types = {}
+        for res in results:
+            self.prefix_counter.update(res["prefix_counter"])
+            if self.har_version is None:
+                self.har_version = res["har_version"]
+                self.creator_info = res["creator_info"]
+                self.browser_info = res["browser_info"]
+            if res["first_entry_dt"] and (
+                not self.first_entry_dt or res["first_entry_dt"] < self.first_entry_dt
+            ):
+                self.first_entry_dt = res["first_entry_dt"]
+            for entry in res["entries"]:
+                if entry.get("resp_type"):
+                    resp_types.setdefault(entry["url"], entry["resp_type"])
+            self.journeys.append(
+                {
+                    "name": self._get_sequence_name(res["path"], used_names),
+                    "path": res["path"],
+                    "entries": res["entries"],
+                }
+            )
+
+        for journey in self.journeys:
+            for entry in journey["entries"]:
+                if not entry.get("resp_type") and entry["url"] in resp_types:
+                    entry["resp_type"] = resp_types[entry["url"]]
+                    self.stats["merged_resp_types"] += 1
+        return
+
+    def _group_journeys(self):
+        """Assign sequence files to journeys, sharing files for identical chains.
+
+        Returns:
+            dict: `{file_name: [journey, ...]}`
+        """
+        res = {}
+        file_by_digest = {}
+        for journey in self.journeys:
+            fp = io.StringIO()
+            for entry in journey["entries"]:
+                self._write_entry(fp, entry)
+            digest = hashlib.sha256(fp.getvalue().encode()).hexdigest()
+            file_name = file_by_digest.get(digest)
+            if file_name is None:
+                file_name = file_by_digest[digest] = f"{journey['name']}_sequence.yaml"
+                res[file_name] = []
+            else:
+                self.stats["shared_sequences"] += 1
+                logger.info(f"{journey['name']}: re-using identical {file_name}")
+            journey["file"] = file_name
+            res[file_name].append(journey)
+        return res
 
     def _copy_template(self, tmpl_name, target_path, kwargs):
         if not self.opts["force"] and os.path.isfile(target_path):
@@ -126,19 +301,33 @@ class HarConverter:
             "tag": "TAG",
             "base_url": self.base_url,
             "details": "",
+            "scenario_entries": "  - sequence: main\n    duration: 10\n    # repeat: 3",
+            "sequence_entries": "  main: $load(main_sequence.yaml)",
         }
+        if self.journeys:
+            ctx["scenario_entries"] = "\n".join(
+                f"  - sequence: {j['name']}" for j in self.journeys
+            )
+            ctx["sequence_entries"] = "\n".join(
+                f"  {j['name']}: $load({j['file']})" for j in self.journeys
+            )
         self._copy_template(
             "users.yaml.tmpl", os.path.join(target_folder, "users.yaml"), ctx
         )
-        self._copy_template(
-            "sequence.yaml.tmpl", os.path.join(target_folder, "main_sequence.yaml"), ctx
-        )
+        if not self.journeys:
+            self._copy_template(
+                "sequence.yaml.tmpl",
+                os.path.join(target_folder, "main_sequence.yaml"),
+                ctx,
+            )
         self._copy_template(
             "scenario.yaml.tmpl", os.path.join(target_folder, "scenario.yaml"), ctx
         )
 
     def _is_static(self, entry):
-        mime_type = entry["resp_type"]
+        mime_type = entry.get("resp_type")
+        if not mime_type:
+            return False
         for pattern in self.opts["statics_types"]:
             if pattern.match(mime_type):
                 return True
@@ -221,12 +410,7 @@ class HarConverter:
 
         self.entries.append(entry)
 
-    def _parse(self, fspec):
-        with open(fspec, encoding=self.encoding) as fp:
-            har_data = json.load(fp)
-        log = har_data["log"]
-        assert len(har_data.keys()) == 1
-
+    def _set_log_info(self, log):
         self.har_version = log["version"]
 
         creator = log["creator"]
@@ -239,6 +423,21 @@ class HarConverter:
         for page in log.get("pages", EMPTY_TUPLE):
             self.page_map[page["id"]] = page
 
+    def _parse(self, fspec):
+        streaming = self.opts["streaming"]
+        if streaming is None:
+            streaming = os.path.getsize(fspec) >= self.opts["stream_min_size"]
+        if streaming:
+            self._parse_stream(fspec)
+            return
+
+        with open(fspec, encoding=self.encoding) as fp:
+            har_data = json.load(fp)
+        log = har_data["log"]
+        assert len(har_data.keys()) == 1
+
+        self._set_log_info(log)
+
         for entry in log["entries"]:
             self._add_entry(entry)
 
@@ -250,7 +449,33 @@ class HarConverter:
         # print("HAR:\n{}".format(pformat(self.entries)))
         return
 
+    def _parse_stream(self, fspec):
+        """Like `_parse()`, but read entries incrementally.
+
+        Response bodies and other unused fields are skipped unparsed, and
+        entries are sorted by an external merge sort. `self.entries` is a
+        :class:`~stressor.convert.har_stream.SortedSpool` afterwards.
+        """
+        logger.info("Using streaming parser.")
+        self.entries = self._spool = SortedSpool(
+            key=itemgetter("start"), run_size=self.opts["sort_run_size"]
+        )
+        log_info = {}
+        with open(fspec, encoding=self.encoding) as fp:
+            for har_entry in iter_har_entries(fp, log_info):
+                self._add_entry(har_entry)
+        self._set_log_info(log_info)
+        logger.info(
+            f"Read {len(self.entries):,} entries ({self._spool.run_count} sorted runs)."
+        )
+        return
+
     def _postprocess(self):
+        """Remove unwanted entries, strip base URLs, and collate requests.
+
+        When streaming, `self.entries` becomes an iterator, so entries are
+        processed while the sequence is written.
+        """
         # Figure out base_url
         base_url = self.opts.get("base_url")
         if base_url is True:
@@ -261,8 +486,27 @@ class HarConverter:
         logger.info(f"Using base_url {base_url!r}.")
         # print(base_url)
 
+        if self.journeys:
+            self.entries = []
+            for journey in self.journeys:
+                journey["entries"] = list(self._iter_postprocessed(journey["entries"]))
+                if not journey["entries"]:
+                    logger.warning(
+                        f"{journey['path']}: no entries left "
+                        f"(base URL {base_url!r} not used?)"
+                    )
+                self.entries.extend(journey["entries"])
+            return
+
+        entries = self._iter_postprocessed(self.entries)
+        if self._spool is None:
+            entries = list(entries)
+        self.entries = entries
+        return
+
+    def _iter_postprocessed(self, entries):
+        base_url = self.base_url
         # Remove unwanted entries and strip base_url where possible
-        el = []
         skip_ext = self.opts["skip_externals"]
         collate_max_len = self.opts["collate_max_len"]
         collate_max_duration = self.opts["collate_max_duration"]
@@ -270,11 +514,13 @@ class HarConverter:
         bucket = []
         bucket_start_stamp = 0
         bucket_last_stamp = 0
+        # The first entry of a bucket is held back until the bucket is complete
+        pending = None
 
         def _flush():
-            nonlocal bucket, bucket_start_stamp, bucket_last_stamp
+            nonlocal bucket, bucket_start_stamp, bucket_last_stamp, pending
             if not bucket:
-                return
+                return None
             self.stats["collated_activities"] += 1
             entry = bucket[0]
             entry["url_list"] = [e["url"] for e in bucket]
@@ -282,8 +528,10 @@ class HarConverter:
             bucket = []
             bucket_start_stamp = 0
             bucket_last_stamp = 0
+            res, pending = pending, None
+            return res
 
-        for entry in self.entries:
+        for entry in entries:
             self.stats["entries_total"] += 1
             skip = False
 
@@ -304,8 +552,11 @@ class HarConverter:
             # Collate bursts of simple GET request to one single entry
             start = entry["start"]
             if len(bucket) >= collate_max_len:
-                _flush()
+                flushed = _flush()
+                if flushed:
+                    yield flushed
             first = len(bucket) == 0
+            starts_bucket = False
 
             if (
                 collate_max_len > 1  # Collation enabled
@@ -318,6 +569,7 @@ class HarConverter:
             ):
                 self.stats["collated_urls"] += 1
                 bucket.append(entry)
+                starts_bucket = len(bucket) == 1
                 if not bucket_start_stamp:
                     bucket_start_stamp = start
                 bucket_last_stamp = start
@@ -326,17 +578,22 @@ class HarConverter:
                     skip = True
             elif bucket:
                 # If a burst of simple requests is interrupted, flush and restart
-                _flush()
+                flushed = _flush()
+                if flushed:
+                    yield flushed
 
             if skip:
                 self.stats["skipped"] += 1
             else:
                 self.stats["entries"] += 1
-                el.append(entry)
+                if starts_bucket:
+                    pending = entry
+                else:
+                    yield entry
 
-        _flush()
-        self.entries = el
-        return
+        flushed = _flush()
+        if flushed:
+            yield flushed
 
     activity_map = {
         "GET": "GetRequest",
@@ -441,14 +698,18 @@ class HarConverter:
         lines.append("\n")
         fp.writelines(lines)
 
-    def _write_sequence(self, fspec):
+    def _write_sequence(self, fspec, entries=None, sources=None):
+        if entries is None:
+            entries = self.entries
+        if sources is None:
+            sources = [self.opts["fspec"]]
         logger.info(f"Writing activity sequence to {fspec!r}...")
         with open(fspec, "w") as fp:
             fp.write("# Stressor Activity Definitions\n")
             fp.write("# See https://stressor.readthedocs.io/\n")
             fp.write(f"# Auto-generated {datetime_to_iso()}\n")
             fp.write("# Source:\n")
-            fp.write("#     File: {}\n".format(self.opts["fspec"]))
+            fp.writelines(f"#     File: {source}\n" for source in sources)
             fp.write(f"#     HAR Version: {self.har_version}\n")
             fp.write(f"#     Creator: {self.creator_info}\n")
             if self.browser_info:
@@ -457,7 +718,27 @@ class HarConverter:
             fp.write(f"#     Using base URL {self.base_url!r}\n")
             fp.write("\n")
 
-            for entry in self.entries:
+            for entry in entries:
                 self._write_entry(fp, entry)
         logger.info("Done.")
         return
+
+
+def _parse_har_file(opts):
+    """Parse one HAR file (called in worker processes by batch imports)."""
+    conv = HarConverter(opts)
+    conv._parse(opts["fspec"])
+    try:
+        entries = list(conv.entries)
+    finally:
+        if conv._spool is not None:
+            conv._spool.close()
+    return {
+        "path": opts["fspec"],
+        "har_version": conv.har_version,
+        "creator_info": conv.creator_info,
+        "browser_info": conv.browser_info,
+        "first_entry_dt": conv.first_entry_dt,
+        "prefix_counter": conv.prefix_counter,
+        "entries": entries,
+    }
@@ -0,0 +1,278 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+Read huge HAR files incrementally and sort entries with bounded memory.
+"""
+import heapq
+import json
+import pickle
+import re
+import tempfile
+
+#: Fields of a HAR entry that are needed by the converter.
+#: `None` means 'decode the complete value', a dict defines the sub-fields that
+#: are decoded, all other fields (e.g. response bodies) are skipped unparsed.
+HAR_ENTRY_FIELDS = {
+    "startedDateTime": None,
+    "timings": None,
+    "request": None,
+    "response": {
+        "comment": None,
+        "content": {
+            "mimeType": None,
+            "size": None,
+        },
+    },
+}
+
+
+class JsonStream:
+    """Minimal pull parser that walks a JSON document read from a text stream.
+
+    Only the data of the current token is held in memory: small values are
+    decoded by the standard `json` module, while skipped values are scanned
+    chunk by chunk.
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    _WS_REX = re.compile(r"[ \t\n\r]*")
+    _SKIP_REX = re.compile(r'["\[\]{}]')
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Append the next chunk and drop consumed data; return False on EOF."""
+        if self.eof:
+            return False
+        # Grow the chunk size with the buffer, so decoding a large value
+        # needs a logarithmic number of retries
+        chunk = self.fp.read(max(self.CHUNK_SIZE, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def _error(self, msg):
+        snippet = self.buf[self.pos : self.pos + 40]
+        return ValueError(f"Invalid JSON: {msg} at {snippet!r}")
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at EOF)."""
+        while True:
+            self.pos = self._WS_REX.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch):
+        if self.peek() != ch:
+            raise self._error(f"expected {ch!r}")
+        self.pos += 1
+
+    def decode(self):
+        """Decode and return the next value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            # (e.g. '12' from '12.5')
+            if (
+                isinstance(value, (int, float))
+                and (end >= len(self.buf) or self.buf[end] in "0123456789.eE+-")
+                and self._fill()
+            ):
+                continue
+            self.pos = end
+            return value
+
+    def _skip_string_rest(self):
+        """Skip to the closing quote (`self.pos` is behind the opening quote)."""
+        while True:
+            buf = self.buf
+            idx = buf.find('"', self.pos)
+            if idx < 0:
+                # Keep trailing backslashes, they may escape the next character
+                seg = buf[self.pos :]
+                self.pos = len(buf) - (len(seg) - len(seg.rstrip("\\")))
+                if not self._fill():
+                    raise self._error("unterminated string")
+                continue
+            backslashes = 0
+            while idx - backslashes > self.pos and buf[idx - backslashes - 1] == "\\":
+                backslashes += 1
+            self.pos = idx + 1
+            if backslashes % 2 == 0:
+                return
+
+    def skip(self):
+        """Skip the next value without decoding it."""
+        if self.peek() not in '"[{':
+            self.decode()  # number, true, false, null
+            return
+        depth = 0
+        while True:
+            m = self._SKIP_REX.search(self.buf, self.pos)
+            if not m:
+                self.pos = len(self.buf)
+                if not self._fill():
+                    raise self._error("unexpected end of data")
+                continue
+            ch = m.group()
+            self.pos = m.end()
+            if ch == '"':
+                self._skip_string_rest()
+            elif ch in "[{":
+                depth += 1
+            else:
+                depth -= 1
+            if depth == 0:
+                return
+
+    def iter_object(self):
+        """Yield the keys of the next object.
+
+        The caller must consume the value (e.g. by :meth:`decode` or
+        :meth:`skip`) before the next key is requested.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.decode()
+            self.expect(":")
+            yield key
+            ch = self.peek()
+            self.pos += 1
+            if ch == "}":
+                return
+            elif ch != ",":
+                self.pos -= 1
+                raise self._error("expected ',' or '}'")
+
+    def iter_array(self):
+        """Yield once per element of the next array (see :meth:`iter_object`)."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            ch = self.peek()
+            self.pos += 1
+            if ch == "]":
+                return
+            elif ch != ",":
+                self.pos -= 1
+                raise self._error("expected ',' or ']'")
+
+    def decode_fields(self, fields):
+        """Decode the next value, but only the fields defined by `fields`.
+
+        See :data:`HAR_ENTRY_FIELDS`.
+        """
+        if fields is None or self.peek() != "{":
+            return self.decode()
+        res = {}
+        for key in self.iter_object():
+            if key in fields:
+                res[key] = self.decode_fields(fields[key])
+            else:
+                self.skip()
+        return res
+
+
+def iter_har_entries(fp, log_info):
+    """Yield the entries of a HAR file one by one.
+
+    Only fields that are listed in :data:`HAR_ENTRY_FIELDS` are decoded.
+    All other members of the `log` object (e.g. 'version', 'creator', 'pages')
+    are stored in the `log_info` dict. Note that HAR files may define them
+    after the entries list.
+    """
+    js = JsonStream(fp)
+    for key in js.iter_object():
+        if key != "log":
+            js.skip()
+            continue
+        for log_key in js.iter_object():
+            if log_key == "entries":
+                for _ in js.iter_array():
+                    yield js.decode_fields(HAR_ENTRY_FIELDS)
+            else:
+                log_info[log_key] = js.decode()
+
+
+class SortedSpool:
+    """List-like container that is iterated in sort order (external merge sort).
+
+    Items are collected in memory until `run_size` is reached. Then the batch
+    is sorted and written to a temporary file. Iteration merges all sorted
+    runs, so only one item per run is held in memory.
+    The sort is stable, like `list.sort()`.
+    """
+
+    def __init__(self, key, run_size=100_000):
+        self.key = key
+        self.run_size = run_size
+        self._buffer = []
+        self._runs = []
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, item):
+        self._buffer.append(item)
+        self._count += 1
+        if len(self._buffer) >= self.run_size:
+            self._spill()
+
+    def _spill(self):
+        self._buffer.sort(key=self.key)
+        fp = tempfile.TemporaryFile()  # noqa: SIM115
+        for item in self._buffer:
+            pickle.dump(item, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        self._runs.append(fp)
+        self._buffer = []
+
+    @staticmethod
+    def _iter_run(fp):
+        fp.seek(0)
+        while True:
+            try:
+                yield pickle.load(fp)
+            except EOFError:
+                return
+
+    def __iter__(self):
+        self._buffer.sort(key=self.key)
+        if not self._runs:
+            return iter(self._buffer)
+        runs = [self._iter_run(fp) for fp in self._runs]
+        return heapq.merge(*runs, self._buffer, key=self.key)
+
+    @property
+    def run_count(self):
+        return len(self._runs)
+
+    def close(self):
+        for fp in self._runs:
+            fp.close()
+        self._runs = []
+        self._buffer = []
+        self._count = 0
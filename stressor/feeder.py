@@ -0,0 +1,294 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+Stream per-iteration test data from CSV or JSONL files.
+"""
+import csv
+import json
+import os
+import random
+import threading
+from array import array
+
+from stressor.util import StressorError, check_arg, logger
+
+
+class FeederExhaustedError(StressorError):
+    """Raised when a non-circular feeder has no more rows."""
+
+
+class _Cursor:
+    """Read lines from a byte range of a file (thread-safe).
+
+    The file is opened in binary mode with a large read buffer. Lines that
+    *start* inside ``[start, end)`` belong to this cursor.
+    """
+
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self, path, start, end, circular):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.circular = circular
+        self.lock = threading.Lock()
+        self.fp = None
+        self.pos = None
+
+    def _rewind(self):
+        if self.fp is None:
+            self.fp = open(self.path, "rb", buffering=self.BUFFER_SIZE)  # noqa: SIM115
+        pos = self.start
+        if pos > 0:
+            # Skip to the beginning of the next line, unless we are already
+            # at a line start
+            self.fp.seek(pos - 1)
+            pos = pos - 1 + len(self.fp.readline())
+        else:
+            self.fp.seek(0)
+        self.pos = pos
+
+    def read_line(self):
+        """Return the next non-empty line (bytes) or None if exhausted."""
+        with self.lock:
+            if self.pos is None:
+                self._rewind()
+            wrapped = False
+            while True:
+                line = b"" if self.pos >= self.end else self.fp.readline()
+                if not line:
+                    if not self.circular or wrapped:
+                        return None
+                    wrapped = True
+                    self._rewind()
+                    continue
+                self.pos += len(line)
+                line = line.strip()
+                if line:
+                    return line
+
+    def close(self):
+        with self.lock:
+            if self.fp:
+                self.fp.close()
+                self.fp = None
+
+
+class Feeder:
+    """
+    Stream rows from a CSV or JSONL file, one row per sequence iteration.
+
+    Rows are read on demand, so huge files cost (almost) no memory.
+    Every row must be on a single line (i.e. CSV values must not contain
+    line breaks). CSV files must have a header line with column names.
+
+    Modes:
+
+    sequential
+        All sessions share one cursor, so every row is used exactly once.
+        The session stops when the file is exhausted.
+    circular
+        Like 'sequential', but restart at the top when the file is exhausted.
+    partition
+        The file is split into byte ranges, one per session slot, so sessions
+        use distinct rows without sharing a cursor.
+    random
+        Pick a random row for every iteration. All rows have the same chance.
+        The line offsets are indexed on first use (8 bytes per row).
+        The choice is reproducible if a `random_seed` is passed (as far as the
+        order of concurrent sessions allows).
+
+    Example::
+
+        feeders:
+          products:
+            path: products.csv
+            mode: circular  # (default: 'sequential')
+            sequences: [main]  # (default: all sequences)
+
+    Rows are then available as context variables, e.g. ``$(feed.products.sku)``.
+    """
+
+    MODES = ("sequential", "circular", "partition", "random")
+    FORMATS = ("csv", "jsonl")
+    KNOWN_ARGS = frozenset(("path", "mode", "format", "encoding", "sequences"))
+
+    def __init__(
+        self,
+        name,
+        path,
+        *,
+        mode="sequential",
+        format=None,
+        encoding="utf-8",
+        sequences=None,
+        partitions=1,
+        random_seed=None,
+    ):
+        check_arg(name, str)
+        check_arg(path, str)
+        check_arg(mode, str, mode in self.MODES)
+        check_arg(sequences, (list, tuple), or_none=True)
+        check_arg(partitions, int, partitions > 0)
+        if format is None:
+            format = os.path.splitext(path)[1].lstrip(".").lower()
+            format = "jsonl" if format in ("json", "ndjson") else format
+        check_arg(format, str, format in self.FORMATS)
+
+        self.name = name
+        self.path = path
+        self.mode = mode
+        self.format = format
+        self.encoding = encoding
+        #: (set) Names of sequences that receive rows (None: all)
+        self.sequences = set(sequences) if sequences else None
+        self.partitions = partitions
+        self.fieldnames = None
+        self._data_start = 0
+        self._size = os.path.getsize(path)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._random_fps = []
+        #: (array) Offsets of the non-empty lines (mode 'random', built on demand)
+        self._line_index = None
+        self._rng = random.Random(
+            None if random_seed is None else f"{random_seed}:{name}"
+        )
+
+        if self.format == "csv":
+            with open(path, "rb") as fp:
+                header = fp.readline()
+            self._data_start = len(header)
+            self.fieldnames = next(csv.reader([header.decode(encoding)]))
+
+        start = self._data_start
+        if mode == "partition":
+            chunk = (self._size - start) / partitions
+            self._cursors = [
+                _Cursor(
+                    path,
+                    start + int(i * chunk),
+                    start + int((i + 1) * chunk) if i < partitions - 1 else self._size,
+                    circular=False,
+                )
+                for i in range(partitions)
+            ]
+        elif mode in ("sequential", "circular"):
+            self._cursors = [
+                _Cursor(path, start, self._size, circular=mode == "circular")
+            ]
+        else:
+            self._cursors = []
+
+    def __str__(self):
+        return f"Feeder<{self.name}, {self.mode}, {self.path!r}>"
+
+    @classmethod
+    def check_options(cls, name, opts):
+        """Validate a feeder definition from the configuration.
+
+        Raises:
+            ValueError
+        """
+        if not isinstance(opts, dict) or not opts.get("path"):
+            raise ValueError(f"feeder '{name}' must be a dict with a `path`")
+        extra = set(opts.keys()).difference(cls.KNOWN_ARGS)
+        if extra:
+            raise ValueError(f"feeder '{name}': unsupported {extra}")
+        if opts.get("mode", "sequential") not in cls.MODES:
+            raise ValueError(f"feeder '{name}': `mode` must be one of {cls.MODES}")
+        if opts.get("format", "csv") not in cls.FORMATS:
+            raise ValueError(f"feeder '{name}': `format` must be one of {cls.FORMATS}")
+
+    def _parse(self, line):
+        text = line.decode(self.encoding)
+        if self.format == "jsonl":
+            return json.loads(text)
+        return dict(zip(self.fieldnames, next(csv.reader([text]))))
+
+    def _read_line(self, session_index):
+        if self.mode == "random":
+            line = self._read_random_line()
+        else:
+            cursor = self._cursors[session_index % len(self._cursors)]
+            line = cursor.read_line()
+        if line is None:
+            raise FeederExhaustedError(f"{self} has no more rows")
+        return line
+
+    def _get_line_index(self):
+        with self._lock:
+            if self._line_index is None:
+                index = array("q")
+                pos = self._data_start
+                with open(self.path, "rb", buffering=_Cursor.BUFFER_SIZE) as fp:
+                    fp.seek(pos)
+                    for line in fp:
+                        if line.strip():
+                            index.append(pos)
+                        pos += len(line)
+                self._line_index = index
+            return self._line_index
+
+    def _read_random_line(self):
+        try:
+            fp = self._local.fp
+        except AttributeError:
+            fp = open(self.path, "rb", buffering=_Cursor.BUFFER_SIZE)  # noqa: SIM115
+            self._local.fp = fp
+            with self._lock:
+                self._random_fps.append(fp)
+        index = self._get_line_index()
+        if not index:
+            return None
+        with self._lock:
+            pos = index[self._rng.randrange(len(index))]
+        fp.seek(pos)
+        return fp.readline().strip()
+
+    def next_row(self, session_index=0):
+        """Return the next row (dict for CSV, any JSON value for JSONL).
+
+        Args:
+            session_index (int): used to select the partition
+        Raises:
+            FeederExhaustedError
+        """
+        return self._parse(self._read_line(session_index))
+
+    def next_values(self, session_index=0):
+        """Return the next CSV row as list of values (see :meth:`next_row`)."""
+        assert self.format == "csv"
+        text = self._read_line(session_index).decode(self.encoding)
+        return next(csv.reader([text]))
+
+    def wants_sequence(self, seq_name):
+        return self.sequences is None or seq_name in self.sequences
+
+    def close(self):
+        for cursor in self._cursors:
+            cursor.close()
+        with self._lock:
+            for fp in self._random_fps:
+                fp.close()
+            self._random_fps = []
+
+
+def create_feeders(config_manager, partitions):
+    """Return a dict of :class:`Feeder` instances for the `feeders` section."""
+    res = {}
+    for name, opts in (config_manager.config_all.get("feeders") or {}).items():
+        path = config_manager.resolve_path(opts["path"])
+        feeder = Feeder(
+            name,
+            path,
+            mode=opts.get("mode", "sequential"),
+            format=opts.get("format"),
+            encoding=opts.get("encoding", "utf-8"),
+            sequences=opts.get("sequences"),
+            partitions=partitions,
+            random_seed=config_manager.config.get("random_seed"),
+        )
+        logger.info(f"Opened {feeder}")
+        res[name] = feeder
+    return res
@@ -0,0 +1,179 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+Emulate a browser's HTTP cache for static resources.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+from stressor.util import check_arg
+
+_CACHE_CONTROL_REX = re.compile(r"\s*([\w-]+)\s*(?:=\s*\"?([^\",]*)\"?)?\s*(?:,|$)")
+
+
+def parse_cache_control(value):
+    """Return a dict of `Cache-Control` directives (lower case names).
+
+    Example: 'public, max-age=60' -> `{'public': None, 'max-age': '60'}`
+    """
+    res = {}
+    for name, arg in _CACHE_CONTROL_REX.findall(value or ""):
+        res[name.lower()] = arg or None
+    return res
+
+
+def _parse_http_date(value):
+    """Return a POSIX timestamp for a HTTP date header, or None."""
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+class HttpCache:
+    """
+    A per-session model of a browser cache (thread-safe).
+
+    Response bodies are *not* stored, since activities that use the cache
+    (e.g. :class:`~stressor.plugins.http_activities.StaticRequestsActivity`)
+    discard them anyway. Only the size is recorded for LRU eviction.
+
+    Freshness is computed from `Cache-Control: max-age` (or `Expires`), or
+    heuristically as 10% of the time since `Last-Modified`.
+    Stale entries are revalidated with `If-None-Match` / `If-Modified-Since`
+    conditional requests.
+    """
+
+    #: Max. size in MB that is used for `sessions.http_cache: true`
+    DEFAULT_SIZE_MB = 50
+    #: Fraction of the 'Last-Modified' age that is used as heuristic lifetime
+    HEURISTIC_FRACTION = 0.1
+
+    def __init__(self, max_size):
+        check_arg(max_size, int, max_size > 0)
+        #: (int) Max. total size of cached responses in bytes
+        self.max_size = max_size
+        #: (int) Current total size of cached responses in bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"HttpCache<{len(self._entries)} entries, {self.size:,} bytes>"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, url, now=None):
+        """Return `(is_fresh, conditional_headers)` for a URL.
+
+        `is_fresh` is True if the response may be served from the cache
+        without a request. Otherwise `conditional_headers` contains the
+        validators of a cached entry (may be empty).
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return False, {}
+            self._entries.move_to_end(url)
+            if entry["expires"] > now:
+                return True, {}
+            headers = {}
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+            return False, headers
+
+    def _get_expires(self, headers, now):
+        cc = parse_cache_control(headers.get("Cache-Control"))
+        if "no-store" in cc:
+            return None
+        if "no-cache" in cc:
+            return 0
+        # Note: a private cache uses `max-age` and ignores `s-maxage`
+        if "max-age" in cc:
+            try:
+                return now + max(0, int(cc["max-age"]))
+            except (TypeError, ValueError):
+                return 0
+        date = _parse_http_date(headers.get("Date")) or now
+        expires = _parse_http_date(headers.get("Expires"))
+        if headers.get("Expires"):
+            return now + (expires - date) if expires else 0
+        last_modified = _parse_http_date(headers.get("Last-Modified"))
+        if last_modified and last_modified < date:
+            return now + self.HEURISTIC_FRACTION * (date - last_modified)
+        return 0
+
+    def store(self, url, response, now=None):
+        """Update the cache from a response (2xx or 304).
+
+        Returns:
+            (bool) True if the URL is cached afterwards
+        """
+        now = time.time() if now is None else now
+        headers = response.headers
+        with self._lock:
+            entry = self._entries.get(url)
+            if response.status_code == 304:
+                if entry is None:
+                    return False
+                # Revalidated: update freshness (and validators, if sent)
+                expires = self._get_expires(headers, now)
+                if expires is None:
+                    self._remove(url)
+                    return False
+                entry["expires"] = expires
+                entry["etag"] = headers.get("ETag") or entry["etag"]
+                entry["last_modified"] = (
+                    headers.get("Last-Modified") or entry["last_modified"]
+                )
+                self._entries.move_to_end(url)
+                return True
+
+            expires = self._get_expires(headers, now)
+            etag = headers.get("ETag")
+            last_modified = headers.get("Last-Modified")
+            if (
+                expires is None
+                or not (200 <= response.status_code < 300)
+                or (not expires > now and not etag and not last_modified)
+            ):
+                # Not cacheable or not useful (neither fresh nor validatable)
+                self._remove(url)
+                return False
+
+            size = len(response.content or b"")
+            if size > self.max_size:
+                self._remove(url)
+                return False
+            self._remove(url)
+            self._entries[url] = {
+                "expires": expires,
+                "etag": etag,
+                "last_modified": last_modified,
+                "size": size,
+            }
+            self.size += size
+            # Evict least recently used entries
+            while self.size > self.max_size:
+                _, old = self._entries.popitem(last=False)
+                self.size -= old["size"]
+            return True
+
+    def _remove(self, url):
+        entry = self._entries.pop(url, None)
+        if entry:
+            self.size -= entry["size"]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
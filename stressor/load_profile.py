@@ -0,0 +1,331 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+Vary the number of concurrent sessions over time.
+"""
+import math
+
+
+class LoadProfile:
+    """
+    A piecewise linear curve that defines the number of concurrent sessions
+    over time.
+
+    The curve is defined as list of stages. Every stage moves from the
+    previous level (0 for the first stage) to its `target` session count
+    within `ramp` seconds, and then holds this level until `duration` seconds
+    have passed.
+
+    Example::
+
+        sessions:
+          load_profile:
+            - name: ramp_up  # Linear ramp to 500 sessions over 5 minutes
+              target: 500
+              duration: 300
+            - name: plateau  # Hold for 30 minutes
+              target: 500
+              duration: 1800
+            - name: spike  # Jump to 1500 sessions for one minute
+              target: 1500
+              duration: 60
+              ramp: 0
+            - name: ramp_down
+              target: 0
+              duration: 120
+
+    Args:
+        stage_defs (list[dict]):
+            list of stage definitions with keys `duration`, `target`, and
+            optional `name` and `ramp`.
+    Raises:
+        TypeError: if the definition has an unexpected type
+        ValueError: if the definition is invalid
+    """
+
+    KNOWN_ARGS = frozenset(("name", "duration", "target", "ramp"))
+
+    def __init__(self, stage_defs):
+        if not isinstance(stage_defs, list):
+            raise TypeError("load_profile must be a list of stages")
+        if not stage_defs:
+            raise ValueError("load_profile must contain at least one stage")
+
+        #: (list[dict]) Normalized stage definitions
+        self.stages = []
+        #: (float) Total duration in seconds
+        self.duration = 0.0
+        #: (int) Maximum session count
+        self.max_target = 0
+
+        level = 0
+        names = set()
+        for idx, stage_def in enumerate(stage_defs, 1):
+            if not isinstance(stage_def, dict):
+                raise TypeError(f"load_profile stage #{idx} must be a dict")
+            extra = set(stage_def.keys()).difference(self.KNOWN_ARGS)
+            if extra:
+                raise ValueError(f"load_profile stage #{idx}: unsupported {extra}")
+            try:
+                duration = float(stage_def["duration"])
+                target = int(stage_def["target"])
+            except KeyError as e:
+                raise ValueError(f"load_profile stage #{idx}: missing {e}") from None
+            ramp = float(stage_def.get("ramp", duration))
+            name = str(stage_def.get("name", f"stage_{idx}"))
+
+            if duration <= 0 or target < 0 or not (0 <= ramp <= duration):
+                raise ValueError(
+                    f"load_profile stage #{idx}: expected `duration` > 0, "
+                    "`target` >= 0, and 0 <= `ramp` <= `duration`"
+                )
+            if name in names:
+                raise ValueError(f"load_profile stage #{idx}: duplicate name {name!r}")
+            names.add(name)
+
+            self.stages.append(
+                {
+                    "name": name,
+                    "start": self.duration,
+                    "duration": duration,
+                    "ramp": ramp,
+                    "start_level": level,
+                    "target": target,
+                }
+            )
+            self.duration += duration
+            self.max_target = max(self.max_target, target)
+            level = target
+
+    def __str__(self):
+        return "LoadProfile<{}>".format(
+            ", ".join("{name}: {target}".format(**s) for s in self.stages)
+        )
+
+    def get_target(self, elapsed):
+        """Return `(stage, session_count)` for a point in time.
+
+        Args:
+            elapsed (float): seconds since the start of the profile
+        Returns:
+            (dict, int) the current stage definition and target session count,
+            or `(None, 0)` if the profile has ended.
+        """
+        for stage in self.stages:
+            offset = elapsed - stage["start"]
+            if offset >= stage["duration"]:
+                continue
+            return stage, self._get_level(stage, offset)
+        return None, 0
+
+    @staticmethod
+    def _get_level(stage, offset):
+        """Return the session count `offset` seconds after the stage started."""
+        ramp = stage["ramp"]
+        if offset >= ramp:
+            return stage["target"]
+        start_level = stage["start_level"]
+        delta = stage["target"] - start_level
+        return round(start_level + delta * offset / ramp)
+
+
+class KneeFinder(LoadProfile):
+    """
+    Increase the number of sessions step by step, until a service level
+    objective (SLO) is violated, in order to find the saturation point
+    (the 'knee' of the latency curve).
+
+    After every step, latency percentiles of the net activity times and the
+    error rate (errors per activity) of this step are compared to the SLO.
+    On a violation, the last passing step is reported as saturation point and
+    the search stops (or backs off to the last passing level for one more
+    step, to verify that the system recovers).
+
+    Example::
+
+        sessions:
+          find_knee:
+            start: 10  # Sessions in the first step
+            step: 10  # Add 10 sessions per step...
+            step_duration: 60  # ...every 60 seconds
+            max_sessions: 500
+            ramp: 5  # (default: 0)
+            on_breach: back_off  # (default: 'stop')
+            slo:
+              p99: 0.5  # Seconds (also 'p50' and 'p95' are supported)
+              error_rate: 0.01
+
+    Args:
+        opts (dict): see example above
+        stats (StatisticManager): used to query the results of every step.
+            (May be None, when only the options are validated.)
+    Raises:
+        TypeError: if the definition has an unexpected type
+        ValueError: if the definition is invalid
+    """
+
+    KNOWN_ARGS = frozenset(
+        ("start", "step", "step_duration", "max_sessions", "ramp", "on_breach", "slo")
+    )
+    SLO_KEYS = frozenset(("p50", "p95", "p99", "error_rate"))
+
+    def __init__(self, opts, stats=None):
+        if not isinstance(opts, dict):
+            raise TypeError("find_knee must be a dict")
+        extra = set(opts.keys()).difference(self.KNOWN_ARGS)
+        if extra:
+            raise ValueError(f"find_knee: unsupported {extra}")
+        try:
+            self.step_duration = float(opts["step_duration"])
+            self.max_target = int(opts["max_sessions"])
+            slo = dict(opts["slo"])
+        except KeyError as e:
+            raise ValueError(f"find_knee: missing {e}") from None
+        self.start_target = int(opts.get("start", 1))
+        self.step = int(opts.get("step", self.start_target))
+        self.ramp = float(opts.get("ramp", 0))
+        self.on_breach = opts.get("on_breach", "stop")
+
+        if (
+            self.step_duration <= 0
+            or not (1 <= self.start_target <= self.max_target)
+            or self.step < 1
+            or not (0 <= self.ramp <= self.step_duration)
+        ):
+            raise ValueError(
+                "find_knee: expected `step_duration` > 0, 1 <= `start` <= "
+                "`max_sessions`, `step` >= 1, and 0 <= `ramp` <= `step_duration`"
+            )
+        if self.on_breach not in ("stop", "back_off"):
+            raise ValueError("find_knee: `on_breach` must be 'stop' or 'back_off'")
+        extra = set(slo.keys()).difference(self.SLO_KEYS)
+        if not slo or extra:
+            raise ValueError(f"find_knee: `slo` expects keys of {set(self.SLO_KEYS)}")
+
+        #: (dict) Maximum values for percentiles (seconds) and error rate
+        self.slo = {k: float(v) for k, v in slo.items()}
+        #: (StatisticManager)
+        self.stats = stats
+        #: (list[dict]) Stages that were added so far
+        self.stages = []
+        #: (float) Max. duration in seconds (the search may stop earlier)
+        self.duration = self.step_duration * (
+            2 + math.ceil((self.max_target - self.start_target) / self.step)
+        )
+        #: (dict) Result after the search has finished, see :meth:`get_result`
+        self.result = None
+        self._last_passed = None
+        self._breach = (None, None)
+        self._done = False
+        self._add_step(self.start_target)
+
+    def __str__(self):
+        return "KneeFinder<{} +{} ... {} sessions, {}>".format(
+            self.start_target,
+            self.step,
+            self.max_target,
+            ", ".join(f"{k} <= {v}" for k, v in self.slo.items()),
+        )
+
+    def _add_step(self, target, name=None):
+        prev = self.stages[-1] if self.stages else None
+        start = prev["start"] + prev["duration"] if prev else 0.0
+        self.stages.append(
+            {
+                "name": name or f"step_{len(self.stages) + 1}",
+                "start": start,
+                "duration": self.step_duration,
+                "ramp": self.ramp if prev else 0.0,
+                "start_level": prev["target"] if prev else 0,
+                "target": target,
+            }
+        )
+
+    def check_slo(self, info):
+        """Return a list of SLO violations for a step's results."""
+        violations = []
+        for key, limit in self.slo.items():
+            val = info.get(key)
+            if val is not None and val > limit:
+                violations.append(f"{key}: {val:.4g} > {limit:.4g}")
+        return violations
+
+    def _finish(self, breach_stage=None, violations=None):
+        self._done = True
+        passed = self._last_passed
+        self.result = {
+            "saturation_sessions": passed["target"] if passed else None,
+            "saturation_step": passed["name"] if passed else None,
+            "saturation_act_rate": passed["act_rate"] if passed else None,
+            "saturation_p99": passed["p99"] if passed else None,
+            "breach_step": breach_stage["name"] if breach_stage else None,
+            "breach_sessions": breach_stage["target"] if breach_stage else None,
+            "violations": violations or [],
+        }
+        if self.stats:
+            self.stats.stats["knee"] = self.result
+
+    def get_target(self, elapsed):
+        if self._done:
+            return None, 0
+        stage = self.stages[-1]
+        offset = elapsed - stage["start"]
+        if offset < stage["duration"]:
+            return stage, self._get_level(stage, offset)
+
+        # The current step is complete: evaluate its results
+        if stage.get("back_off"):
+            self._finish(*self._breach)
+            return None, 0
+
+        info = self.stats.get_load_stage_info(stage["name"])
+        violations = self.check_slo(info)
+        if violations:
+            self._breach = (stage, violations)
+            if self.on_breach == "back_off" and self._last_passed:
+                self._add_step(self._last_passed["target"], name="back_off")
+                self.stages[-1]["back_off"] = True
+                return self.get_target(elapsed)
+            self._finish(stage, violations)
+            return None, 0
+
+        self._last_passed = info
+        if stage["target"] >= self.max_target:
+            self._finish()
+            return None, 0
+        self._add_step(min(stage["target"] + self.step, self.max_target))
+        return self.get_target(elapsed)
+
+    def format_result(self):
+        """Return a text that describes the saturation point."""
+        res = self.result
+        if not res:
+            return "Search for the saturation point was not completed."
+        lines = []
+        if res["saturation_sessions"] is None:
+            lines.append("Saturation point: n.a. (the first step violated the SLO).")
+        else:
+            lines.append(
+                "Saturation point: {} sessions ({}, {:,.1f} activities/sec, "
+                "p99: {}).".format(
+                    res["saturation_sessions"],
+                    res["saturation_step"],
+                    res["saturation_act_rate"],
+                    (
+                        "n.a."
+                        if res["saturation_p99"] is None
+                        else f"{res['saturation_p99']:.4g} sec"
+                    ),
+                )
+            )
+        if res["breach_step"]:
+            lines.append(
+                "SLO violated in {} ({} sessions): {}.".format(
+                    res["breach_step"],
+                    res["breach_sessions"],
+                    ", ".join(res["violations"]),
+                )
+            )
+        else:
+            lines.append(f"SLO not violated up to {self.max_target} sessions.")
+        return "\n".join(lines)
@@ -159,6 +159,16 @@ function update(result) {
     result.stats.act_stats,
     "No data (use `monitor` option to mark activities)."
   );
+
+  table = document.getElementById("stage-metrics");
+  updateTable(
+    table,
+    result.stats.stage_stats,
+    "No data (use `sessions.load_profile` to define stages)."
+  );
+
+  table = document.getElementById("error-metrics");
+  updateTable(table, result.stats.error_stats, "No errors.");
 }
 
 /* -----------------------------------------------------------------------------
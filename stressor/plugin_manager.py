@@ -2,12 +2,109 @@
 # Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
 """
 """
-from pkg_resources import iter_entry_points
+import importlib
+import json
+import os
+import sys
 
+from stressor.config_cache import ConfigCache
 from stressor.plugins.base import ActivityBase, MacroBase
 from stressor.util import logger
 
 
+class _EntryPoint:
+    """Lightweight entry point description that can be stored in an index file.
+
+    Only :meth:`load` imports the plugin module.
+    """
+
+    __slots__ = ("dist", "name", "value")
+
+    def __init__(self, name, value, dist):
+        self.name = name
+        #: (str) Object reference, e.g. 'stressor_ps:register'
+        self.value = value
+        #: (str) Distribution name and version, e.g. 'stressor-ps 0.1.0'
+        self.dist = dist
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+    def load(self):
+        module_name, _, attrs = self.value.partition(":")
+        res = importlib.import_module(module_name.strip())
+        for attr in filter(None, attrs.strip().split(".")):
+            res = getattr(res, attr)
+        return res
+
+
+def _get_path_fingerprint():
+    """Return a value that changes when packages are (un)installed."""
+    res = []
+    for path in sys.path:
+        try:
+            res.append([path, os.stat(path or ".").st_mtime_ns])
+        except OSError:
+            pass
+    return res
+
+
+def _scan_entry_points(group):
+    """Return a list of :class:`_EntryPoint` for all installed `group` entries."""
+    from importlib.metadata import entry_points
+
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=group)
+    else:  # Python 3.9
+        eps = eps.get(group, [])
+    res = []
+    for ep in eps:
+        dist = getattr(ep, "dist", None)
+        dist = f"{dist.name} {dist.version}" if dist else "?"
+        res.append(_EntryPoint(ep.name, ep.value, dist))
+    return res
+
+
+def iter_entry_points(group):
+    """Yield :class:`_EntryPoint` instances for `group`.
+
+    Scanning the metadata of all installed distributions is slow, so results
+    are stored in an index file in the cache folder (see
+    :class:`~stressor.config_cache.ConfigCache`). The index is re-built when
+    a folder of ``sys.path`` was modified, e.g. by ``pip install``.
+    """
+    folder = ConfigCache.get_default_folder()
+    index_path = os.path.join(folder, "entry_points.json") if folder else None
+    fingerprint = _get_path_fingerprint()
+    if index_path:
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            if index["fingerprint"] == fingerprint and group in index["groups"]:
+                for args in index["groups"][group]:
+                    yield _EntryPoint(*args)
+                return
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    eps = _scan_entry_points(group)
+    if index_path:
+        index = {
+            "fingerprint": fingerprint,
+            "groups": {group: [[ep.name, ep.value, ep.dist] for ep in eps]},
+        }
+        try:
+            os.makedirs(folder, mode=0o700, exist_ok=True)
+            tmp_path = f"{index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            logger.debug(f"Could not write entry point index {index_path}: {e}")
+    yield from eps
+
+
 class PluginManager:
     """
     Load, cache, and maintain a list of plugins and workflow tasks.
@@ -48,7 +145,7 @@ class PluginManager:
         ep_map = cls._entry_point_map
         logger.debug(f"Search entry points for group '{cls.namespace}'...")
 
-        for ep in iter_entry_points(group=cls.namespace, name=None):
+        for ep in iter_entry_points(cls.namespace):
             plugin_name = f"{ep.dist}"
             logger.debug(f"Found plugin {plugin_name} from entry point `{ep}`")
 
@@ -101,6 +198,7 @@ class PluginManager:
         import stressor.plugins.common  # noqa F401
         import stressor.plugins.http_activities  # noqa F401
         import stressor.plugins.script_activities  # noqa F401
+        import stressor.plugins.ws_activities  # noqa F401
 
         # Load entry points from all installed mosules that have the
         # 'stressor.plugins' namespace:
@@ -20,6 +20,9 @@ common_args = set(
     )
 )
 
+#: Match `$(last_result)` and `$(last_result.KEY)` macros
+LAST_RESULT_MACRO_REX = re.compile(r"\$\(\s*last_result\b")
+
 
 class ActivityError(StressorError):
     """Base for all errors that are explicitly raised by activities."""
@@ -36,12 +39,14 @@ class ActivityCompileError(ActivityError):
 class ActivityAssertionError(ActivityError):
     """Assertion failed (e.g. `assert_match` argument, ...)."""
 
-    def __init__(self, assertion_list):
+    def __init__(self, assertion_list, status_code=None):
         super().__init__("Activity assertion failed")
         check_arg(assertion_list, (str, list))
         if isinstance(assertion_list, str):
             assertion_list = [assertion_list]
         self.assertion_list = assertion_list
+        #: (int) HTTP status of the response (if any), used to group errors
+        self.status_code = status_code
 
 
 class ScriptActivityError(ActivityError):
@@ -85,6 +90,11 @@ class ActivityBase(ABC):
     #: (bool)
     _default_ignore_timing = False
 
+    #: (bool) False if the next activity is known not to read
+    #: `context.last_result`. This is set by the :class:`ConfigManager` and
+    #: used by the ``config.result_retention`` policy.
+    result_is_referenced = True
+
     @abstractmethod
     def __init__(self, config_manager, **activity_args):
         """
@@ -213,6 +223,24 @@ class ActivityBase(ABC):
         """
         return
 
+    def references_last_result(self):
+        """Return True if this activity reads the result of the previous one.
+
+        The default implementation checks the arguments for
+        `$(last_result...)` macros (including `assert_...` arguments).
+        """
+
+        def _scan(value):
+            if isinstance(value, str):
+                return bool(LAST_RESULT_MACRO_REX.search(value))
+            elif isinstance(value, dict):
+                return any(_scan(v) for v in value.values())
+            elif isinstance(value, (list, tuple)):
+                return any(_scan(v) for v in value)
+            return False
+
+        return any(_scan(v) for k, v in self.raw_args.items() if k != "activity")
+
     @abstractmethod
     def execute(self, session, **expanded_args):
         """
@@ -287,6 +315,12 @@ class MacroBase(ABC):
     #: TODO: Not yet implemented
     run_time_eval = False
 
+    #: True if the result only depends on the macro arguments and on
+    #: dependencies that are registered with
+    #: :meth:`~stressor.config_manager.ConfigManager.add_dependency`.
+    #: Configurations that use other macros are not cached.
+    cacheable = False
+
     def __init__(self, **macro_args):
         """"""
         return
@@ -4,32 +4,48 @@
 """
 import os
 import random
+import time
 from textwrap import dedent
 
-import yaml
-
-from stressor.plugins.base import ActivityBase, MacroBase
-from stressor.util import check_arg, format_elap
+from stressor.config_cache import file_digest
+from stressor.plugins.base import (
+    ActivityBase,
+    ActivityCompileError,
+    ActivityError,
+    MacroBase,
+)
+from stressor.util import (
+    check_arg,
+    format_bytes,
+    format_elap,
+    parse_duration,
+    parse_size,
+    yaml_load,
+)
 
 
 class LoadMacro(MacroBase):
     """Implement `$load(path)` macro."""
 
+    cacheable = True
+
     def apply(self, config_manager, parent, parent_key, path):
         path = config_manager.resolve_path(path, must_exist=True)
 
+        with open(path, "rb") as f:
+            data = f.read()
+        config_manager.add_dependency("file", path, file_digest(data))
+
         if path.lower().endswith(".py"):
             assert parent_key == "script"
-            with open(path) as f:
-                res = f.read()
+            res = data.decode()
             parent[parent_key] = res
             return res
 
         if not path.lower().endswith((".yaml", ".yml")):
             raise NotImplementedError
         # Load (and )
-        with open(path) as f:
-            res = yaml.safe_load(f)
+        res = yaml_load(data)
         assert isinstance(parent, dict)
         assert isinstance(res, list)
         parent[parent_key] = res
@@ -40,6 +56,10 @@ class LoadMacro(MacroBase):
 class EnvMacro(MacroBase):
     """Implement `$env(var_name)` macro, which resolves an environment variable at load-time."""
 
+    # Not cacheable: variables often hold secrets, which must not be written
+    # to the config cache
+    cacheable = False
+
     def apply(self, config_manager, parent, parent_key, var_name):
         # TODO:
         # Allow optional 'default' args: `$env(HOME, Foo)`
@@ -52,6 +72,8 @@ class EnvMacro(MacroBase):
 class DebugMacro(MacroBase):
     """Implement `$debug()` macro, which dumps information at run-time."""
 
+    cacheable = True
+
     def apply(self, config_manager, parent, parent_key, var_name):
         parent[parent_key] = "RunScript"
         parent["name"] = "$debug"
@@ -103,6 +125,8 @@ class DebugMacro(MacroBase):
 class SleepMacro(MacroBase):
     """Implement `$sleep(duration)` macro, which is a shortcut to :class`SleepActivity`."""
 
+    cacheable = True
+
     _args_def = (
         ("min", float),  # mandatory
         ("max", float, None),  # optional
@@ -189,46 +213,317 @@ class SleepActivity(ActivityBase):
         return
 
 
-# class MemoryActivity(ActivityBase):
-#     """
-#     Args:
-#         operation (str): 'alloc' | 'free'
-#         size (int):
-#     """
+class ParallelActivity(ActivityBase):
+    """
+    Run a list of activities concurrently within the session and wait for all.
 
-#     def __init__(self, config_manager, operation, **activity_args):
-#         super().__init__(config_manager, **activity_args)
+    This activity is created by the configuration compiler for `parallel:`
+    blocks in sequences.
 
-#     def execute(self, session):
-#         raise NotImplementedError
+    Args:
+        parallel (list): Activity definitions
 
+    Examples::
 
-# class CpuActivity(ActivityBase):
-#     """
-#     Args:
-#         operation (str): 'load' | 'stop'
-#         cores (int): Default: 1
-#         async (bool): Default: True
-#         duration (float):
-#     """
+        sequences:
+          main:
+            - activity: GetRequest
+              url: /index.html
+            - parallel:  # e.g. API calls of a page after it was loaded
+                - activity: GetRequest
+                  url: /api/user
+                - activity: GetRequest
+                  url: /api/news
+                  store_json:
+                    news_id: "items.[0].id"
+
+    Every activity runs in a branch of the session (see
+    :meth:`~stressor.session_manager.SessionManager.make_branch`), that has its
+    own context scope and execution path, and is reported like any other
+    activity of the sequence.
+    Context variables that are set by the children are available after the
+    block. The result is the list of the children's results.
+    Children use a worker pool per session (see ``sessions.parallel_workers``).
+    Timings of the block are added to the `monitored` stats by default, but not
+    to the net activity times, which already contain the children.
+    """
 
-#     def __init__(self, config_manager, operation, **activity_args):
-#         super().__init__(config_manager, **activity_args)
+    _mandatory_args = {"parallel"}
+    _known_args = {"parallel"}
 
-#     def execute(self, session):
-#         raise NotImplementedError
+    _default_monitor = True
+    _default_ignore_timing = True
 
+    def __init__(self, config_manager, **activity_args):
+        super().__init__(config_manager, **activity_args)
+        activity_list = activity_args["parallel"]
+        if not isinstance(activity_list, list) or not activity_list:
+            raise ActivityCompileError("`parallel` must be a list of activities")
+        for act_def in activity_list:
+            activity = act_def.get("activity") if isinstance(act_def, dict) else None
+            if not isinstance(activity, ActivityBase):
+                raise ActivityCompileError(
+                    f"`parallel` must be a list of activities (found {act_def!r})"
+                )
+            if isinstance(activity, ParallelActivity):
+                raise ActivityCompileError("`parallel` blocks cannot be nested")
+            # The context of a branch is discarded after the block
+            activity.result_is_referenced = False
+        #: (list) The compiled activity definitions
+        self.activity_list = activity_list
 
-# class FileActivity(ActivityBase):
-#     """
-#     Args:
-#         operation (str): 'read' | 'write'
-#         size (int):
-#         path (str):
-#     """
+    def get_info(self, info_args=True, expanded_args=None, session=None):
+        names = []
+        for act_def in self.raw_args.get("parallel") or ():
+            activity = act_def.get("activity") if isinstance(act_def, dict) else None
+            if isinstance(activity, ActivityBase):
+                activity = activity.get_script_name()
+            names.append(f"{activity}")
+        return "{}({})".format(self.get_script_name(), ", ".join(names))
+
+    def references_last_result(self):
+        return any(
+            act_def["activity"].references_last_result()
+            for act_def in self.activity_list
+        )
 
-#     def __init__(self, config_manager, operation, **activity_args):
-#         super().__init__(config_manager, **activity_args)
+    def execute(self, session, **expanded_args):
+        return session.run_parallel(session.pending_sequence, self.activity_list)
 
-#     def execute(self, session):
-#         raise NotImplementedError
+
+def _check_operation(activity_args, operations):
+    operation = activity_args.get("operation")
+    if operation not in operations:
+        raise ActivityCompileError(
+            f"`operation` must be one of {operations}: {operation!r}"
+        )
+    return operation
+
+
+def _check_size(activity_args, arg, mandatory=False):
+    value = activity_args.get(arg)
+    if value is None:
+        if mandatory:
+            raise ActivityCompileError(f"Missing mandatory argument: `{arg}`")
+        return
+    if isinstance(value, str) and "$" in value:
+        return  # `$(context_var)` macro
+    try:
+        if parse_size(value) < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ActivityCompileError(
+            f"`{arg}` must be a positive size, e.g. 65536 or '64kB': {value!r}"
+        )
+
+
+class MemoryActivity(ActivityBase):
+    """
+    Allocate or free memory, to put pressure on co-located services.
+
+    Args:
+        operation (str): 'alloc' | 'free'
+        size (int|str): Bytes to allocate, e.g. 1000000 or '500MB' ('alloc' only)
+
+    Examples::
+
+        - activity: Memory
+          operation: alloc
+          size: 500MB
+        - ...
+        - activity: Memory
+          operation: free
+
+    All pages of an allocation are touched, so the memory is resident.
+    Memory is held until `free` is called or the session ends.
+    The result is the number of bytes that the session holds (or that were
+    freed).
+    """
+
+    _mandatory_args = {"operation"}
+    _known_args = {"operation", "size"}
+    _info_args = ("operation", "size")
+
+    def __init__(self, config_manager, **activity_args):
+        super().__init__(config_manager, **activity_args)
+        operation = _check_operation(activity_args, ("alloc", "free"))
+        _check_size(activity_args, "size", mandatory=operation == "alloc")
+
+    def execute(self, session, **expanded_args):
+        from stressor.system_load import allocate_memory, get_session_load
+
+        if session.dry_run:
+            return expanded_args.get("mock_result", "dummy_result")
+        buffers = get_session_load(session)["memory"]
+        if expanded_args["operation"] == "free":
+            freed = sum(len(buf) for buf in buffers)
+            buffers.clear()
+            return freed
+
+        size = parse_size(expanded_args["size"])
+        start = time.monotonic()
+        try:
+            buffers.append(allocate_memory(size))
+        except MemoryError:
+            raise ActivityError(f"Could not allocate {format_bytes(size)}")
+        session.stats.report_system_load(
+            session, "memory", size, time.monotonic() - start
+        )
+        return sum(len(buf) for buf in buffers)
+
+
+class CpuActivity(ActivityBase):
+    """
+    Start or stop processes that keep CPU cores busy.
+
+    Args:
+        operation (str): 'load' | 'stop'
+        cores (int): Default: 1
+        async (bool): Default: True
+        duration (float): Seconds (default: 0, i.e. until stopped)
+
+    Examples::
+
+        - activity: Cpu
+          operation: load
+          cores: 2
+          duration: 30s
+        - ...
+        - activity: Cpu
+          operation: stop
+
+    Every core is loaded by a separate process, so the burners don't compete
+    for the GIL with the session threads.
+    By default the session continues while the load runs (`async: true`),
+    otherwise it waits for `duration` seconds.
+    Loads are stopped by `operation: stop` or when the session ends. The
+    consumed core-seconds are added to the stats.
+    """
+
+    _mandatory_args = {"operation"}
+    _known_args = {"operation", "cores", "async", "duration"}
+    _info_args = ("operation", "cores", "duration")
+
+    def __init__(self, config_manager, **activity_args):
+        super().__init__(config_manager, **activity_args)
+        operation = _check_operation(activity_args, ("load", "stop"))
+        if operation != "load":
+            return
+        cores = activity_args.get("cores", 1)
+        if not isinstance(cores, str) and (not isinstance(cores, int) or cores < 1):
+            raise ActivityCompileError(f"`cores` must be a positive integer: {cores!r}")
+        duration = activity_args.get("duration") or 0
+        if not (isinstance(duration, str) and "$" in duration):
+            try:
+                duration = parse_duration(duration)
+                if duration < 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                raise ActivityCompileError(
+                    f"`duration` must be a positive duration, e.g. 2.5 or '30s': {duration!r}"
+                )
+            if not duration and not activity_args.get("async", True):
+                raise ActivityCompileError("`async: false` requires a `duration`")
+
+    def execute(self, session, **expanded_args):
+        """
+        Returns:
+            (float|int) consumed core-seconds (number of started processes
+            if `async` is true)
+        """
+        from stressor.system_load import CpuLoad, get_session_load, stop_cpu_load
+
+        if session.dry_run:
+            return expanded_args.get("mock_result", "dummy_result")
+        if expanded_args["operation"] == "stop":
+            return stop_cpu_load(session)
+
+        load = CpuLoad(
+            cores=int(expanded_args.get("cores", 1)),
+            duration=parse_duration(expanded_args.get("duration") or 0),
+        )
+        load.start()
+        if expanded_args.get("async", True):
+            get_session_load(session)["cpu"].append(load)
+            return load.cores
+        load.wait(session.stop_request)
+        core_seconds = load.stop()
+        session.stats.report_system_load(session, "cpu", core_seconds, core_seconds)
+        return core_seconds
+
+
+class FileActivity(ActivityBase):
+    """
+    Read or write a file, to put pressure on the disk and page cache.
+
+    Args:
+        operation (str): 'read' | 'write'
+        size (int|str): Bytes to write (or max. bytes to read), e.g. '100MB'
+        path (str): Default: a temp file per session (deleted when it ends)
+        block_size (int|str): Default: 64 KiB
+        fsync (bool): Flush written data to disk (default: false)
+        mmap (bool): Access the file through a memory map (default: false)
+
+    Examples::
+
+        - activity: File
+          operation: write
+          size: 100MB
+          fsync: true
+        - activity: File
+          operation: read
+
+    The result is the number of bytes that were transferred. Throughput is
+    added to the stats.
+    """
+
+    _mandatory_args = {"operation"}
+    _known_args = {"operation", "path", "size", "block_size", "fsync", "mmap"}
+    _info_args = ("operation", "size", "path")
+
+    def __init__(self, config_manager, **activity_args):
+        super().__init__(config_manager, **activity_args)
+        operation = _check_operation(activity_args, ("read", "write"))
+        _check_size(activity_args, "size", mandatory=operation == "write")
+        _check_size(activity_args, "block_size")
+        if activity_args.get("block_size") == 0:
+            raise ActivityCompileError("`block_size` must not be 0")
+
+    def execute(self, session, **expanded_args):
+        from stressor.system_load import (
+            DEFAULT_BLOCK_SIZE,
+            get_session_load,
+            get_temp_path,
+            read_file,
+            write_file,
+        )
+
+        if session.dry_run:
+            return expanded_args.get("mock_result", "dummy_result")
+        operation = expanded_args["operation"]
+        path = expanded_args.get("path")
+        if not path:
+            path = get_temp_path(session)
+            get_session_load(session)["temp_files"].add(path)
+        block_size = parse_size(expanded_args.get("block_size") or DEFAULT_BLOCK_SIZE)
+        size = parse_size(expanded_args.get("size") or 0)
+        use_mmap = bool(expanded_args.get("mmap"))
+
+        start = time.monotonic()
+        try:
+            if operation == "write":
+                count = write_file(
+                    path,
+                    size,
+                    block_size,
+                    fsync=bool(expanded_args.get("fsync")),
+                    use_mmap=use_mmap,
+                )
+            else:
+                count = read_file(path, block_size, size, use_mmap=use_mmap)
+        except OSError as e:
+            raise ActivityError(f"File {operation} failed: {e}")
+        session.stats.report_system_load(
+            session, f"file_{operation}", count, time.monotonic() - start
+        )
+        return count
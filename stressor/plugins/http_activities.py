@@ -4,18 +4,21 @@
 """
 import re
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
 from pprint import pformat
 from queue import Empty, Queue
 from urllib.parse import urlencode
 
 import requests
-from lxml import html
 from requests.exceptions import RequestException
 
 from stressor import __version__
 from stressor.plugins.base import (
     ActivityAssertionError,
     ActivityBase,
+    ActivityCompileError,
     ActivityError,
     ActivityTimeoutError,
 )
@@ -24,6 +27,7 @@ from stressor.util import (
     get_dict_attr,
     is_relative_url,
     logger,
+    parse_duration,
     resolve_url,
     shorten_string,
 )
@@ -46,6 +50,10 @@ def match_value(pattern, value, info):
     return True, None
 
 
+# Guards the worker pools of `HarReplay` activities (see `session.data`)
+_replay_pool_lock = threading.Lock()
+
+
 class HTTPRequestActivity(ActivityBase):
     # RESPONSE_LOG_LENGTH = 200
     REQUEST_ARGS = {"auth", "data", "json", "headers", "params", "timeout", "verify"}
@@ -125,7 +133,7 @@ class HTTPRequestActivity(ActivityBase):
     def _raise_assertion(cls, cause, resp):
         msg = cls._format_response(resp, short=True)
         msg = "\n  | ".join(msg.split("\n"))
-        raise ActivityAssertionError(f"{cause}\n{msg}")
+        raise ActivityAssertionError(f"{cause}\n{msg}", status_code=resp.status_code)
 
     def execute(self, session, **expanded_args):
         """
@@ -143,6 +151,7 @@ class HTTPRequestActivity(ActivityBase):
         expanded_args.setdefault("timeout", session.get_context("request_timeout"))
         assert "timeout" in expanded_args
         debug = expanded_args.get("debug")
+        log_debug = debug and session.log_sampler.check("debug")
 
         # print("session.dry_run", session.dry_run)
         if session.dry_run:
@@ -173,7 +182,7 @@ class HTTPRequestActivity(ActivityBase):
         #     http_client.HTTPConnection.debuglevel = 1
         # else:
         #     http_client.HTTPConnection.debuglevel = 0
-        if debug:
+        if log_debug:
             logger.info(f"HTTPRequest({method}, {url}, {r_args})...")
 
         # The actual HTTP request:
@@ -193,7 +202,7 @@ class HTTPRequestActivity(ActivityBase):
 
         if not resp.ok:
             logger.error(self._format_response(resp, short=not debug))
-        elif debug:
+        elif log_debug:
             logger.info(self._format_response(resp, short=False))
 
         assert_status = expanded_args.get("assert_status")
@@ -229,6 +238,8 @@ class HTTPRequestActivity(ActivityBase):
             if is_json:
                 self._raise_assertion("Unexpected result type (expected HTML)", resp)
 
+            from lxml import html
+
             for xpath, pattern in arg.items():
                 # print(result)
                 tree = html.fromstring(result)
@@ -277,6 +288,11 @@ class StaticRequestsActivity(ActivityBase):
     """
     This activity recieves a list of URLs (JavaScript, Html, CSS, Images, ...)
     and loads them, using max. ~5 threads, as a browser would.
+
+    If `sessions.http_cache` is enabled, responses are tracked by a
+    per-session :class:`~stressor.http_cache.HttpCache`, so a returning
+    visitor skips fresh resources and revalidates stale ones with
+    conditional requests.
     """
 
     REQUEST_ARGS = {"auth", "data", "json", "headers", "params", "timeout", "verify"}
@@ -312,6 +328,7 @@ class StaticRequestsActivity(ActivityBase):
 
         # TODO: requests.Session is not guaranteed to be thread-safe!
         bs = session.browser_session
+        http_cache = session.http_cache
         # Queue-up all pending request
         queue = Queue()
         for url in url_list:
@@ -319,6 +336,7 @@ class StaticRequestsActivity(ActivityBase):
             queue.put(url)
 
         results = []
+        cache_events = []  # list.append() is thread-safe
 
         def _work(name):
             # logger.debug("StaticRequests({}) started...".format(name, ))
@@ -328,13 +346,30 @@ class StaticRequestsActivity(ActivityBase):
                 except Empty:
                     break
 
-                if debug:
+                if debug and session.log_sampler.check("debug"):
                     logger.info(f"StaticRequests({name}, {url})...")
                 # The actual HTTP request:
                 # TODO: requests.Session is not guaranteed to be thread-safe!
                 try:
-                    res = bs.request(method, url, **r_args)
+                    args = r_args
+                    if http_cache is not None:
+                        is_fresh, cond_headers = http_cache.lookup(url)
+                        if is_fresh:
+                            cache_events.append("hits")
+                            results.append((True, name, url, None))
+                            queue.task_done()
+                            continue
+                        if cond_headers:
+                            args = r_args.copy()
+                            args["headers"] = {**r_args["headers"], **cond_headers}
+                    res = bs.request(method, url, **args)
                     res.raise_for_status()
+                    if http_cache is not None:
+                        if res.status_code == 304:
+                            cache_events.append("revalidated")
+                        else:
+                            cache_events.append("misses")
+                        http_cache.store(url, res)
                     results.append((True, name, url, None))
                 except Exception as e:
                     results.append((False, name, url, f"{e}"))
@@ -358,6 +393,13 @@ class StaticRequestsActivity(ActivityBase):
         queue.join()
         for t in thread_list:
             t.join()
+        if http_cache is not None:
+            session.stats.report_http_cache(
+                session,
+                hits=cache_events.count("hits"),
+                revalidated=cache_events.count("revalidated"),
+                misses=cache_events.count("misses"),
+            )
         errors = [f"{error}" for ok, name, url, error in results if not ok]
         if errors:
             raise ActivityError(f"{len(errors)} reqests failed:\n{format(errors)}")
@@ -365,11 +407,310 @@ class StaticRequestsActivity(ActivityBase):
         return bool(errors)
 
 
+class HarReplayActivity(ActivityBase):
+    """
+    Replay the requests of a recorded HAR file, preserving their original
+    relative start times, and thus the concurrency pattern of the browser.
+
+    Requests are started at their recorded offset (divided by `time_scale`)
+    by a pool of max. `thread_count` workers. URLs that start with the
+    most-used scheme and host of the recording are resolved relative to the
+    session's `base_url`; other URLs are skipped, unless `skip_externals` is
+    false. Use `sessions.count` to replay with multiple virtual users.
+    The recorded request headers and cookies are sent as well (`headers`
+    arguments take precedence), except for headers that `requests` computes,
+    like `Host` or `Content-Length`.
+
+    Example::
+
+        - activity: HarReplay
+          path: recorded.har
+          time_scale: 10  # Replay 10 times faster
+          thread_count: 6  # (default)
+
+    The result is a dict with the number of `requests` that were sent (less
+    than recorded, if the run was stopped) and the maximum `lag` (seconds a
+    request started later than scheduled, e.g. because all workers were busy).
+    """
+
+    REQUEST_ARGS = {"auth", "headers", "timeout", "verify"}
+    _mandatory_args = {"path"}
+    _known_args = (
+        REQUEST_ARGS
+        | _mandatory_args
+        | {"assert_status", "skip_externals", "thread_count", "time_scale"}
+    )
+    _info_args = ("name", "path", "time_scale")
+    #: Recorded headers that are not replayed (lower case)
+    SKIP_HEADERS = frozenset(
+        (
+            "connection",
+            "content-length",
+            "cookie",
+            "host",
+            "keep-alive",
+            "te",
+            "transfer-encoding",
+            "upgrade",
+        )
+    )
+
+    def __init__(self, config_manager, **activity_args):
+        super().__init__(config_manager, **activity_args)
+        from stressor.convert.har_converter import HarConverter
+
+        path = activity_args["path"]
+        check_arg(path, str)
+        skip_externals = activity_args.get("skip_externals", True)
+        check_arg(skip_externals, bool)
+        path = config_manager.resolve_path(path)
+
+        conv = HarConverter({"fspec": path})
+        prefix = None
+        #: (list[tuple]) `(offset, method, url, data, headers, cookies)` sorted
+        #: by offset
+        self.replay_entries = []
+        t0 = None
+        for entry in conv.iter_entries(path):
+            if prefix is None:
+                prefix = conv.prefix_counter.most_common(1)[0][0]
+            url = entry["url"]
+            if url.lower().startswith(prefix.lower()):
+                url = url[len(prefix) :] or "/"
+            elif skip_externals:
+                continue
+            if t0 is None:
+                t0 = entry["start"]
+            data = entry.get("data")
+            if isinstance(data, list):
+                data = {p["name"]: p["value"] for p in data}
+            # HTTP/2 recordings contain pseudo-headers like ':authority'
+            headers = {
+                name: value
+                for name, value in entry.get("headers", ())
+                if not name.startswith(":") and name.lower() not in self.SKIP_HEADERS
+            }
+            cookies = dict(entry.get("cookies", ()))
+            self.replay_entries.append(
+                (entry["start"] - t0, entry["method"], url, data, headers, cookies)
+            )
+        if not self.replay_entries:
+            raise ActivityCompileError(f"No replayable requests found in {path}")
+        #: (float) Recorded duration in seconds
+        self.duration = self.replay_entries[-1][0]
+
+    def execute(self, session, **expanded_args):
+        """
+        Raises:
+            ActivityError: if one or more requests failed
+        """
+        base_url = session.get_context("base_url")
+        time_scale = float(expanded_args.get("time_scale", 1.0))
+        thread_count = int(expanded_args.get("thread_count", 6))
+        assert_status = expanded_args.get("assert_status")
+        debug = expanded_args.get("debug")
+        if time_scale <= 0 or thread_count < 1:
+            raise ActivityError("Expected `time_scale` > 0 and `thread_count` >= 1")
+        if session.dry_run:
+            return {"requests": len(self.replay_entries), "lag": 0.0}
+
+        expanded_args.setdefault("timeout", session.get_context("request_timeout"))
+        r_args = {k: v for k, v in expanded_args.items() if k in self.REQUEST_ARGS}
+        r_args.setdefault("verify", session.sessions.get("verify_ssl", True))
+        if session.sessions.get("basic_auth", False):
+            r_args.setdefault("auth", session.user.auth)
+        headers = r_args.setdefault("headers", {})
+        headers.setdefault(
+            "User-Agent",
+            f"session/{session.session_id} Stressor/{__version__}",
+        )
+
+        # TODO: requests.Session is not guaranteed to be thread-safe!
+        bs = session.browser_session
+        lock = threading.Lock()
+        max_lag = 0.0
+        errors = []
+        futures = []
+
+        def _request(scheduled, method, url, data, headers, cookies):
+            nonlocal max_lag
+            lag = time.monotonic() - scheduled
+            with lock:
+                max_lag = max(max_lag, lag)
+            if debug and session.log_sampler.check("debug"):
+                logger.info(f"HarReplay({method} {url}, lag: {lag:.3f})...")
+            try:
+                res = bs.request(
+                    method,
+                    url,
+                    data=data,
+                    cookies=cookies,
+                    **{**r_args, "headers": {**headers, **r_args["headers"]}},
+                )
+                if assert_status:
+                    if res.status_code not in assert_status:
+                        raise ActivityAssertionError(
+                            f"HTTP status does not match {assert_status}: "
+                            f"{res.status_code}"
+                        )
+                else:
+                    res.raise_for_status()
+            except Exception as e:
+                with lock:
+                    errors.append(f"{method} {url}: {e}")
+
+        pool = self._get_pool(session, thread_count)
+        start = time.monotonic()
+        for offset, method, url, data, headers, cookies in self.replay_entries:
+            scheduled = start + offset / time_scale
+            delay = scheduled - time.monotonic()
+            if delay > 0 and session.stop_request.wait(delay):
+                break
+            url = resolve_url(base_url, url)
+            futures.append(
+                pool.submit(_request, scheduled, method, url, data, headers, cookies)
+            )
+        wait_futures(futures)
+
+        if errors:
+            raise ActivityError(
+                "{} of {} requests failed:\n{}".format(
+                    len(errors), len(futures), "\n".join(errors)
+                )
+            )
+        return {"requests": len(futures), "lag": max_lag}
+
+    @staticmethod
+    def _get_pool(session, thread_count):
+        """Return the worker pool of `session`, which is re-used by every
+        execution (and shut down when the session ends)."""
+        # Branches of `parallel:` blocks use the pools of their session
+        data = (session.parent or session).data
+        with _replay_pool_lock:
+            pools = data.setdefault("har_replay_pools", {})
+            pool = pools.get(thread_count)
+            if pool is None:
+                pool = pools[thread_count] = ThreadPoolExecutor(
+                    max_workers=thread_count,
+                    thread_name_prefix=f"{session.session_id}.replay",
+                )
+        return pool
+
+
 class PollRequestActivity(HTTPRequestActivity):
     """
-    TODO: This activity simulates a peridodical request to a single URL.
+    Start a background poller that periodically requests a single URL, while
+    the session continues with the next activities.
+
+    Example::
+
+        - activity: PollRequest
+          url: /api/status
+          interval: 2s
+          # duration: 60  # (default: until the session ends)
+        - ...
+        - activity: PollRequest
+          url: /api/status
+          stop: true
+
+    The next request is sent `interval` seconds after the previous response
+    (pass `interval: 0` for long-polling).
+    All pollers are driven by a shared :class:`~stressor.poll_scheduler.PollScheduler`,
+    so idle pollers don't need a thread.
+    Requests are accounted in separate statistics, so failed polls don't count
+    as activity errors.
+
+    Pollers are identified by `name` (or the URL), so executing the activity
+    again (e.g. in a loop) does not start a second poller.
+    If the `--single` option is passed, only one request is sent.
     """
 
+    _mandatory_args = {"url"}
+    _known_args = (
+        HTTPRequestActivity.REQUEST_ARGS
+        | _mandatory_args
+        | {"assert_status", "duration", "interval", "method", "stop"}
+    )
+    _info_args = ("name", "url", "interval")
+
     def __init__(self, config_manager, **activity_args):
-        raise NotImplementedError
-        # TODO: honor force_single option
+        method = activity_args.pop("method", "GET")
+        super().__init__(config_manager, method=method, **activity_args)
+        if not activity_args.get("stop") and "interval" not in activity_args:
+            raise ActivityCompileError("Missing mandatory argument: `interval`")
+        try:
+            for arg in ("interval", "duration"):
+                value = activity_args.get(arg)
+                # May be a `$(context_var)` macro
+                is_macro = isinstance(value, str) and "$" in value
+                if not is_macro and parse_duration(value or 0) < 0:
+                    raise ValueError
+        except (TypeError, ValueError):
+            raise ActivityCompileError(
+                f"`{arg}` must be a positive duration, e.g. 2.5 or '500ms'"
+            )
+
+    def get_info(self, info_args=True, expanded_args=None, session=None):
+        args_dict = expanded_args if expanded_args else self.raw_args
+        url = args_dict.get("url")
+        if args_dict.get("stop"):
+            return f"{self.get_script_name()}({url}, stop)"
+        return "{}({}, every {})".format(
+            self.get_script_name(), url, args_dict.get("interval")
+        )
+
+    def execute(self, session, **expanded_args):
+        """
+        Returns:
+            (bool) True if a poller was started (or stopped with `stop: true`)
+        """
+        key = expanded_args.get("name") or expanded_args.get("url")
+        if expanded_args.get("stop"):
+            poller = session.pollers.pop(key, None)
+            if poller:
+                poller.stop()
+            return poller is not None
+
+        if session.dry_run:
+            return expanded_args.get("mock_result", "dummy_result")
+
+        if session.get_config("config.force_single", False):
+            logger.info(f"force_single: {self} sends a single request.")
+            return super().execute(session, **expanded_args)
+
+        poller = session.pollers.get(key)
+        if poller and poller.is_active:
+            return False
+
+        from stressor.poll_scheduler import Poller, PollScheduler
+
+        base_url = session.get_context("base_url")
+        url = expanded_args["url"]
+        if not base_url and is_relative_url(url):
+            raise ActivityError(
+                "Missing context variable 'base_url' to resolve relative URLs"
+            )
+        expanded_args.setdefault("timeout", session.get_context("request_timeout"))
+        r_args = {k: v for k, v in expanded_args.items() if k in self.REQUEST_ARGS}
+        r_args.setdefault("verify", session.sessions.get("verify_ssl", True))
+        if session.sessions.get("basic_auth", False):
+            r_args.setdefault("auth", session.user.auth)
+        headers = r_args.setdefault("headers", {})
+        headers.setdefault(
+            "User-Agent",
+            f"session/{session.session_id} Stressor/{__version__}",
+        )
+
+        poller = Poller(
+            session,
+            key=self.compile_path,
+            method=self.raw_args["method"],
+            url=resolve_url(base_url, url),
+            r_args=r_args,
+            interval=parse_duration(expanded_args["interval"]),
+            duration=parse_duration(expanded_args.get("duration") or 0),
+            assert_status=expanded_args.get("assert_status"),
+        )
+        session.pollers[key] = poller
+        PollScheduler.get().schedule(poller)
+        return True
@@ -2,8 +2,10 @@
 # Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
 """
 """
+import dis
 from pprint import pformat
 from textwrap import dedent
+from types import CodeType
 
 from stressor.plugins.base import (
     ActivityBase,
@@ -12,6 +14,40 @@ from stressor.plugins.base import (
 )
 from stressor.util import NO_DEFAULT, check_arg, logger, shorten_string
 
+#: Scripts that call these functions may access any local variable
+_DYNAMIC_NAMES = frozenset(("eval", "exec", "locals", "vars"))
+
+
+def get_script_names(code):
+    """Return `(input_names, stored_names)` of a compiled script.
+
+    `input_names` are read or deleted by the top-level code, i.e. looked up
+    in the local namespace that is passed to ``exec()``. (Nested functions and
+    classes cannot access this namespace.)
+    `stored_names` are assigned, imported, or deleted by the top-level code.
+    `input_names` is None if the script may access variables dynamically
+    (e.g. calls `locals()`).
+    """
+    input_names = set()
+    stored_names = set()
+    for instr in dis.get_instructions(code):
+        if instr.opname == "LOAD_NAME":
+            input_names.add(instr.argval)
+        elif instr.opname == "STORE_NAME":
+            stored_names.add(instr.argval)
+        elif instr.opname == "DELETE_NAME":
+            input_names.add(instr.argval)
+            stored_names.add(instr.argval)
+
+    code_list = [code]
+    while code_list:
+        code = code_list.pop()
+        if _DYNAMIC_NAMES.intersection(code.co_names):
+            input_names = None
+            break
+        code_list.extend(c for c in code.co_consts if isinstance(c, CodeType))
+    return input_names, stored_names
+
 
 class RunScriptActivity(ActivityBase):
     _mandatory_args = None
@@ -55,6 +91,11 @@ class RunScriptActivity(ActivityBase):
 
         #: Store a shortened code snippet for debug output
         self.source = shorten_string(dedent(script), 500, 100)
+        input_names, stored_names = get_script_names(self.script)
+        #: (set) Context variables that are passed to the script (None: all)
+        self.input_names = input_names
+        #: (set) Variables that are assigned by the script
+        self.stored_names = stored_names
         # print(self.source)
 
         if export is None:
@@ -65,21 +106,32 @@ class RunScriptActivity(ActivityBase):
             self.export = set(export)
         return
 
+    def references_last_result(self):
+        """Return True if the script (or a nested function) uses `last_result`."""
+        if super().references_last_result() or self.input_names is None:
+            return True
+        code_list = [self.script]
+        while code_list:
+            code = code_list.pop()
+            if "last_result" in code.co_names or "last_result" in code.co_varnames:
+                return True
+            code_list.extend(c for c in code.co_consts if isinstance(c, CodeType))
+        return False
+
     def execute(self, session, **expanded_args):
         """"""
         global_vars = {
             # "foo": 41,
             # "__builtins__": {},
         }
-        # local_vars = session.context
-        local_vars = session.context.copy()
-        assert "result" not in local_vars
-        assert "session" not in local_vars
-        local_vars["session"] = session.make_session_helper()
-
-        # prev_local_keys = set(locals())
-        prev_global_keys = set(globals())
-        prev_context_keys = set(local_vars.keys())
+        context = session.context
+        if self.input_names is None:
+            local_vars = context.copy()
+        else:
+            # Only pass the variables that the script reads
+            local_vars = {k: context[k] for k in self.input_names if k in context}
+        if self.input_names is None or "session" in self.input_names:
+            local_vars["session"] = session.make_session_helper()
 
         try:
             exec(self.script, global_vars, local_vars)
@@ -94,40 +146,32 @@ class RunScriptActivity(ActivityBase):
                 raise ScriptActivityError(msg) from e
             raise ScriptActivityError(msg)
         finally:
-            local_vars.pop("session")
-
-        result = local_vars.pop("result", None)
-
-        context_keys = set(local_vars.keys())
-        new_keys = context_keys.difference(prev_context_keys)
-
-        if new_keys:
-            if self.export is None:
+            local_vars.pop("session", None)
+
+        result = (
+            local_vars.pop("result", None) if "result" in self.stored_names else None
+        )
+
+        if self.export is None:
+            new_keys = [
+                k
+                for k in self.stored_names
+                if k in local_vars and k != "result" and k not in context
+            ]
+            if new_keys:
                 logger.info(
                     "Skript activity has no `export` defined. Ignoring new variables: '{}'".format(
                         "', '".join(new_keys)
                     )
                 )
-            else:
-                for k in self.export:
-                    v = local_vars.get(k)
-                    assert type(v) in (int, float, str, list, dict)
-                    session.context[k] = v
-                    logger.debug(f"Set context.{k} = {v!r}")
-                # store_keys = new_keys.intersection(self.export)
-
-        # TODO: this cannot happen?
-        new_globals = set(globals().keys()).difference(prev_global_keys)
-        if new_globals:
-            logger.warning(f"Script-defined globals: {new_globals}")
-            raise ScriptActivityError("Script introduced globals")
-
-        # new_context = context_keys.difference(prev_context_keys)
-        # logger.info("Script-defined context-keys: {}".format(new_context))
-
-        # new_locals = set(locals().keys()).difference(prev_local_keys)
-        # if new_locals:
-        #     logger.info("Script-defined locals: {}".format(new_locals))
+        else:
+            for k in self.export:
+                if k not in local_vars:
+                    continue
+                v = local_vars[k]
+                assert type(v) in (int, float, str, list, dict)
+                context[k] = v
+                logger.debug(f"Set context.{k} = {v!r}")
 
         # logger.info("Script locals:\n{}".format(pformat(local_vars)))
         if expanded_args.get("debug") or session.verbose >= 5:
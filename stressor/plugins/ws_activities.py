@@ -0,0 +1,202 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+"""
+import importlib.util
+import json
+
+from stressor import __version__
+from stressor.plugins.base import (
+    ActivityBase,
+    ActivityCompileError,
+    ActivityError,
+    ActivityTimeoutError,
+)
+from stressor.util import is_relative_url, resolve_url
+
+
+def _get_connection(session, name, required=True):
+    from stressor.ws_client import SESSION_DATA_KEY
+
+    conn = session.data.get(SESSION_DATA_KEY, {}).get(name)
+    if required and not (conn and conn.is_open):
+        raise ActivityError(f"WebSocket connection {name!r} is not open")
+    return conn
+
+
+class _WsBaseActivity(ActivityBase):
+    """Common base class for WebSocket activities.
+
+    Connections are identified by the `connection` argument, so a session may
+    open more than one socket (default: 'default').
+    """
+
+    _known_args = {"connection", "timeout"}
+
+    def _get_timeout(self, session, expanded_args):
+        return expanded_args.get("timeout") or session.get_context("request_timeout")
+
+
+class WsConnectActivity(_WsBaseActivity):
+    """
+    Open a WebSocket connection that is used by the following `WsSend`,
+    `WsExpect`, and `WsClose` activities of the session.
+
+    Example::
+
+        - activity: WsConnect
+          url: /ws/updates  # Relative to `base_url` ('http' becomes 'ws')
+          # headers: {"Authorization": "Bearer $(token)"}
+        - activity: WsSend
+          data: ping
+        - activity: WsExpect
+          match: pong
+          timeout: 2
+        - activity: WsClose
+
+    The connections of all sessions are driven by a shared asyncio event loop
+    (see :class:`~stressor.ws_client.WsLoop`), so idle sockets need no thread.
+    Connections that are still open are closed when the session ends.
+    Requires the optional `websockets` package.
+    """
+
+    _mandatory_args = {"url"}
+    _known_args = _WsBaseActivity._known_args | _mandatory_args | {"headers"}
+    _info_args = ("url",)
+
+    def __init__(self, config_manager, **activity_args):
+        super().__init__(config_manager, **activity_args)
+        if importlib.util.find_spec("websockets") is None:
+            raise ActivityCompileError(
+                "WebSocket activities require the `websockets` package "
+                "(pip install stressor[websockets])"
+            )
+
+    def execute(self, session, **expanded_args):
+        """
+        Returns:
+            (bool) True if a connection was opened (False if it was already open)
+        """
+        from stressor.ws_client import SESSION_DATA_KEY, WsConnection
+
+        name = expanded_args.get("connection", "default")
+        url = expanded_args["url"]
+        base_url = session.get_context("base_url")
+        if not base_url and is_relative_url(url):
+            raise ActivityError(
+                "Missing context variable 'base_url' to resolve relative URLs"
+            )
+        if session.dry_run:
+            return expanded_args.get("mock_result", "dummy_result")
+
+        conn = _get_connection(session, name, required=False)
+        if conn and conn.is_open:
+            return False
+
+        url = resolve_url(base_url, url)
+        if url.startswith("http"):
+            url = "ws" + url[4:]
+        headers = dict(expanded_args.get("headers") or {})
+        headers.setdefault(
+            "User-Agent", f"session/{session.session_id} Stressor/{__version__}"
+        )
+        conn = WsConnection(session, key=self.compile_path, url=url)
+        try:
+            conn.open(headers, timeout=self._get_timeout(session, expanded_args))
+        except TimeoutError:
+            raise ActivityTimeoutError(f"Timeout while connecting to {url}")
+        session.data.setdefault(SESSION_DATA_KEY, {})[name] = conn
+        return True
+
+
+class WsSendActivity(_WsBaseActivity):
+    """
+    Send a message over an open WebSocket connection.
+
+    Pass `data` (a text message) or `json` (an object that is serialized).
+    """
+
+    _known_args = _WsBaseActivity._known_args | {"data", "json"}
+    _info_args = ("data", "json")
+
+    def __init__(self, config_manager, **activity_args):
+        super().__init__(config_manager, **activity_args)
+        if ("data" in activity_args) == ("json" in activity_args):
+            raise ActivityCompileError("Pass either `data` or `json`")
+
+    def execute(self, session, **expanded_args):
+        if session.dry_run:
+            return expanded_args.get("mock_result", "dummy_result")
+        conn = _get_connection(session, expanded_args.get("connection", "default"))
+        if "json" in expanded_args:
+            message = json.dumps(expanded_args["json"])
+        else:
+            message = expanded_args["data"]
+            if not isinstance(message, (str, bytes)):
+                message = str(message)
+        try:
+            conn.send(message, timeout=self._get_timeout(session, expanded_args))
+        except TimeoutError:
+            raise ActivityTimeoutError(f"Timeout while sending to {conn.url}")
+        return True
+
+
+class WsExpectActivity(_WsBaseActivity):
+    """
+    Wait for the next message that matches `match` (a regular expression).
+
+    Messages that don't match are skipped. The time since the oldest pending
+    `WsSend` is recorded as round-trip latency.
+    The result is the message (parsed as JSON if possible), so it can be
+    checked with `assert_match` or stored with `store_json`.
+    """
+
+    _known_args = _WsBaseActivity._known_args | {"match", "store_json"}
+    _info_args = ("match",)
+
+    def __init__(self, config_manager, **activity_args):
+        super().__init__(config_manager, **activity_args)
+
+    def execute(self, session, **expanded_args):
+        if session.dry_run:
+            return expanded_args.get("mock_result", "dummy_result")
+        conn = _get_connection(session, expanded_args.get("connection", "default"))
+        pattern = expanded_args.get("match")
+        timeout = self._get_timeout(session, expanded_args)
+        try:
+            message, skipped = conn.expect(pattern, timeout=timeout)
+        except TimeoutError:
+            raise ActivityTimeoutError(
+                f"No message matching {pattern!r} received within {timeout} sec"
+            )
+        if skipped and expanded_args.get("debug"):
+            session.log_info(f"{self}: skipped {skipped} messages")
+        try:
+            return json.loads(message)
+        except ValueError:
+            return message
+
+
+class WsCloseActivity(_WsBaseActivity):
+    """
+    Close a WebSocket connection.
+    """
+
+    def __init__(self, config_manager, **activity_args):
+        super().__init__(config_manager, **activity_args)
+
+    def execute(self, session, **expanded_args):
+        """
+        Returns:
+            (bool) True if an open connection was closed
+        """
+        from stressor.ws_client import SESSION_DATA_KEY
+
+        if session.dry_run:
+            return expanded_args.get("mock_result", "dummy_result")
+        name = expanded_args.get("connection", "default")
+        conn = session.data.get(SESSION_DATA_KEY, {}).pop(name, None)
+        if conn is None or not conn.is_open:
+            return False
+        conn.close(timeout=self._get_timeout(session, expanded_args))
+        return True
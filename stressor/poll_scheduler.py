@@ -0,0 +1,240 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+Run periodic background requests of many sessions with a shared scheduler.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from stressor.session_manager import get_transfer_size
+from stressor.util import logger
+
+
+class Poller:
+    """
+    Request a URL periodically in the background of a session.
+
+    Pollers are created by
+    :class:`~stressor.plugins.http_activities.PollRequestActivity` and driven
+    by the shared :class:`PollScheduler`.
+    The next request is scheduled `interval` seconds after the previous one
+    completed (like a JavaScript `setTimeout()` chain), so `interval: 0`
+    simulates long-polling.
+
+    Args:
+        session (:class:`~stressor.session_manager.SessionManager`):
+        key (str): Name of the stats bucket, e.g. the activity's compile path
+        method (str):
+        url (str): Absolute URL
+        r_args (dict): Keyword arguments for ``requests.Session.request()``
+        interval (float): Seconds between two requests
+        duration (float): Stop after `duration` seconds (0: until the session ends)
+        assert_status (list): Expected status codes (default: < 400)
+    """
+
+    def __init__(
+        self,
+        session,
+        key,
+        method,
+        url,
+        r_args,
+        interval,
+        duration=0,
+        assert_status=None,
+    ):
+        self.session = session
+        self.key = key
+        self.method = method
+        self.url = url
+        self.r_args = r_args
+        self.interval = interval
+        self.assert_status = assert_status
+        #: (float) Monotonic stop time or None
+        self.end_time = time.monotonic() + duration if duration else None
+        #: (int) Number of completed requests
+        self.count = 0
+        self._active = True
+        self._browser_session = self._create_browser_session()
+
+    def __str__(self):
+        return f"Poller<{self.session.session_id}, {self.method} {self.url}>"
+
+    def stop(self):
+        """Don't schedule more requests (a pending request is completed)."""
+        self._active = False
+
+    @property
+    def is_active(self):
+        if not self._active:
+            return False
+        if self.session.stop_request.is_set() or (
+            self.end_time and time.monotonic() > self.end_time
+        ):
+            self._active = False
+        return self._active
+
+    def _create_browser_session(self):
+        """Return a ``requests.Session`` that is initialized from the session's.
+
+        A separate instance is used, so the bytes of background requests are
+        not accounted to the activity that is currently running.
+        Headers and cookies are copied (in the session thread), because
+        ``requests.Session`` is not thread-safe. Cookies that the server sets
+        are merged back (see :meth:`_merge_cookies`).
+        """
+        import requests
+
+        bs = self.session.browser_session
+        ps = requests.Session()
+        ps.headers = bs.headers.copy()
+        ps.cookies = bs.cookies.copy()
+        # Share the adapters, so `sessions.throttle` is honored. They are
+        # thread-safe (a connection pool per host)
+        ps.adapters = bs.adapters
+        return ps
+
+    def _merge_cookies(self, resp):
+        """Copy the cookies that were set by `resp` to the session's cookie jar."""
+        jar = self.session.browser_session.cookies
+        for r in (*resp.history, resp):
+            for cookie in r.cookies:
+                # `set_cookie()` acquires the jar's lock
+                jar.set_cookie(cookie)
+
+    def run_once(self):
+        """Send one request and report the result (called by a worker thread)."""
+        session = self.session
+        error = None
+        sent = received = 0
+        start = time.monotonic()
+        try:
+            resp = self._browser_session.request(self.method, self.url, **self.r_args)
+            sent, received = get_transfer_size(resp)
+            self._merge_cookies(resp)
+            if self.assert_status:
+                if resp.status_code not in self.assert_status:
+                    error = (
+                        f"HTTP status does not match {self.assert_status}: "
+                        f"{resp.status_code}"
+                    )
+            elif not resp.ok:
+                error = f"HTTP status {resp.status_code}"
+        except Exception as e:
+            error = f"{e!r}"
+        elap = time.monotonic() - start
+        self.count += 1
+        if error:
+            session.stats.error_log.log(logging.ERROR, f"{self}: {error}")
+        session.stats.report_poll(session, self.key, elap, sent, received, error)
+        return error is None
+
+
+class PollScheduler:
+    """
+    Shared scheduler that drives all :class:`Poller` instances.
+
+    One thread waits for the next due poller (using a heap), and passes it to a
+    pool of max. `MAX_WORKERS` threads, that run the blocking requests.
+    So idle pollers cost no threads, e.g. 1,000 sessions that poll every few
+    seconds only need a few workers.
+    Note that long-polling requests occupy a worker until the server responds.
+    The scheduler thread terminates when no pollers are left, the worker
+    threads are stopped by :meth:`shutdown` at the end of the run.
+    """
+
+    #: Max. number of concurrent poll requests (all sessions)
+    MAX_WORKERS = 32
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or self.MAX_WORKERS
+        self._heap = []
+        self._counter = itertools.count()  # Tie-breaker for equal due times
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="poll"
+        )
+
+    def __str__(self):
+        return f"PollScheduler<{len(self._heap)} pending>"
+
+    @classmethod
+    def get(cls):
+        """Return the shared instance."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @classmethod
+    def shutdown(cls):
+        """Close the shared instance (if any).
+
+        The next call of :meth:`get` creates a new instance.
+        """
+        with cls._instance_lock:
+            scheduler, cls._instance = cls._instance, None
+        if scheduler:
+            scheduler.close()
+
+    def close(self):
+        """Discard pending pollers and stop the worker threads.
+
+        Requests that are currently running are completed.
+        """
+        with self._cond:
+            self._closed = True
+            self._heap.clear()
+            self._cond.notify()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def schedule(self, poller, delay=0.0):
+        """Run `poller` after `delay` seconds (and then every `poller.interval`)."""
+        with self._cond:
+            if self._closed:
+                return
+            due = time.monotonic() + delay
+            heapq.heappush(self._heap, (due, next(self._counter), poller))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    name="poll_scheduler", target=self._run, daemon=True
+                )
+                self._thread.start()
+            else:
+                self._cond.notify()
+
+    def _run(self):
+        heap = self._heap
+        while True:
+            with self._cond:
+                while True:
+                    if not heap:
+                        self._thread = None
+                        return
+                    wait = heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        poller = heapq.heappop(heap)[2]
+                        break
+                    self._cond.wait(wait)
+            if poller.is_active:
+                try:
+                    self._pool.submit(self._run_poller, poller)
+                except RuntimeError:  # Closed in the meantime
+                    return
+
+    def _run_poller(self, poller):
+        try:
+            poller.run_once()
+        except Exception:
+            logger.exception(f"{poller} failed")
+        if poller.is_active:
+            self.schedule(poller, poller.interval)
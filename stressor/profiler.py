@@ -0,0 +1,187 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+Profile stressor's own hot paths (enabled by ``stressor run --profile``).
+"""
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+
+from stressor.util import check_arg, logger
+
+
+class PhaseProfiler:
+    """Collect the time that stressor spends in the phases of every activity.
+
+    Session threads call :meth:`add` with the elapsed time of a phase (or wrap
+    the phase in :meth:`phase`).
+    Timings are collected in thread-local dicts, so session threads don't
+    contend for a lock. The per-thread results are merged by :meth:`get_results`.
+
+    If `dump_path` is passed, the stacks of all session threads are sampled
+    during the run and written in the 'collapsed' format that is understood
+    by ``flamegraph.pl``, `speedscope <https://www.speedscope.app>`_, etc.
+    """
+
+    #: Phases of one activity execution, in order of execution
+    PHASES = (
+        "macros",
+        "deepcopy",
+        "prepare_execute",
+        "hooks",
+        "stats",
+        "execute",
+        "assertions",
+    )
+
+    #: (float) Stack sampling interval in seconds
+    SAMPLE_INTERVAL = 0.001
+
+    def __init__(self, dump_path=None):
+        check_arg(dump_path, str, or_none=True)
+        #: (str) optional path of a profiler dump file
+        self.dump_path = dump_path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread_results = []
+        self._samples = Counter()
+        self._sampler = None
+        self._sampler_stop = threading.Event()
+        self._session_thread_ids = set()
+
+    def __str__(self):
+        return f"PhaseProfiler<{self.dump_path}>"
+
+    def _get_thread_result(self):
+        try:
+            return self._local.result
+        except AttributeError:
+            res = self._local.result = defaultdict(lambda: [0, 0.0])
+            with self._lock:
+                self._thread_results.append(res)
+            return res
+
+    def add(self, activity_type, phase, elap):
+        """Add `elap` seconds to the `phase` of `activity_type` (thread-safe)."""
+        rec = self._get_thread_result()[(activity_type, phase)]
+        rec[0] += 1
+        rec[1] += elap
+
+    @contextmanager
+    def phase(self, activity_type, phase):
+        """Context manager that adds the time of its block to `phase`.
+
+        The time is also recorded if the block raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(activity_type, phase, time.perf_counter() - start)
+
+    def register_thread(self):
+        """Called by session threads, so their stacks are sampled."""
+        with self._lock:
+            self._session_thread_ids.add(threading.get_ident())
+
+    def start(self):
+        """Called by the run manager before sessions are started."""
+        if self.dump_path:
+            self._sampler = threading.Thread(
+                name="stressor.profiler", target=self._sample_stacks, daemon=True
+            )
+            self._sampler.start()
+
+    def stop(self):
+        """Called by the run manager when all sessions are done."""
+        if self._sampler:
+            self._sampler_stop.set()
+            self._sampler.join()
+            self._sampler = None
+        if self.dump_path:
+            self.dump()
+
+    def _sample_stacks(self):
+        samples = self._samples
+        while not self._sampler_stop.wait(self.SAMPLE_INTERVAL):
+            thread_ids = self._session_thread_ids
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in thread_ids:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                samples[";".join(reversed(stack))] += 1
+
+    def dump(self):
+        """Write collected stack samples in 'collapsed' format."""
+        path = self.dump_path
+        with open(path, "w") as fp:
+            fp.writelines(
+                f"{stack} {count}\n" for stack, count in self._samples.most_common()
+            )
+        logger.info(f"Wrote {len(self._samples):,} stack samples to {path!r}.")
+
+    def get_results(self):
+        """Return merged timings `{activity_type: {phase: [count, seconds]}}`."""
+        res = defaultdict(dict)
+        with self._lock:
+            thread_results = list(self._thread_results)
+        for thread_result in thread_results:
+            for (activity_type, phase), (count, elap) in list(thread_result.items()):
+                rec = res[activity_type].setdefault(phase, [0, 0.0])
+                rec[0] += count
+                rec[1] += elap
+        return dict(res)
+
+    def format_report(self):
+        """Return a table of the total and average time per phase and activity."""
+        results = self.get_results()
+        phases = self.PHASES
+        lines = []
+        ap = lines.append
+        ap("Profile: time per phase and activity type (total sec / µs per activity):")
+        ap(
+            "  {:<16} {:>9} ".format("Activity", "Count")
+            + " ".join(f"{p:>18}" for p in phases)
+        )
+        total_count = 0
+        total_times = defaultdict(float)
+        for activity_type, phase_map in sorted(results.items()):
+            # Macros are expanded exactly once per activity
+            count = phase_map.get("macros", (0, 0.0))[0]
+            total_count += count
+            cols = []
+            for phase in phases:
+                elap = phase_map.get(phase, (0, 0.0))[1]
+                total_times[phase] += elap
+                cols.append(_format_phase(count, elap))
+            ap(f"  {activity_type:<16} {count:>9,} " + " ".join(cols))
+        ap(
+            f"  {'Total':<16} {total_count:>9,} "
+            + " ".join(_format_phase(total_count, total_times[p]) for p in phases)
+        )
+        return "\n".join(lines)
+
+
+#: Re-usable no-op context manager, returned by :func:`profile_phase`
+_NULL_PHASE = nullcontext()
+
+
+def profile_phase(profiler, activity_type, phase):
+    """Return ``profiler.phase(...)``, or a no-op if `profiler` is None."""
+    if profiler is None:
+        return _NULL_PHASE
+    return profiler.phase(activity_type, phase)
+
+
+def _format_phase(count, elap):
+    if not count or not elap:
+        return "{:>18}".format("-")
+    return "{:>18}".format(f"{elap:.3f} / {1e6 * elap / count:,.1f}")
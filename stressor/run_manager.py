@@ -13,13 +13,20 @@ from snazzy import emoji, green, red, yellow
 
 from stressor import __version__
 from stressor.config_manager import ConfigManager
-from stressor.monitor.server import MonitorServer
-from stressor.session_manager import SessionManager, User
+from stressor.feeder import Feeder, create_feeders
+from stressor.load_profile import KneeFinder, LoadProfile
+from stressor.poll_scheduler import PollScheduler
+from stressor.profiler import PhaseProfiler
+from stressor.session_manager import SessionManager, User, iter_users
 from stressor.statistic_manager import StatisticManager
+from stressor.traffic_mix import SequenceMix
 from stressor.util import (
+    LogSampler,
+    ResultRetention,
     check_arg,
     format_elap,
     format_num,
+    format_rate,
     get_random_number,
     logger,
     set_console_ctrl_handler,
@@ -37,6 +44,8 @@ class RunManager:
     DEFAULT_OPTS = {
         "monitor": False,
         "log_summary": True,
+        "profile": False,
+        "profile_output": None,
         # "dry_run": False,
     }
     STAGES = (
@@ -60,6 +69,8 @@ class RunManager:
         "end_run",
     )
     activity_map = {}
+    #: (float) Interval in seconds to adjust the session count to the load profile
+    LOAD_PROFILE_TICK = 0.1
 
     def __init__(self):
         self.lock = threading.RLock()
@@ -87,6 +98,21 @@ class RunManager:
         self.start_stamp = None
         self.end_dt = None
         self.end_stamp = None
+        #: :class:`~stressor.profiler.PhaseProfiler` (if `--profile` was passed)
+        self.profiler = None
+        #: :class:`~stressor.load_profile.LoadProfile` (if configured)
+        self.load_profile = None
+        #: (dict) :class:`~stressor.feeder.Feeder` instances by name
+        self.feeders = {}
+        #: (dict) :class:`~stressor.traffic_mix.SequenceMix` instances by index
+        #: of the `mix` scenario entry
+        self.sequence_mixes = {}
+        # Feeder for `sessions.users` (if users are read from a CSV/JSONL file)
+        self._user_feeder = None
+        #: :class:`~stressor.util.LogSampler` for frequent log messages
+        self.log_sampler = LogSampler()
+        #: :class:`~stressor.util.ResultRetention` for `context.last_result`
+        self.result_retention = ResultRetention()
 
         # register_plugins()
         self.CURRENT_RUN_MANAGER = self
@@ -154,6 +180,8 @@ class RunManager:
                 hooks = channel_hooks
         elif generic_hooks:
             hooks = generic_hooks
+        else:
+            return result_list
         for handler in hooks:
             res = handler(channel, *args, **kwargs)
             if allow_cancel and res is False:
@@ -197,13 +225,26 @@ class RunManager:
                 format_elap(self.stats["net_act_time"], high_prec=True),
             )
         )
-        ap(
-            "Executed {:,} activities in {:,} sequences, using {:,} parallel sessions.".format(
-                self.stats["act_count"],
-                self.stats["seq_count"],
-                user_count,
+        if self.stats["load_stages"]:
+            # Sessions were started and retired by a load profile
+            user_count = max(1, self.stats["sess_running_max"])
+            ap(
+                "Executed {:,} activities in {:,} sequences, using {:,} sessions "
+                "(max. {:,} parallel).".format(
+                    self.stats["act_count"],
+                    self.stats["seq_count"],
+                    self.stats["sess_count"],
+                    user_count,
+                )
+            )
+        else:
+            ap(
+                "Executed {:,} activities in {:,} sequences, using {:,} parallel sessions.".format(
+                    self.stats["act_count"],
+                    self.stats["seq_count"],
+                    user_count,
+                )
             )
-        )
         if run_time and self.stats["seq_count"]:
             ap(
                 "Sequence duration: {} average.".format(
@@ -225,6 +266,79 @@ class RunManager:
                     format_num(self.stats["act_count"] / (run_time * user_count)),
                 )
             )
+        paced_count = self.stats.stats.get("paced_count")
+        if paced_count:
+            paced_late = self.stats.stats.get("paced_late", 0)
+            ap(
+                f"Paced iterations:  {paced_count:,}, late: {paced_late:,} "
+                f"({paced_late / paced_count:.1%})."
+            )
+        if run_time and self.stats.stats.get("bytes_received"):
+            ap(f"Transfer:          {self.stats.format_transfer(run_time)}.")
+        cache_hits = self.stats.stats.get("cache_hits", 0)
+        cache_revalidated = self.stats.stats.get("cache_revalidated", 0)
+        cache_lookups = (
+            cache_hits + cache_revalidated + self.stats.stats.get("cache_misses", 0)
+        )
+        if cache_lookups:
+            ap(
+                f"HTTP cache:        {cache_lookups:,} lookups, "
+                f"fresh: {cache_hits / cache_lookups:.1%}, "
+                f"revalidated: {cache_revalidated / cache_lookups:.1%}."
+            )
+        poll_count = self.stats.stats.get("poll_count", 0)
+        if poll_count:
+            poll_errors = self.stats.stats.get("poll_errors", 0)
+            line = f"Background polls:  {poll_count:,}, failed: {poll_errors:,}."
+            ap(red(line) if poll_errors else line)
+        ws_sent = self.stats.stats.get("ws_sent", 0)
+        ws_received = self.stats.stats.get("ws_received", 0)
+        if ws_sent or ws_received:
+            line = f"WebSocket messages: {ws_sent:,} sent, {ws_received:,} received"
+            if self.stats.stats.get("ws_rtt_count"):
+                line += ", round-trip avg: {}, max: {}".format(
+                    _format_pct(self.stats.stats["ws_rtt_time_avg"]),
+                    _format_pct(self.stats.stats["ws_rtt_time_max"]),
+                )
+            ap(line + ".")
+        for line in self.stats.format_sequence_mixes():
+            ap(f"Sequence mix {line}.")
+        system_load = self.stats.format_system_load()
+        if system_load:
+            ap(f"System load:       {'; '.join(system_load)}.")
+        if self.stats.histogram.count:
+            pct = self.stats.histogram.get_percentiles()
+            ap(
+                "Net activity times: p50: {}, p95: {}, p99: {}.".format(
+                    _format_pct(pct["p50"]),
+                    _format_pct(pct["p95"]),
+                    _format_pct(pct["p99"]),
+                )
+            )
+
+        # --- Load profile stages
+        if self.stats["load_stages"]:
+            ap("Load profile stages:")
+            for name, info in self.stats["load_stages"].items():
+                stage_elap = (info["end"] or info["start"]) - info["start"]
+                errors = info.get("errors")
+                ap(
+                    "  - {}: target {:,}, max. {:,} sessions, {}, {:,} activities "
+                    "({}/sec), avg: {}, p95: {}, p99: {}{}".format(
+                        name,
+                        info["target"],
+                        info["sess_running_max"],
+                        format_elap(stage_elap),
+                        info.get("act_count", 0),
+                        format_rate(info.get("act_count"), stage_elap),
+                        format_elap(info.get("act_time_avg", 0), high_prec=True),
+                        _format_pct(info.get("p95")),
+                        _format_pct(info.get("p99")),
+                        red(f", {errors} errors") if errors else "",
+                    )
+                )
+            if isinstance(self.load_profile, KneeFinder):
+                ap(self.load_profile.format_result())
 
         # --- List of all activities that are marked `monitor: true`
         if self.stats["monitored"]:
@@ -247,6 +361,18 @@ class RunManager:
                     )
                 )
 
+        # --- Most frequent errors
+        top_errors = self.stats.get_top_errors(5)
+        if top_errors:
+            ap("Top errors:")
+            for fingerprint, info in top_errors:
+                ap(red(f"  - {info['count']:,} x {fingerprint}"))
+            suppressed = self.stats.error_log.suppressed
+            if suppressed:
+                ap(
+                    f"  ({suppressed:,} error messages were not logged due to rate limit)"
+                )
+
         if has_errors:
             pics = emoji(" 💥 💔 💥", "")
             ap(
@@ -299,16 +425,17 @@ class RunManager:
         else:
             elap = datetime.now() - self.start_dt
             res["endTimeStr"] = f"(running for {format_elap(elap.total_seconds())}...)"
+        res["transferStr"] = self.stats.format_transfer(elap.total_seconds())
 
         return res
 
     def log_info(self, *args, **kwargs):
         self.publish("log", level="info", *args, **kwargs)
 
-    def load_config(self, run_config_file):
+    def load_config(self, run_config_file, use_cache=False):
         """Load configuration file and set shortcuts."""
         cr = ConfigManager(self.stats)
-        cr.read(run_config_file, load_files=True)
+        cr.read(run_config_file, load_files=True, use_cache=use_cache)
 
         self.config_manager = cr
         # self.run_config = cr.run_config
@@ -317,6 +444,8 @@ class RunManager:
     def _run_one(self, session_manager):
         """Run inside a separate thread."""
         try:
+            if self.profiler:
+                self.profiler.register_thread()
             session_manager.run()
             # We don't need to print results if only one session was run, since
             # it is also part of the global stats:
@@ -339,32 +468,63 @@ class RunManager:
             # raise
         return
 
-    def run_in_threads(self, user_list, context):
+    def _create_session_thread(self, context, name, user):
+        sess = SessionManager(
+            self, context, name, user, session_index=self.stats["sess_count"]
+        )
+        self.session_list.append(sess)
+        t = threading.Thread(name=name, target=self._run_one, args=[sess])
+        t.daemon = True  # Required to make Ctrl-C work
+        return sess, t
+
+    def _release_session(self, sess):
+        """Forget a session whose thread has terminated (stats are aggregated)."""
+        self.session_list.remove(sess)
+        self.stats.release_session(sess)
+
+    def _finalize_run(self, start_run):
+        self.set_stage("done")
+        elap = time.monotonic() - start_run
+
+        # self.stats.add_timing("run", elap)
+        self.stats.report_end(None, None, None)
+
+        self.publish("end_run", run_manager=self, elap=elap)
+
+        logger.debug(f"Results for {self}:\n{self.stats.format_result()}")
+
+        return not self.has_errors()
+
+    def run_in_threads(self, user_iter, context, count):
+        """Run `count` sessions in parallel threads.
+
+        Sessions are created on demand, right before their thread is started.
+
+        Args:
+            user_iter (iterator): iterator of :class:`User` objects
+            context (dict):
+            count (int): number of sessions
+        """
         self.publish("start_run", run_manager=self)
         self.stop_request.clear()
         thread_list = []
         self.session_list = []
-        for i, user in enumerate(user_list, 1):
-            name = f"t{i:02}"
-            sess = SessionManager(self, context, name, user)
-            self.session_list.append(sess)
-            t = threading.Thread(name=name, target=self._run_one, args=[sess])
-            t.daemon = True  # Required to make Ctrl-C work
-            thread_list.append(t)
 
-        logger.info(f"Starting {len(thread_list)} session workers...")
+        logger.info(f"Starting {count} session workers...")
         self.set_stage("running")
         self.stats.report_start(None, None, None)
 
         ramp_up_delay = self.config_manager.sessions.get("ramp_up_delay")
 
         start_run = time.monotonic()
-        for i, t in enumerate(thread_list):
+        for i, user in enumerate(itertools.islice(user_iter, count)):
             if ramp_up_delay and i > 1:
                 delay = get_random_number(ramp_up_delay)
                 logger.info(f"Ramp-up delay for t{i:02}: {delay:.2f} seconds...")
                 time.sleep(delay)
+            _sess, t = self._create_session_thread(context, f"t{i + 1:02}", user)
             t.start()
+            thread_list.append(t)
 
         logger.important(
             f"All {len(thread_list)} sessions running, waiting for them to terminate..."
@@ -372,17 +532,110 @@ class RunManager:
         for t in thread_list:
             t.join()
 
-        self.set_stage("done")
-        elap = time.monotonic() - start_run
+        return self._finalize_run(start_run)
 
-        # self.stats.add_timing("run", elap)
-        self.stats.report_end(None, None, None)
+    def run_load_profile(self, load_profile, user_iter, context):
+        """Start and retire sessions, so the session count follows a load profile.
 
-        self.publish("end_run", run_manager=self, elap=elap)
+        Sessions that finish their scenario early are replaced by new ones.
+        Surplus sessions are retired gracefully, i.e. they finish the current
+        sequence and run the 'end' sequence.
+        No more sessions are started when `config.max_time` or
+        `config.max_errors` is reached.
 
-        logger.debug(f"Results for {self}:\n{self.stats.format_result()}")
+        Args:
+            load_profile (LoadProfile):
+            user_iter (iterator): endless iterator of :class:`User` objects
+            context (dict):
+        """
+        check_arg(load_profile, LoadProfile)
+        self.publish("start_run", run_manager=self)
+        self.stop_request.clear()
+        self.session_list = []
+        # (session, thread) of sessions that are not retired, oldest first
+        active = []
+        retired = []
+        session_idx = 0
 
-        return not self.has_errors()
+        duration = format_elap(load_profile.duration)
+        logger.important(f"Running {load_profile} (max. {duration})...")
+        self.set_stage("running")
+        self.stats.report_start(None, None, None)
+
+        start_run = time.monotonic()
+        cur_stage = None
+        while not self.stop_request.is_set():
+            stage, target = load_profile.get_target(time.monotonic() - start_run)
+            if stage is None:
+                break
+            limit_msg = self._check_run_limits()
+            if limit_msg:
+                logger.warning(yellow(f"{limit_msg}: stopping load profile..."))
+                break
+            if stage is not cur_stage:
+                cur_stage = stage
+                logger.important(
+                    "Enter load stage '{}': {} -> {} sessions in {}.".format(
+                        stage["name"],
+                        stage["start_level"],
+                        stage["target"],
+                        format_elap(stage["duration"]),
+                    )
+                )
+                self.stats.enter_load_stage(stage["name"], stage["target"])
+
+            # Forget sessions that completed their scenario (or were retired)
+            for sess, t in active + retired:
+                if not t.is_alive():
+                    self._release_session(sess)
+            active = [(s, t) for s, t in active if t.is_alive()]
+            retired = [(s, t) for s, t in retired if t.is_alive()]
+
+            while len(active) < target:
+                session_idx += 1
+                sess, t = self._create_session_thread(
+                    context, f"t{session_idx:02}", next(user_iter)
+                )
+                t.start()
+                active.append((sess, t))
+
+            while len(active) > target:
+                # Retire the youngest sessions first
+                sess, t = active.pop()
+                sess.retire()
+                retired.append((sess, t))
+
+            self.stop_request.wait(self.LOAD_PROFILE_TICK)
+
+        self.stats.enter_load_stage(None, 0)
+        logger.important(
+            f"Load profile finished, waiting for {len(active)} sessions to terminate..."
+        )
+        for sess, t in active:
+            sess.retire()
+        for _sess, t in retired:
+            t.join()
+        for _sess, t in active:
+            t.join()
+
+        return self._finalize_run(start_run)
+
+    def _check_run_limits(self):
+        """Return a message if `config.max_time` or `config.max_errors` (or a
+        session's run limit) was reached, else None."""
+        config = self.config_manager.config
+        max_time = float(config.get("max_time", 0.0))
+        max_errors = int(config.get("max_errors", 0))
+        if max_time and self.get_run_time() > max_time:
+            msg = f"Reached max. run time limit of {max_time}"
+        elif max_errors and self.stats.error_count() >= max_errors:
+            msg = f"Reached max. error limit of {max_errors}"
+        elif self.stats.stats["run_limit_reached"]:
+            msg = "A session reached a run limit"
+        else:
+            return None
+        self.stats.report_limit_violation(f"{msg}: stopping...")
+        return msg
 
     def run(self, options, extra_context=None):
         """Run the current
@@ -398,6 +651,9 @@ class RunManager:
 
         self.options.update(options)
 
+        if self.options.get("profile") or self.options.get("profile_output"):
+            self.profiler = PhaseProfiler(self.options.get("profile_output"))
+
         if extra_context:
             self.config_manager.update_config(extra_context)
 
@@ -405,22 +661,58 @@ class RunManager:
         sessions = self.config_manager.sessions
 
         count = int(sessions.get("count", 1))
-        if count > 1 and self.config_manager.config.get("force_single"):
-            logger.info("force_single: restricting sessions count to one.")
+        load_profile = sessions.get("load_profile")
+        find_knee = sessions.get("find_knee")
+        if self.config_manager.config.get("force_single"):
+            if count > 1:
+                logger.info("force_single: restricting sessions count to one.")
+            if load_profile or find_knee:
+                logger.info("force_single: ignoring `load_profile` and `find_knee`.")
             count = 1
+            load_profile = find_knee = None
+        if find_knee:
+            load_profile = KneeFinder(find_knee, self.stats)
+        elif load_profile:
+            load_profile = LoadProfile(load_profile)
+        self.load_profile = load_profile
+        self.sequence_mixes = {}
+        for idx, seq_def in enumerate(self.config_manager.scenario):
+            if "mix" in seq_def:
+                mix = SequenceMix(
+                    seq_def["mix"],
+                    seq_def.get("transitions"),
+                    name=seq_def.get("name", f"mix_{len(self.sequence_mixes) + 1}"),
+                )
+                self.sequence_mixes[idx] = mix
+                self.stats.register_sequence_mix(mix.name, mix.target)
+        self.log_sampler = LogSampler(self.config_manager.config.get("log_sampling"))
+        self.result_retention = ResultRetention(
+            self.config_manager.config.get("result_retention")
+        )
 
         # Construct a `User` with at least 'name', 'password', and optional
-        # custom attributes
-        user_list = []
-        for user_dict in sessions["users"]:
-            user = User(**user_dict)
-            user_list.append(user)
+        # custom attributes.
         # We have N users and want `count` sessions: re-use round-robin
-        user_list = itertools.islice(itertools.cycle(user_list), 0, count)
-        user_list = list(user_list)
+        users = sessions["users"]
+        if isinstance(users, str):
+            # Read users from a CSV or JSONL file, as sessions are started
+            self._user_feeder = Feeder(
+                "users", self.config_manager.resolve_path(users), mode="circular"
+            )
+            user_iter = iter_users(self._user_feeder)
+        else:
+            user_iter = itertools.cycle([User(**user_dict) for user_dict in users])
+
+        # Use one feeder partition per (max.) concurrent session
+        self.feeders = create_feeders(
+            self.config_manager,
+            partitions=load_profile.max_target if load_profile else count,
+        )
 
         monitor = None
         if self.options.get("monitor"):
+            from stressor.monitor.server import MonitorServer
+
             monitor = MonitorServer(self)
             monitor.start()
             time.sleep(0.5)
@@ -430,10 +722,15 @@ class RunManager:
         self.start_dt = datetime.now()
         self.end_dt = None
         self.end_stamp = None
+        if self.profiler:
+            self.profiler.start()
         try:
             try:
                 res = False
-                res = self.run_in_threads(user_list, context)
+                if load_profile:
+                    res = self.run_load_profile(load_profile, user_iter, context)
+                else:
+                    res = self.run_in_threads(user_iter, context, count)
             except KeyboardInterrupt:
                 # if not self.stop_request.is_set():
                 logger.warning("Caught Ctrl-C: terminating...")
@@ -441,9 +738,13 @@ class RunManager:
             finally:
                 self.end_dt = datetime.now()
                 self.end_stamp = time.monotonic()
+                if self.profiler:
+                    self.profiler.stop()
 
             if self.options.get("log_summary", True):
                 logger.important(self.get_cli_summary())
+            if self.profiler:
+                logger.important(self.profiler.format_report())
 
             if monitor:
                 self.set_stage("waiting")
@@ -452,6 +753,12 @@ class RunManager:
         finally:
             if monitor:
                 monitor.shutdown()
+            for feeder in self.feeders.values():
+                feeder.close()
+            if self._user_feeder:
+                self._user_feeder.close()
+            # Stop the worker threads of background pollers (if any)
+            PollScheduler.shutdown()
 
             # print("RES", res, self.has_errors(), self.stats.format_result())
             self.set_stage("stopped")
@@ -467,3 +774,9 @@ class RunManager:
 
     def get_run_time(self):
         return time.monotonic() - self.start_stamp
+
+
+def _format_pct(val):
+    if val is None:
+        return "n.a."
+    return format_elap(val, high_prec=True)
@@ -2,22 +2,32 @@
 # Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
 """
 """
+import logging
+import random
 import re
+import threading
 import time
-from copy import deepcopy
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy, deepcopy
+from types import MappingProxyType
 
-import requests
 from snazzy import red, yellow
 
 from stressor.config_manager import replace_var_macros
 from stressor.context_stack import ContextStack
+from stressor.feeder import FeederExhaustedError
+from stressor.http_cache import HttpCache
 from stressor.plugins.base import ActivityAssertionError
+from stressor.profiler import profile_phase
+from stressor.statistic_manager import get_error_fingerprint
 from stressor.util import (
     NO_DEFAULT,
     StressorError,
     check_arg,
     get_dict_attr,
     logger,
+    parse_duration,
     shorten_string,
 )
 
@@ -30,21 +40,110 @@ class SkippedError(StressorError):
     """Raised when an activity is skipped due to `max_errors` or `max_time`."""
 
 
+def _get_header_size(headers):
+    return sum(len(k) + len(v) + 4 for k, v in headers.items()) + 2
+
+
+def get_transfer_size(resp):
+    """Return `(sent, received)`, the approx. number of bytes on the wire.
+
+    Sizes include the request or status line and headers. The received body
+    size is the (possibly compressed) length that was read from the socket.
+    Note that this reads the response content.
+    """
+    req = resp.request
+    body = req.body
+    if body is None:
+        body_size = 0
+    elif isinstance(body, (bytes, str)):
+        body_size = len(body)
+    else:  # File or generator: rely on the header, if any
+        body_size = int(req.headers.get("Content-Length", 0))
+    sent = len(req.method) + len(req.path_url) + 11  # 'GET / HTTP/1.1\r\n'
+    sent += _get_header_size(req.headers) + body_size
+
+    content = resp.content
+    try:
+        body_size = resp.raw.tell()
+    except AttributeError:
+        body_size = 0
+    if not isinstance(body_size, int) or body_size <= 0:
+        body_size = len(content or b"")
+    received = 15 + len(resp.reason or "")  # 'HTTP/1.1 200 OK\r\n'
+    received += _get_header_size(resp.headers) + body_size
+    return sent, received
+
+
 class User:
-    def __init__(self, name, password, **kwargs):
+    """A virtual user with `name`, `password`, and optional custom attributes.
+
+    Instances use `__slots__` and keep custom attributes as tuple of values,
+    plus a dict that maps attribute names to indexes. The latter is shared by
+    all users that are read from the same file, so large user lists stay small.
+    Other attributes may be set as usual (e.g. by scripts): they are stored in
+    ``__dict__``, which is only allocated on demand.
+    """
+
+    __slots__ = ("__dict__", "_keys", "_values", "name", "password")
+
+    #: Shared (read-only) key map for users without custom attributes
+    _NO_KEYS = MappingProxyType({})
+
+    def __init__(self, name, password=None, **kwargs):
         self.name = name
         self.password = password
-        for arg_name, arg_val in kwargs.items():
-            assert type(arg_name) in (int, float, str)
-            setattr(self, arg_name, arg_val)
+        if kwargs:
+            for arg_name in kwargs:
+                assert type(arg_name) in (int, float, str)
+            self._keys = {k: i for i, k in enumerate(kwargs)}
+            self._values = tuple(kwargs.values())
+        else:
+            self._keys = self._NO_KEYS
+            self._values = ()
         return
 
+    @classmethod
+    def from_values(cls, name, password, keys, values):
+        """Create a user with custom attributes, using a shared `keys` dict."""
+        user = cls(name, password)
+        user._keys = keys
+        user._values = values
+        return user
+
+    def __deepcopy__(self, memo):
+        # The key map is never modified, so copies can share it
+        res = self.from_values(
+            self.name, self.password, self._keys, deepcopy(self._values, memo)
+        )
+        if self.__dict__:
+            res.__dict__.update(deepcopy(self.__dict__, memo))
+        return res
+
+    def __getattr__(self, name):
+        # Only called if the regular lookup failed. Dunder names and unset
+        # slots must fail, e.g. when `copy` probes a new, empty instance
+        if name.startswith("__") or name in self.__slots__:
+            raise AttributeError(name)
+        try:
+            return self._values[self._keys[name]]
+        except KeyError:
+            raise AttributeError(
+                f"{type(self).__name__!r} object has no attribute {name!r}"
+            ) from None
+
     def __str__(self):
         return f"User<{self.name}>"
 
     # Provide nicer display for pprint(), etc.
     __repr__ = __str__
 
+    @property
+    def attributes(self):
+        """Return a dict of custom attributes (besides `name` and `password`)."""
+        res = dict(zip(self._keys, self._values))
+        res.update(self.__dict__)
+        return res
+
     @property
     def auth(self):
         """Return (name, password) tuple or None."""
@@ -53,6 +152,87 @@ class User:
         return (self.name, self.password)
 
 
+def check_user_def(user_def):
+    """Validate a user definition (a dict with 'name' and optional 'password').
+
+    Raises:
+        ValueError
+    """
+    if not isinstance(user_def, dict):
+        raise ValueError(f"Expected a dict, but found {type(user_def)!r}")
+    if not isinstance(user_def.get("name"), str) or not user_def["name"]:
+        raise ValueError("Expected a non-empty string `name`")
+    if not isinstance(user_def.get("password"), (str, type(None))):
+        raise ValueError("Expected a string or null `password`")
+
+
+def check_users_file(feeder):
+    """Validate the header (CSV) or first row (JSONL) of a users file.
+
+    Raises:
+        ValueError
+    """
+    if feeder.format == "csv":
+        if "name" not in feeder.fieldnames:
+            raise ValueError(f"{feeder.path} must have a 'name' column")
+        return
+    try:
+        row = feeder.next_row()
+    except FeederExhaustedError:
+        raise ValueError(f"{feeder.path} has no users") from None
+    check_user_def(row)
+
+
+def iter_users(feeder):
+    """Yield :class:`User` objects from a CSV or JSONL :class:`Feeder`.
+
+    CSV files must have a 'name' column and may have a 'password' column.
+    Other columns become custom user attributes.
+    JSONL rows are dicts with 'name' and optional 'password' entries, other
+    entries become custom user attributes.
+    Users are created on demand, so large files are not loaded into memory.
+    Invalid rows are logged and skipped (the file is validated by
+    :func:`check_users_file` when the configuration is loaded).
+    """
+    if feeder.format == "jsonl":
+        # Users with the same attribute names share one key map
+        key_maps = {}
+        while True:
+            row = feeder.next_row()
+            try:
+                check_user_def(row)
+            except ValueError as e:
+                logger.error(f"{feeder.path}: skipping invalid user {row!r}: {e}")
+                continue
+            row = dict(row)
+            name = row.pop("name")
+            password = row.pop("password", None)
+            names = tuple(row)
+            keys = key_maps.get(names)
+            if keys is None:
+                keys = key_maps[names] = {k: i for i, k in enumerate(names)}
+            yield User.from_values(name, password, keys, tuple(row.values()))
+
+    fieldnames = feeder.fieldnames
+    if "name" not in fieldnames:
+        raise StressorError(f"{feeder.path} must have a 'name' column")
+    name_idx = fieldnames.index("name")
+    pw_idx = fieldnames.index("password") if "password" in fieldnames else None
+    extra_idx = [i for i in range(len(fieldnames)) if i not in (name_idx, pw_idx)]
+    keys = {fieldnames[i]: n for n, i in enumerate(extra_idx)}
+    while True:
+        values = feeder.next_values()
+        if len(values) != len(fieldnames) or not values[name_idx]:
+            logger.error(f"{feeder.path}: skipping invalid user {values!r}")
+            continue
+        yield User.from_values(
+            values[name_idx],
+            None if pw_idx is None else values[pw_idx],
+            keys,
+            tuple(values[i] for i in extra_idx),
+        )
+
+
 class SessionHelper:
     """Passed to script activities."""
 
@@ -75,50 +255,88 @@ class SessionManager:
     # #: (float)
     # DEFAULT_REQUEST_TIMEOUT = 10.0
 
-    def __init__(self, run_manager, context, session_id, user):
+    #: (int) Default size of the worker pool for `parallel:` blocks (like the
+    #: max. number of connections per host of a browser).
+    #: Every session that runs a `parallel:` block creates its own pool, so
+    #: 1,000 sessions may use up to 6,000 additional threads
+    PARALLEL_WORKERS = 6
+
+    def __init__(self, run_manager, context, session_id, user, session_index=0):
         # check_arg(run_manager, RunManager)
         check_arg(context, dict)
         check_arg(session_id, str)
         check_arg(user, User, or_none=True)
+        check_arg(session_index, int)
 
         #: The :class:`RunManager` object that holds global settings and definitions
         self.run_manager = run_manager
         config = run_manager.config_manager.config
 
         # (dict) Global variables for this session. Initialized from the
-        # run configuration, but not shared between sessions.
+        # run configuration, but not shared between sessions: the context stack
+        # stores modified entries per session, so `context` is not changed.
         # (`self.context` is accessible by the respective property below.)
-        context = context.copy()
         #: (str) Unique ID string for this session
         self.session_id = session_id
+        #: (int) 0-based index of this session (used to select feeder partitions)
+        self.session_index = session_index
         #: The :class:`User` object that is assigned to this session
         self.user = user or User("anonymous", "")
         #: (dict) Copy of `run_config.sessions` configuration
         self.sessions = run_manager.config_manager.sessions.copy()
+        #: (dict) Background :class:`~stressor.poll_scheduler.Poller` instances
+        #: of `PollRequest` activities by name
+        self.pollers = {}
         #: (dict) Activities can store per-session data here.
         #: Note that the activity objects are instintiated only once and shared
         #: by all sessions.
         self.data = {}
+        #: (:class:`random.Random`) Random generator of this session (reproducible
+        #: if `config.random_seed` is set), e.g. to choose sequences of a `mix`
+        seed = config.get("random_seed")
+        self.random = random.Random(None if seed is None else f"{seed}:{session_id}")
         #: (bool) True: only simulate activities
         self.dry_run = bool(context.get("dry_run"))
         #: (int) Verbosity 0..5
         self.verbose = context.get("verbose", 3)
         #: (:class:`threading.Event`)
         self.stop_request = run_manager.stop_request
-
-        # Set some default entries in context dict
-        # context.setdefault("timeout", self.DEFAULT_REQUEST_TIMEOUT)
-        context.setdefault("session_id", self.session_id)
-        context.setdefault("user", self.user)
+        #: :class:`~stressor.throttle.Throttle` that simulates a slow network
+        #: link for this session (None: unlimited, set when the session starts)
+        self.throttle = None
+        #: (:class:`threading.Event`) Set by the load profile controller to
+        #: finish the current sequence, then run 'end' and stop this session
+        self.retire_request = threading.Event()
 
         #: The :class:`~stressor.context_stack.ContextStack` object that reflects the current execution path
         self.context_stack = ContextStack(run_manager.host_id, context)
         self.context_stack.push(run_manager.process_id)
         self.context_stack.push(session_id)
+
+        # Set some default entries in context dict
+        context = self.context_stack.context
+        # context.setdefault("timeout", self.DEFAULT_REQUEST_TIMEOUT)
+        context.setdefault("session_id", self.session_id)
+        context.setdefault("user", self.user)
         #: :class:`~stressor.statistic_manager.StatisticManager` object that containscurrent execution path
         self.stats = run_manager.stats
         # Lazy initialization using a property
         self._browser_session = None
+        self._http_cache = None
+        # Bytes transferred by the pending activity (see `pop_transfer()`)
+        self._transfer_lock = threading.Lock()
+        self._bytes_sent = 0
+        self._bytes_received = 0
+        # Bytes transferred by branches of the pending `parallel:` block (see
+        # `pop_branch_transfer()`)
+        self._branch_bytes_sent = 0
+        self._branch_bytes_received = 0
+        # Worker pool for `parallel:` blocks (created on demand)
+        self._parallel_pool = None
+        # `branch` attribute is set while a worker thread runs a branch
+        self._branch_local = threading.local()
+        #: (:class:`SessionManager`) The session of a branch (None: not a branch)
+        self.parent = None
 
         #: (int) Stop session if global error count > X
         #: Passing `--max-errors` will override this.
@@ -128,6 +346,8 @@ class SessionManager:
         #: Passing `--max-time` will override this.
         self.max_time = float(config.get("max_time", 0.0))
         self._cancelled_seq = None
+        # Branches of `parallel:` blocks check the limits concurrently
+        self._limit_lock = threading.Lock()
 
         # Used by StatisticsManager
         self.pending_sequence = None
@@ -135,6 +355,13 @@ class SessionManager:
         self.pending_activity = None
         self.activity_start = None
 
+        #: :class:`~stressor.profiler.PhaseProfiler` (if `--profile` was passed)
+        self.profiler = run_manager.profiler
+        #: :class:`~stressor.util.LogSampler` for frequent log messages
+        self.log_sampler = run_manager.log_sampler
+        #: :class:`~stressor.util.ResultRetention` for `context.last_result`
+        self.result_retention = run_manager.result_retention
+
         self.stats.register_session(self)
 
     def __str__(self):
@@ -151,6 +378,23 @@ class SessionManager:
         replace_var_macros(kwargs, context)
         return kwargs
 
+    def stop_pollers(self):
+        """Stop all background pollers of this session."""
+        for poller in self.pollers.values():
+            poller.stop()
+        self.pollers.clear()
+
+    def retire(self):
+        """Gracefully stop this session (used by load profiles).
+
+        The current sequence loop is finished, then the 'end' sequence is run.
+        """
+        self.retire_request.set()
+
+    @property
+    def is_retiring(self):
+        return self.retire_request.is_set()
+
     def make_session_helper(self):
         """Return a :class:`SessionHelper` instance for this session."""
         res = SessionHelper(self)
@@ -160,9 +404,76 @@ class SessionManager:
     def browser_session(self):
         """Return a ``requests.Session`` instance for this session."""
         if self._browser_session is None:
-            self._browser_session = requests.Session()
+            import requests
+
+            bs = requests.Session()
+            bs.hooks["response"].append(self._on_response)
+            throttle = self.throttle
+            if throttle:
+                from stressor.throttle import ThrottledHTTPAdapter
+
+                adapter = ThrottledHTTPAdapter(throttle, stop_event=self.stop_request)
+                bs.mount("http://", adapter)
+                bs.mount("https://", adapter)
+            self._browser_session = bs
         return self._browser_session
 
+    def _on_response(self, resp, *args, **kwargs):
+        """Response hook of :attr:`browser_session` that counts transfer sizes."""
+        sent, received = get_transfer_size(resp)
+        # The browser session is shared with branches of `parallel:` blocks
+        target = getattr(self._branch_local, "branch", None) or self
+        target.add_transfer(sent, received)
+
+    def add_transfer(self, sent, received):
+        """Add bytes that were transferred by the pending activity.
+
+        This is thread-safe, so activities that use worker threads may call it.
+        """
+        with self._transfer_lock:
+            self._bytes_sent += sent
+            self._bytes_received += received
+        parent = self.parent
+        if parent is not None:
+            # Also account the bytes to the `parallel:` block
+            with parent._transfer_lock:
+                parent._branch_bytes_sent += sent
+                parent._branch_bytes_received += received
+
+    def pop_transfer(self):
+        """Return and reset `(sent, received)` (called when an activity ends)."""
+        with self._transfer_lock:
+            res = (self._bytes_sent, self._bytes_received)
+            self._bytes_sent = self._bytes_received = 0
+        return res
+
+    def pop_branch_transfer(self):
+        """Return and reset `(sent, received)` of the branches of the pending
+        `parallel:` block.
+
+        These bytes are also reported by the child activities, so they are
+        only added to the block's `monitor` statistics.
+        """
+        with self._transfer_lock:
+            res = (self._branch_bytes_sent, self._branch_bytes_received)
+            self._branch_bytes_sent = self._branch_bytes_received = 0
+        return res
+
+    @property
+    def http_cache(self):
+        """Return a :class:`~stressor.http_cache.HttpCache` instance or None.
+
+        The cache is only used if `sessions.http_cache` is enabled.
+        """
+        if self._http_cache is None:
+            size_mb = self.sessions.get("http_cache", False)
+            if not size_mb:
+                return None
+            if size_mb is True:
+                size_mb = HttpCache.DEFAULT_SIZE_MB
+            self._http_cache = HttpCache(size_mb * 1024 * 1024)
+        return self._http_cache
+
     @property
     def context(self):
         return self.context_stack.context
@@ -198,6 +509,13 @@ class SessionManager:
         Returns:
             (bool) false if the current operation should be skipped.
         """
+        if self.parent is not None:
+            # Branches of `parallel:` blocks share the state of their session
+            return self.parent.check_run_limits(seq_name)
+        with self._limit_lock:
+            return self._check_run_limits(seq_name)
+
+    def _check_run_limits(self, seq_name):
         cs = self._cancelled_seq
         err_limit_reached = (
             # Compare max_errors against global error count
@@ -232,38 +550,64 @@ class SessionManager:
         """Called by session runner before activities is executed."""
         path = self.context_stack.path()
         self.stats.report_start(self, sequence, activity, path=path)
-        logger.info("{} {}".format("DRY-RUN" if self.dry_run else "Execute", path))
+        if logger.isEnabledFor(logging.INFO) and self.log_sampler.check("activity"):
+            logger.info("{} {}".format("DRY-RUN" if self.dry_run else "Execute", path))
 
-    def report_activity_error(self, sequence, activity, activity_args, exc):
-        """Called session runner when activity `execute()` or assertions raise an error."""
+    def report_activity_error(
+        self, sequence, activity, activity_args, exc, result=None
+    ):
+        """Called session runner when activity `execute()` or assertions raise an error.
+
+        Args:
+            result (any): the complete activity result if `execute()` returned
+                (`last_result` may be reduced by ``config.result_retention``)
+
+        Returns:
+            (bool) True if the error was recorded with full details
+        """
         # self.stats.inc("errors")
 
         if isinstance(exc, SkippedError):
             logger.warning(yellow(f"Skipped {activity}"))
             self.pending_activity = None
-            return
-
-        # Create a copy of the current context, so we can shorten values
-        context = self.context_stack.context.copy()
-        context["last_result"] = shorten_string(context.get("last_result"), 500, 100)
-
-        msg = []
-        # msg.append("{} {}: {!r}:".format(self.context_stack, activity, exc))
-        # msg.append("{!r}:".format(exc))
-        msg.append(f"{exc!r}:")
-        if isinstance(exc, ActivityAssertionError):
-            msg.append("Failed assertions:")
-            for err in exc.assertion_list:
-                msg.append(f"  - {err}")
-        msg.append(f"Execution path: {self.context_stack}")
-        msg.append(f"Activity: {activity}")
-        msg.append(f"Activity args: {activity_args}")
-        msg.append(f"Context: {context}")
-
-        msg = "\n    ".join(msg)
-        logger.error(red(msg))
+            return False
+
+        # Similar errors are grouped, and only the first ones are formatted
+        # with full details (which is expensive during error storms)
+        fingerprint = get_error_fingerprint(exc, activity)
+        is_sample = self.stats.count_error_fingerprint(fingerprint)
+        if is_sample:
+            # Create a copy of the current context, so we can shorten values
+            context = self.context_stack.context.copy()
+            if result is None:
+                result = context.get("last_result")
+            context["last_result"] = shorten_string(result, 500, 100)
+
+            msg = []
+            # msg.append("{} {}: {!r}:".format(self.context_stack, activity, exc))
+            # msg.append("{!r}:".format(exc))
+            msg.append(f"{exc!r}:")
+            if isinstance(exc, ActivityAssertionError):
+                msg.append("Failed assertions:")
+                for err in exc.assertion_list:
+                    msg.append(f"  - {err}")
+            msg.append(f"Execution path: {self.context_stack}")
+            msg.append(f"Activity: {activity}")
+            msg.append(f"Activity args: {activity_args}")
+            msg.append(f"Context: {context}")
+
+            msg = "\n    ".join(msg)
+            self.stats.add_error_sample(fingerprint, msg)
+        else:
+            if isinstance(exc, ActivityAssertionError):
+                detail = exc.assertion_list[0]
+            else:
+                detail = str(exc)
+            msg = f"{fingerprint}: {shorten_string(detail, 200, 50)}"
+
+        self.stats.error_log.log(logging.ERROR, red(msg))
         self.stats.report_error(self, sequence, activity, error=msg)
-        return
+        return is_sample
 
     def report_activity_result(self, sequence, activity, activity_args, result, elap):
         """Called session runner when activity `execute()` completes."""
@@ -309,6 +653,18 @@ class SessionManager:
             raise ActivityAssertionError(errors)
         return
 
+    def _feed_iteration(self, seq_name):
+        """Set `context.feed.NAME` to the next row of all active feeders.
+
+        Raises:
+            FeederExhaustedError
+        """
+        feed = self.context_stack.context["feed"]
+        for name, feeder in self.run_manager.feeders.items():
+            if feeder.wants_sequence(seq_name):
+                feed[name] = feeder.next_row(self.session_index)
+        return
+
     def run_sequence(self, seq_name, sequence):
         stack = self.context_stack
         context = stack.context
@@ -322,31 +678,62 @@ class SessionManager:
         self.stats.report_start(self, seq_name, None)
         start_sequence = time.monotonic()
         for act_idx, activity_args in enumerate(sequence, 1):
-            # activity_args["activity"] is an instance of ActivityBase that
-            # we want to re-use it for every session.
-            # The rest of activity_args is copied, so session data is separated
-            activity = activity_args["activity"]
+            self.run_activity(seq_name, sequence, act_idx, activity_args)
+
+        elap = time.monotonic() - start_sequence
+        self.stats.report_end(self, seq_name, None)
+        self.publish(
+            "end_sequence",
+            session=self,
+            sequence=sequence,
+            path=stack,
+            elap=elap,
+        )
+        context["last_result"] = None
+        return not self.has_errors()
+
+    def run_activity(self, seq_name, sequence, act_idx, activity_args):
+        """Execute one activity of a sequence, including hooks and stats.
+
+        Errors are reported, but not raised.
+
+        Returns:
+            (any, Exception) the result and the error (or None)
+        """
+        stack = self.context_stack
+        context = stack.context
+        profiler = self.profiler
+
+        # activity_args["activity"] is an instance of ActivityBase that
+        # we want to re-use it for every session.
+        # The rest of activity_args is copied, so session data is separated
+        activity = activity_args["activity"]
+        act_type = activity.get_script_name() if profiler else None
+        with profile_phase(profiler, act_type, "deepcopy"):
             activity_args = deepcopy(activity_args)
             activity_args.pop("activity")
 
-            # Add activity info to path
-            # Note: `get_info()` is not as detailed as it could, since we don't
-            # pass the expanded args here. We set it anyway, so we have a valid
-            # stack in case `_evaluate_macros()` blows.
-            with stack.enter(f"#{act_idx:02}-{activity.get_info(session=self)}"):
+        # Add activity info to path
+        # Note: `get_info()` is not as detailed as it could, since we don't
+        # pass the expanded args here. We set it anyway, so we have a valid
+        # stack in case `_evaluate_macros()` blows.
+        with stack.enter(f"#{act_idx:02}-{activity.get_info(session=self)}"):
+            with profile_phase(profiler, act_type, "macros"):
                 expanded_args = self._evaluate_macros(activity_args, context)
 
-                # Let activity do internal calculations, that might be used by
-                # the follwing call to `get_info()`
+            # Let activity do internal calculations, that might be used by
+            # the follwing call to `get_info()`
+            with profile_phase(profiler, act_type, "prepare_execute"):
                 activity.prepare_execute(self, expanded_args)
 
-                # Enhance the path info with expanded args
-                stack.set_last_part(
-                    activity.get_info(expanded_args=expanded_args, session=self)
-                )
+            # Enhance the path info with expanded args
+            stack.set_last_part(
+                activity.get_info(expanded_args=expanded_args, session=self)
+            )
 
-                error = None
-                result = None
+            error = None
+            result = None
+            with profile_phase(profiler, act_type, "hooks"):
                 self.publish(
                     "start_activity",
                     session=self,
@@ -356,18 +743,23 @@ class SessionManager:
                     context=context,
                     path=stack,
                 )
-                start_activity = time.monotonic()
+            start_activity = time.monotonic()
 
+            with profile_phase(profiler, act_type, "stats"):
                 self.report_activity_start(seq_name, activity)
 
-                try:
-                    if self.stop_request.is_set():
-                        raise StoppedError
-                    if not self.check_run_limits(seq_name):
-                        raise SkippedError
+            try:
+                if self.stop_request.is_set():
+                    raise StoppedError
+                if not self.check_run_limits(seq_name):
+                    raise SkippedError
 
+                with profile_phase(profiler, act_type, "execute"):
                     result = activity.execute(self, **expanded_args)
-                    context["last_result"] = result
+                with profile_phase(profiler, act_type, "assertions"):
+                    context["last_result"] = self.result_retention.apply(
+                        result, activity.result_is_referenced
+                    )
                     # Evaluate standard `assert_...` and `store_...` clauses:
                     elap = time.monotonic() - start_activity
                     self._process_activity_result(
@@ -376,6 +768,7 @@ class SessionManager:
                         result,
                         elap,
                     )
+                with profile_phase(profiler, act_type, "stats"):
                     self.report_activity_result(
                         seq_name,
                         activity,
@@ -383,17 +776,20 @@ class SessionManager:
                         result,
                         elap,
                     )
-                except (Exception, KeyboardInterrupt) as e:
-                    if isinstance(e, KeyboardInterrupt):
-                        self.stop_request.set()
-                    error = e
-                    self.report_activity_error(seq_name, activity, activity_args, e)
-                    if not isinstance(e, (KeyboardInterrupt, StressorError)):
-                        logger.exception("")
-                    # return False
-
-                finally:
-                    elap = time.monotonic() - start_activity
+            except (Exception, KeyboardInterrupt) as e:
+                if isinstance(e, KeyboardInterrupt):
+                    self.stop_request.set()
+                error = e
+                is_sample = self.report_activity_error(
+                    seq_name, activity, activity_args, e, result=result
+                )
+                if is_sample and not isinstance(e, (KeyboardInterrupt, StressorError)):
+                    logger.exception("")
+                # return False
+
+            finally:
+                elap = time.monotonic() - start_activity
+                with profile_phase(profiler, act_type, "hooks"):
                     self.publish(
                         "end_activity",
                         session=self,
@@ -405,18 +801,73 @@ class SessionManager:
                         elap=elap,
                         context=context,
                     )
+        return result, error
 
-        elap = time.monotonic() - start_sequence
-        self.stats.report_end(self, seq_name, None)
-        self.publish(
-            "end_sequence",
-            session=self,
-            sequence=sequence,
-            path=stack,
-            elap=elap,
-        )
-        context["last_result"] = None
-        return not self.has_errors()
+    def make_branch(self):
+        """Return a copy of this session that runs one child of a `parallel:` block.
+
+        The branch shares everything with this session (browser session, user,
+        stats, ...), except the state of the pending activity: the context
+        stack (an isolated scope with the same path), the transferred bytes,
+        and `data` (entries of the session are visible, but new entries are
+        stored in the branch).
+        """
+        # Create shared lazy objects first, so branches don't create their own
+        _ = self.browser_session, self.http_cache
+        branch = copy(self)
+        branch.parent = self
+        branch.context_stack = self.context_stack.branch()
+        branch.data = ChainMap({}, self.data)
+        branch.pending_activity = None
+        branch.activity_start = None
+        branch._transfer_lock = threading.Lock()
+        branch._bytes_sent = branch._bytes_received = 0
+        branch._branch_bytes_sent = branch._branch_bytes_received = 0
+        return branch
+
+    def run_parallel(self, seq_name, activity_list):
+        """Run activities concurrently in branches of this session and join them.
+
+        Every activity is reported like an activity of the sequence `seq_name`.
+        Context variables that are set by the activities (e.g. `store_json`)
+        are copied to the session's context (in list order) when all are done.
+
+        Returns:
+            (list) the activities' results (None if an activity failed)
+        """
+        if self._parallel_pool is None:
+            workers = self.sessions.get("parallel_workers") or self.PARALLEL_WORKERS
+            self._parallel_pool = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=f"{self.session_id}-parallel"
+            )
+        branches = [self.make_branch() for _ in activity_list]
+
+        def _run(branch, act_idx, activity_args):
+            self._branch_local.branch = branch
+            try:
+                return branch.run_activity(
+                    seq_name, activity_list, act_idx, activity_args
+                )[0]
+            finally:
+                self._branch_local.branch = None
+
+        futures = [
+            self._parallel_pool.submit(_run, branch, act_idx, activity_args)
+            for act_idx, (branch, activity_args) in enumerate(
+                zip(branches, activity_list), 1
+            )
+        ]
+        results = [f.result() for f in futures]
+
+        context = self.context_stack.context
+        for branch in branches:
+            for key, value in branch.context_stack.context.own_items():
+                if key != "last_result":
+                    context[key] = value
+            for key, value in branch.data.maps[0].items():
+                if not key.startswith("_"):
+                    self.data.setdefault(key, value)
+        return results
 
     def run(self):
         stack = self.context_stack
@@ -428,6 +879,21 @@ class SessionManager:
         sessions = config_manager.sessions
         session_duration = float(sessions.get("duration", 0.0))
 
+        feeders = rm.feeders
+        if feeders:
+            stack.context["feed"] = {}
+
+        if self.sessions.get("throttle") or self.user.attributes:
+            from stressor.throttle import Throttle
+
+            try:
+                self.throttle = Throttle.from_session(self.sessions, self.user)
+            except (TypeError, ValueError) as e:
+                # E.g. an invalid value in a CSV user file: only skip this session
+                logger.error(f"Skipping session {self.session_id} ({self.user}): {e}")
+                self.stats.report_error(None, None, None, e)
+                return False
+
         self.publish("start_session", session=self)
         self.stats.report_start(self, None, None)
 
@@ -436,18 +902,26 @@ class SessionManager:
         skip_all_but_end = False
 
         for seq_idx, seq_def in enumerate(scenario, 1):
-            seq_name = seq_def["sequence"]
+            # `mix: {SEQ_NAME: WEIGHT, ...}`: choose the sequence per iteration
+            mix = rm.sequence_mixes.get(seq_idx - 1)
+            seq_name = mix.name if mix else seq_def["sequence"]
             if skip_all or (skip_all_but_end and seq_name != "end"):
                 logger.warning(f"Skipping sequence '{seq_name}'.")
                 continue
 
-            sequence = sequences.get(seq_name)
+            sequence = None if mix else sequences.get(seq_name)
+            prev_choice = None
             loop_repeat = int(seq_def.get("repeat", 0))
             loop_duration = float(seq_def.get("duration", 0.0))
+            # `pace: SECS`: start iterations at fixed intervals
+            loop_pace = parse_duration(seq_def.get("pace", 0.0))
             start_seq_loop = time.monotonic()
+            next_iteration = start_seq_loop
             loop_idx = 0
             while True:
                 loop_idx += 1
+                if mix:
+                    seq_name = mix.name
                 if not self.check_run_limits(seq_name=seq_name):
                     skip_all_but_end = True
                     break
@@ -484,9 +958,45 @@ class SessionManager:
                     )
                     skip_all_but_end = True
                     break
+                # Retired by the load profile controller (but run 'end' sequence):
+                elif seq_name != "end" and self.retire_request.is_set():
+                    logger.info(f"Session retired: stopping '{seq_name}' loop.")
+                    skip_all_but_end = True
+                    break
+
+                if loop_pace > 0:
+                    # Wait for the start of the next interval (if the previous
+                    # iteration was not late)
+                    wait = next_iteration - now
+                    if wait > 0 and self.stop_request.wait(wait):
+                        logger.error("Stopping scenario due to a stop request.")
+                        skip_all_but_end = True
+                        break
+                    now = time.monotonic()
+                    next_iteration = max(next_iteration, now) + loop_pace
+
+                if mix:
+                    seq_name = prev_choice = mix.choose(self.random, prev_choice)
+                    sequence = sequences[seq_name]
+                    self.stats.report_mix_choice(self, mix.name, seq_name)
+
+                if feeders:
+                    try:
+                        self._feed_iteration(seq_name)
+                    except FeederExhaustedError as e:
+                        if seq_name != "end":
+                            logger.warning(f"Stopping scenario: {e}")
+                            skip_all_but_end = True
+                            break
+                        # Run the 'end' sequence anyway, using the last rows
+                        logger.warning(f"{e}")
 
                 with stack.enter(f"#{seq_idx:02}-{seq_name}@{loop_idx}"):
                     is_ok = self.run_sequence(seq_name, sequence)
+                    if loop_pace > 0:
+                        self.stats.report_paced_iteration(
+                            self, seq_name, late=time.monotonic() > next_iteration
+                        )
                     if seq_name == "init" and not is_ok:
                         logger.error(
                             "Stopping scenario due to an error in the 'init' sequence."
@@ -500,6 +1010,20 @@ class SessionManager:
                         break
             # self.stats.report_end(self, seq_name, None)
 
+        self.stop_pollers()
+        if self._parallel_pool is not None:
+            self._parallel_pool.shutdown()
+            self._parallel_pool = None
+        for pool in self.data.pop("har_replay_pools", {}).values():
+            pool.shutdown()
+        if self.data.get("websockets"):
+            from stressor.ws_client import close_session_connections
+
+            close_session_connections(self, self.get_context("request_timeout"))
+        if self.data.get("system_load"):
+            from stressor.system_load import release_session_load
+
+            release_session_load(self)
         elap = time.monotonic() - start_session
         self.stats.report_end(self, None, None)
 
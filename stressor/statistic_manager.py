@@ -3,16 +3,124 @@
 """
 """
 import logging
+import math
 import threading
 import time
 from collections import OrderedDict
 from pprint import pformat
 
-from stressor.util import format_elap, format_rate, get_dict_attr, shorten_string
+from stressor.util import (
+    format_bytes,
+    format_elap,
+    format_rate,
+    get_dict_attr,
+    parse_duration,
+    shorten_string,
+)
 
 logger = logging.getLogger("stressor")
 
 
+def get_error_fingerprint(exc, activity):
+    """Return a key that groups similar errors.
+
+    The fingerprint consists of the exception type, the activity's compile
+    path, and the HTTP status (if any), e.g.
+    'HTTPError at main/#1/GetRequest (500)'.
+    """
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    res = f"{type(exc).__name__} at {activity.compile_path}"
+    if status:
+        res += f" ({status})"
+    return res
+
+
+class RateLimitedLogger:
+    """Emit max. `rate` messages per second and count the suppressed ones.
+
+    The number of suppressed messages is logged as soon as the next message
+    passes, so a failing backend cannot flood the log (and make stressor
+    itself CPU-bound).
+    """
+
+    def __init__(self, logger, rate):
+        self.logger = logger
+        #: (int) Max. messages per second
+        self.rate = rate
+        #: (int) Total number of suppressed messages
+        self.suppressed = 0
+        self._window_start = 0.0
+        self._window_count = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def log(self, level, msg):
+        """Log `msg` unless the rate is exceeded; return True if it was logged."""
+        skipped = 0
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_count = 0
+            emit = self._window_count < self.rate
+            if emit:
+                self._window_count += 1
+                skipped, self._pending = self._pending, 0
+            else:
+                self._pending += 1
+                self.suppressed += 1
+        if skipped:
+            self.logger.warning(
+                f"Suppressed {skipped:,} log messages (limit: {self.rate}/sec)."
+            )
+        if emit:
+            self.logger.log(level, msg)
+        return emit
+
+
+class LatencyHistogram:
+    """Compact histogram of durations with logarithmic buckets.
+
+    Values are rounded to buckets that are ~5% apart, so percentiles can be
+    computed without storing every single value.
+    """
+
+    #: Buckets per factor *e* (i.e. a resolution of ~5%)
+    RESOLUTION = 20
+    #: Smallest distinguished value in seconds
+    MIN_VALUE = 1e-6
+
+    def __init__(self):
+        self.count = 0
+        self.buckets = {}
+
+    def add(self, elap):
+        idx = int(
+            math.log(max(elap, self.MIN_VALUE) / self.MIN_VALUE) * self.RESOLUTION
+        )
+        self.buckets[idx] = self.buckets.get(idx, 0) + 1
+        self.count += 1
+
+    def percentile(self, pct):
+        """Return the `pct` (0..100) percentile in seconds or None if empty."""
+        if not self.count:
+            return None
+        rank = pct * self.count / 100.0
+        cum = 0
+        for idx in sorted(self.buckets):
+            cum += self.buckets[idx]
+            if cum >= rank:
+                break
+        # Return the center of the bucket
+        return self.MIN_VALUE * math.exp((idx + 0.5) / self.RESOLUTION)
+
+    def get_percentiles(self):
+        """Return a dict with 'p50', 'p95', and 'p99' values."""
+        return {f"p{p}": self.percentile(p) for p in (50, 95, 99)}
+
+
 class StatisticManager:
     """
 
@@ -82,6 +190,14 @@ class StatisticManager:
         'warnings': 0}
     """
 
+    #: Keep full details of the first N errors per fingerprint
+    ERROR_SAMPLE_COUNT = 3
+    #: Max. number of error messages per second that are logged (all sessions)
+    ERROR_LOG_RATE = 10
+
+    #: Key of the aggregated stats of finished sessions in `stats["sessions"]`
+    FINISHED_SESSIONS = "(finished)"
+
     def __init__(self):
         self._lock = threading.RLock()
         self.stats = {
@@ -92,6 +208,7 @@ class StatisticManager:
             "seq_count": 0,
             "sess_count": 0,
             "sess_running": 0,
+            "sess_running_max": 0,
             "errors": 0,
             "warnings": 0,
             "run_limit_reached": False,
@@ -99,9 +216,25 @@ class StatisticManager:
             "sequence_stats": {},
             "sessions": {},
             "monitored": {},
+            "load_stages": {},
+            "load_stage": None,
+            "error_fingerprints": {},
+            "pollers": {},
+            "websockets": {},
+            "system_load": {},
+            "sequence_mixes": {},
         }
+        #: (dict) Detailed messages of the first errors, by fingerprint ID
+        self.error_samples = {}
+        #: :class:`RateLimitedLogger` for activity errors
+        self.error_log = RateLimitedLogger(logger, self.ERROR_LOG_RATE)
         self.sequence_names = OrderedDict()
         self.monitored_activities = OrderedDict()
+        # Stats of the current load profile stage (if any)
+        self._stage_stats = None
+        # Latency histograms of net activity times (global and per stage)
+        self.histogram = LatencyHistogram()
+        self._stage_histograms = {}
 
     def __getitem__(self, key):
         return get_dict_attr(self.stats, key)
@@ -122,11 +255,24 @@ class StatisticManager:
         """Called by compiler."""
         name = activity.compile_path
         assert name not in self.monitored_activities
-        if activity.raw_args.get("monitor"):
+        if activity.monitor:
             self.monitored_activities[name] = True
             self.stats["monitored"][name] = {}
         return
 
+    def register_sequence_mix(self, name, target):
+        """Called by run_manager for `mix` scenario entries.
+
+        Args:
+            name (str): name of the mix
+            target (dict): sequence names and expected shares
+        """
+        self.stats["sequence_mixes"][name] = {
+            "target": dict(target),
+            "counts": dict.fromkeys(target, 0),
+            "total": 0,
+        }
+
     def register_session(self, session):
         """Called by run_manager."""
         d = {
@@ -136,8 +282,96 @@ class StatisticManager:
             "path": str(session.context_stack),
             "active": False,
         }
-        self.stats["sessions"][session.session_id] = d
-        self.stats["sess_count"] += 1
+        with self._lock:
+            self.stats["sessions"][session.session_id] = d
+            self.stats["sess_count"] += 1
+
+    def release_session(self, session):
+        """Called by run_manager when a session thread has terminated.
+
+        The session's stats are added to the :attr:`FINISHED_SESSIONS` bucket
+        of `stats["sessions"]`, so long runs that replace sessions (e.g. load
+        profiles) don't keep stats for every session.
+        """
+        sessions = self.stats["sessions"]
+        with self._lock:
+            d = sessions.pop(session.session_id)
+            agg = sessions.get(self.FINISHED_SESSIONS)
+            if agg is None:
+                agg = sessions[self.FINISHED_SESSIONS] = {
+                    "errors": 0,
+                    "warnings": 0,
+                    "user": "",
+                    "path": "",
+                    "active": False,
+                    "sess_count": 0,
+                }
+            agg["sess_count"] += 1
+            agg["user"] = f"{agg['sess_count']:,} sessions"
+            for key, value in d.items():
+                if key == "last_error":
+                    agg[key] = value
+                elif not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                elif key.endswith("_max"):
+                    agg[key] = max(agg.get(key, 0), value)
+                elif key.endswith("_min"):
+                    cur = agg.get(key, 0)
+                    agg[key] = value if not cur or (value and value < cur) else cur
+                elif not key.endswith("_avg"):
+                    agg[key] = agg.get(key, 0) + value
+            for key in d:
+                if key.endswith("_time_avg"):
+                    p = key[: -len("time_avg")]
+                    if agg.get(p + "count"):
+                        agg[key] = agg[p + "time"] / agg[p + "count"]
+
+    def enter_load_stage(self, name, target):
+        """Called by run_manager when a load profile stage starts (or ends).
+
+        Activities and sequences are accounted to the stage in which they end.
+
+        Args:
+            name (str|None): stage name or None when the profile is finished.
+            target (int): target session count of the stage
+        """
+        with self._lock:
+            now = time.time()
+            prev = self._stage_stats
+            if prev:
+                prev["end"] = now
+                prev.update(self._stage_histograms[prev["name"]].get_percentiles())
+            if name is None:
+                self._stage_stats = None
+                self.stats["load_stage"] = None
+                return
+            d = {
+                "name": name,
+                "target": target,
+                "start": now,
+                "end": None,
+                "sess_running_max": self.stats["sess_running"],
+                "errors": 0,
+            }
+            self.stats["load_stages"][name] = d
+            self._stage_histograms[name] = LatencyHistogram()
+            self.stats["load_stage"] = name
+            self._stage_stats = d
+        return
+
+    def get_load_stage_info(self, name):
+        """Return a copy of a load stage's stats, including current percentiles.
+
+        'error_rate' is errors per activity, 'act_rate' is activities per second.
+        """
+        with self._lock:
+            info = dict(self.stats["load_stages"][name])
+            info.update(self._stage_histograms[name].get_percentiles())
+        act_count = info.get("act_count", 0)
+        elap = (info["end"] or time.time()) - info["start"]
+        info["error_rate"] = info["errors"] / act_count if act_count else 0.0
+        info["act_rate"] = act_count / elap if elap > 0 else 0.0
+        return info
 
     def _report(self, mode, session, sequence, activity, path=None, error=None):
         assert mode in ("start", "end", "error")
@@ -150,9 +384,13 @@ class StatisticManager:
         seq_stats = global_stats["sequence_stats"][sequence] if sequence else None
 
         elap = 0
+        if mode == "error":
+            # Format once (outside the lock), not once per bucket
+            error = self._format_error(error)
 
         with self._lock:
             now = time.time()
+            stage_stats = self._stage_stats
             if activity:
                 assert session and sequence
                 key = activity.compile_path
@@ -173,17 +411,39 @@ class StatisticManager:
                     self._add_timing(global_stats, "act_", elap, is_net=is_net)
                     self._add_timing(sess_stats, "act_", elap, is_net=is_net)
                     self._add_timing(seq_stats, "act_", elap, is_net=is_net)
+                    if is_net:
+                        self.histogram.add(elap)
+                    if stage_stats:
+                        self._add_timing(stage_stats, "act_", elap, is_net=is_net)
+                        if is_net:
+                            self._stage_histograms[stage_stats["name"]].add(elap)
 
                     if activity.monitor:
                         d = global_stats["monitored"][key]
                         self._add_timing(d, "act_", elap, is_net=False)
 
+                    sent, received = session.pop_transfer()
+                    if sent or received:
+                        for d in (global_stats, sess_stats, seq_stats, stage_stats):
+                            if d is not None:
+                                self._add_transfer(d, sent, received)
+                    # Bytes of `parallel:` children were already counted above
+                    # (by the child activities), but also belong to the block
+                    branch_sent, branch_received = session.pop_branch_transfer()
+                    sent += branch_sent
+                    received += branch_received
+                    if activity.monitor and (sent or received):
+                        d = global_stats["monitored"][key]
+                        self._add_transfer(d, sent, received)
+
                     if mode == "end":
                         pass
                     else:  # 'error'
                         self._add_error(global_stats, error)
                         self._add_error(sess_stats, error)
                         self._add_error(seq_stats, error)
+                        if stage_stats:
+                            self._add_error(stage_stats, error)
                         if activity.monitor:
                             d = global_stats["monitored"][key]
                             self._add_error(d, error)
@@ -205,6 +465,8 @@ class StatisticManager:
                     self._add_timing(global_stats, "seq_", elap, is_net=False)
                     self._add_timing(seq_stats, "seq_", elap, is_net=False)
                     self._add_timing(sess_stats, "seq_", elap, is_net=False)
+                    if stage_stats:
+                        self._add_timing(stage_stats, "seq_", elap, is_net=False)
                     if mode == "end":
                         sess_stats["path"] = None
                     else:  # 'error'
@@ -212,7 +474,13 @@ class StatisticManager:
 
             elif session:
                 if mode == "start":
-                    global_stats["sess_running"] += 1
+                    running = global_stats["sess_running"] + 1
+                    global_stats["sess_running"] = running
+                    global_stats["sess_running_max"] = max(
+                        running, global_stats["sess_running_max"]
+                    )
+                    if stage_stats and running > stage_stats["sess_running_max"]:
+                        stage_stats["sess_running_max"] = running
                 else:
                     global_stats["sess_running"] -= 1
             else:
@@ -230,6 +498,165 @@ class StatisticManager:
     def report_error(self, session, sequence, activity, error):
         self._report("error", session, sequence, activity, error=error)
 
+    def report_paced_iteration(self, session, sequence, late):
+        """Count iterations of sequences that use `pace` (and the late ones)."""
+        global_stats = self.stats
+        sess_stats = global_stats["sessions"][session.session_id]
+        seq_stats = global_stats["sequence_stats"][sequence]
+        with self._lock:
+            for d in (global_stats, sess_stats, seq_stats):
+                d["paced_count"] = d.get("paced_count", 0) + 1
+                if late:
+                    d["paced_late"] = d.get("paced_late", 0) + 1
+        return
+
+    def report_mix_choice(self, session, name, sequence):
+        """Count a sequence that was chosen for an iteration of a `mix`."""
+        d = self.stats["sequence_mixes"][name]
+        with self._lock:
+            d["counts"][sequence] += 1
+            d["total"] += 1
+        return
+
+    def report_http_cache(self, session, hits, revalidated, misses):
+        """Count lookups of the per-session HTTP cache (see `StaticRequests`)."""
+        global_stats = self.stats
+        sess_stats = global_stats["sessions"][session.session_id]
+        with self._lock:
+            for d in (global_stats, sess_stats):
+                d["cache_hits"] = d.get("cache_hits", 0) + hits
+                d["cache_revalidated"] = d.get("cache_revalidated", 0) + revalidated
+                d["cache_misses"] = d.get("cache_misses", 0) + misses
+        return
+
+    def report_poll(self, session, key, elap, sent, received, error=None):
+        """Account a background request of a `PollRequest` activity.
+
+        Polls have their own stats per activity (`stats["pollers"][key]`) and
+        don't count as activities or errors of the session.
+        Transferred bytes are added to the global and session totals.
+        A poll that was still in flight when the session was released (see
+        :meth:`release_session`) is not added to the session totals.
+        """
+        global_stats = self.stats
+        if error:
+            error = self._format_error(error)
+        with self._lock:
+            sess_stats = global_stats["sessions"].get(session.session_id)
+            poll_stats = global_stats["pollers"].get(key)
+            if poll_stats is None:
+                poll_stats = global_stats["pollers"][key] = {"errors": 0}
+            self._add_timing(poll_stats, "poll_", elap)
+            global_stats["poll_count"] = global_stats.get("poll_count", 0) + 1
+            if error:
+                self._add_error(poll_stats, error)
+                global_stats["poll_errors"] = global_stats.get("poll_errors", 0) + 1
+            if sent or received:
+                for d in (poll_stats, global_stats, sess_stats):
+                    if d is not None:
+                        self._add_transfer(d, sent, received)
+        return
+
+    def report_ws(self, session, key, sent=0, received=0, rtt=None):
+        """Count WebSocket messages of a connection (see `WsConnect`).
+
+        Message counts and round-trip latencies are stored per connection
+        (`stats["websockets"][key]`) and globally.
+        """
+        global_stats = self.stats
+        with self._lock:
+            ws_stats = global_stats["websockets"].get(key)
+            if ws_stats is None:
+                ws_stats = global_stats["websockets"][key] = {}
+            for d in (ws_stats, global_stats):
+                d["ws_sent"] = d.get("ws_sent", 0) + sent
+                d["ws_received"] = d.get("ws_received", 0) + received
+                if rtt is not None:
+                    self._add_timing(d, "ws_rtt_", rtt)
+        return
+
+    def report_system_load(self, session, kind, amount, elap):
+        """Account work of a `Cpu`, `Memory`, or `File` activity.
+
+        `stats["system_load"][kind]` holds the count, the total amount (bytes
+        or CPU core-seconds), and the time, e.g. for `kind` 'file_write'.
+        """
+        with self._lock:
+            d = self.stats["system_load"].get(kind)
+            if d is None:
+                d = self.stats["system_load"][kind] = {
+                    "count": 0,
+                    "amount": 0,
+                    "time": 0.0,
+                }
+            d["count"] += 1
+            d["amount"] += amount
+            d["time"] += elap
+        return
+
+    def format_system_load(self):
+        """Return a list of strings that describe the generated system load.
+
+        Example: ['CPU: 12.5 core-seconds', 'file write: 100 MB, 350 MB/s'].
+        """
+        res = []
+        for kind, d in self.stats["system_load"].items():
+            if kind == "cpu":
+                res.append(f"CPU: {d['amount']:.1f} core-seconds")
+                continue
+            line = "{}: {}".format(kind.replace("_", " "), format_bytes(d["amount"]))
+            if d["time"] > 0:
+                line += f", {format_rate(d['amount'] / 1e6, d['time'])} MB/s"
+            res.append(line)
+        return res
+
+    def format_sequence_mixes(self):
+        """Return a list of strings that compare achieved and target mixes.
+
+        Example: ["'shop': 1,000 iterations, browse: 69.4% (target 70.0%), ..."].
+        """
+        res = []
+        for name, d in self.stats["sequence_mixes"].items():
+            total = d["total"]
+            if not total:
+                continue
+            shares = ", ".join(
+                f"{seq}: {d['counts'][seq] / total:.1%} (target {target:.1%})"
+                for seq, target in d["target"].items()
+            )
+            res.append(f"{name!r}: {total:,} iterations, {shares}")
+        return res
+
+    def count_error_fingerprint(self, fingerprint):
+        """Count an error by fingerprint (see :func:`get_error_fingerprint`).
+
+        Returns:
+            (bool) True if details should be passed to :meth:`add_error_sample`
+        """
+        with self._lock:
+            fingerprints = self.stats["error_fingerprints"]
+            now = time.time()
+            d = fingerprints.get(fingerprint)
+            if d is None:
+                d = {"id": len(fingerprints) + 1, "count": 0, "first": now}
+                fingerprints[fingerprint] = d
+                self.error_samples[d["id"]] = []
+            d["count"] += 1
+            d["last"] = now
+            return d["count"] <= self.ERROR_SAMPLE_COUNT
+
+    def add_error_sample(self, fingerprint, msg):
+        with self._lock:
+            fp_id = self.stats["error_fingerprints"][fingerprint]["id"]
+            self.error_samples[fp_id].append(msg)
+
+    def get_top_errors(self, count=10):
+        """Return a list of `(fingerprint, info)` tuples, most frequent first."""
+        with self._lock:
+            items = list(self.stats["error_fingerprints"].items())
+        items.sort(key=lambda item: item[1]["count"], reverse=True)
+        return items[:count]
+
     def report_limit_violation(self, msg):
         """Register 'limit reached' error (not more than once)."""
         if not self.stats["run_limit_reached"]:
@@ -257,10 +684,20 @@ class StatisticManager:
             self._add_timing(d, p, elap)
         return
 
+    def _add_transfer(self, d, sent, received):
+        d["bytes_sent"] = d.get("bytes_sent", 0) + sent
+        d["bytes_received"] = d.get("bytes_received", 0) + received
+
+    @staticmethod
+    def _format_error(error):
+        """Return the `last_error` string that is passed to `_add_error()`."""
+        return shorten_string(f"{error}", 500, 100)
+
     def _add_error(self, d, error):
+        """Count an error in `d` (`error` was formatted by `_format_error()`)."""
         d.setdefault("errors", 0)
         d["errors"] += 1
-        d["last_error"] = shorten_string(f"{error}", 500, 100)
+        d["last_error"] = error
 
     def error_count(self, or_warnings=False):
         error_count = self.stats["errors"]
@@ -273,6 +710,23 @@ class StatisticManager:
         s = dict(self.stats)
         return f"{pformat(s)}"
 
+    def format_transfer(self, elap, d=None):
+        """Return transferred bytes and throughput of `d` as string.
+
+        Example: '1.2 MB sent, 34.56 MB received, 3.58 MB/s'.
+
+        Args:
+            elap (float): time in seconds that is used to compute MB/s
+            d (dict): stats dict (default: global stats)
+        """
+        d = self.stats if d is None else d
+        sent = d.get("bytes_sent", 0)
+        received = d.get("bytes_received", 0)
+        rate = format_rate((sent + received) / 1e6, elap)
+        return (
+            f"{format_bytes(sent)} sent, {format_bytes(received)} received, {rate} MB/s"
+        )
+
     def get_monitor_info(self, config_all):
         stats = self.stats
 
@@ -282,11 +736,21 @@ class StatisticManager:
                 v = format_elap(v)
             return v
 
+        def _format_throughput(d, time_key):
+            # MB/s while activities were running
+            size = d.get("bytes_sent", 0) + d.get("bytes_received", 0)
+            return format_rate(size / 1e6, d.get(time_key))
+
         # --- Add rows for every sequence name:
 
         # Cache config_all.scenario.<sequence> entries as a dict:
         scenario_map = {}
         for scenario_seq_def in config_all["scenario"]:
+            if "mix" in scenario_seq_def:
+                # Show the loop options of a `mix` entry for all its sequences
+                for seq_name in scenario_seq_def["mix"]:
+                    scenario_map.setdefault(seq_name, scenario_seq_def)
+                continue
             seq_name = scenario_seq_def["sequence"]
             scenario_map[seq_name] = scenario_seq_def
 
@@ -301,6 +765,13 @@ class StatisticManager:
                 extra.append("n: {:,}".format(seq_def["repeat"]))
             if "duration" in seq_def:
                 extra.append("Δt: {}".format(format_elap(seq_def["duration"])))
+            if "pace" in seq_def:
+                extra.append(
+                    "pace: {}, late: {:,}".format(
+                        format_elap(parse_duration(seq_def["pace"])),
+                        info.get("paced_late", 0),
+                    )
+                )
             if extra:
                 title = "{} ({})".format(seq_name, ", ".join(extra))
 
@@ -321,6 +792,9 @@ class StatisticManager:
                         format_rate(
                             info.get("net_act_count"), info.get("net_act_time")
                         ),
+                        format_bytes(info.get("bytes_sent")),
+                        format_bytes(info.get("bytes_received")),
+                        _format_throughput(info, "act_time"),
                     ],
                     "type": "sequence",
                     "key": name if name != "Summary" else None,
@@ -346,6 +820,8 @@ class StatisticManager:
                         f(info, "act_time_min", True),
                         f(info, "act_time_avg", True),
                         f(info, "act_time_max", True),
+                        format_bytes(info.get("bytes_received")),
+                        _format_throughput(info, "act_time"),
                         f(info, "last_error") or "n.a.",
                     ],
                     "type": "monitored",
@@ -353,6 +829,22 @@ class StatisticManager:
                 }
             )
 
+        # --- List the most frequent errors
+        top_errors = []
+        for fingerprint, info in self.get_top_errors():
+            top_errors.append(
+                {
+                    "cols": [
+                        info["count"],
+                        fingerprint,
+                        time.strftime("%H:%M:%S", time.localtime(info["first"])),
+                        time.strftime("%H:%M:%S", time.localtime(info["last"])),
+                    ],
+                    "type": "error",
+                    "key": info["id"],
+                }
+            )
+
         # --- List all sessions
         sessions = []
         for idx, (session_id, info) in enumerate(stats["sessions"].items(), 1):
@@ -365,6 +857,7 @@ class StatisticManager:
                         f(info, "seq_count"),
                         f(info, "act_count"),
                         f(info, "errors"),
+                        format_bytes(info.get("bytes_received")),
                         info["path"],
                     ],
                     "type": "session",
@@ -372,11 +865,42 @@ class StatisticManager:
                 }
             )
 
+        # --- List load profile stages (if any)
+        stages = []
+        now = time.time()
+        for name in list(stats["load_stages"]):
+            info = self.get_load_stage_info(name)
+            stage_elap = (info["end"] or now) - info["start"]
+            title = name
+            if name == stats["load_stage"]:
+                title = f"{name} (active)"
+            p99 = info["p99"]
+            stages.append(
+                {
+                    "cols": [
+                        title,
+                        info["target"],
+                        info["sess_running_max"],
+                        format_elap(stage_elap),
+                        f(info, "act_count"),
+                        f(info, "errors"),
+                        f(info, "act_time_avg", True),
+                        f(info, "act_time_max", True),
+                        "n.a." if p99 is None else format_elap(p99),
+                        format_rate(info.get("act_count"), stage_elap),
+                    ],
+                    "type": "stage",
+                    "key": name,
+                }
+            )
+
         res = {
             "hasErrors": self.has_errors(),
             "seq_stats": seq_stats,
             "act_stats": activity_stats,
             "sess_stats": sessions,
+            "stage_stats": stages,
+            "error_stats": top_errors,
             "raw": self.stats,
         }
         return res
@@ -387,8 +911,14 @@ class StatisticManager:
         if type_ == "sequence":
             errors = self.stats["sequence_stats"][key]["last_error"]
         elif type_ == "session":
-            errors = self.stats["sessions"][key]["last_error"]
+            errors = self.stats["sessions"][key].get("last_error")
         elif type_ == "monitored":
             errors = self.stats["monitored"][key]["last_error"]
+        elif type_ == "stage":
+            errors = self.stats["load_stages"][key]["last_error"]
+        elif type_ == "error":
+            samples = self.error_samples[int(key)]
+            errors = "\n\n".join(samples)
+            return f"First {len(samples)} Error Samples ({args}):\n\n{errors}"
 
         return f"Last Error Info ({args}):\n\n{errors}"
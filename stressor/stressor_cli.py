@@ -14,27 +14,30 @@ import logging
 import os
 import sys
 
-import yaml
 from snazzy import enable_colors
 
 from stressor import __version__
 from stressor.cli_common import common_parser, verbose_parser
-from stressor.convert.har_converter import HarConverter
 from stressor.plugin_manager import PluginManager
-from stressor.run_manager import RunManager
 from stressor.util import (
     check_cli_verbose,
     init_logging,
     logger,
     parse_option_args,
     version_info,
+    yaml_load,
 )
 
 
 def handle_run_command(parser, args):
+    # Defer heavy imports to the sub-command that needs them:
+    from stressor.run_manager import RunManager
+
     options = {
         "monitor": args.monitor,
         "log_summary": True,
+        "profile": args.profile,
+        "profile_output": args.profile_output,
         # "dry_run": args.dry_run,
     }
     extra_context = {}
@@ -53,7 +56,7 @@ def handle_run_command(parser, args):
         logger.info(f"Looking for {scenario_fspec}")
 
     rm = RunManager()
-    rm.load_config(scenario_fspec)
+    rm.load_config(scenario_fspec, use_cache=args.cache)
     if args.single:
         rm.config_manager.config["force_single"] = True
     if args.max_time:
@@ -71,12 +74,14 @@ def handle_run_command(parser, args):
 
 
 def handle_init_command(parser, args):
+    from stressor.convert.har_converter import HarConverter
+
     opts = {}
     if args.opts:
         if not os.path.isfile(args.opts):
             parser.error(f"File not found: {args.opts}")
         with open(args.opts) as f:
-            opts = yaml.safe_load(f)
+            opts = yaml_load(f)
 
     opts.update(
         {
@@ -98,9 +103,27 @@ def handle_listen_command(parser, args):
 # ===============================================================================
 # run
 # ===============================================================================
+def _print_version(verbose):
+    if verbose >= 4:
+        info = version_info
+        info += f"\nPython from: {sys.executable}"
+    else:
+        info = __version__
+    print(info)  # noqa: T201
+
+
 def run():
     """CLI main entry point."""
 
+    # `stressor --version` is also used to probe worker environments, so
+    # handle it before plugins are loaded
+    version_parser = argparse.ArgumentParser(add_help=False, parents=[verbose_parser])
+    version_parser.add_argument("-V", "--version", action="store_true")
+    pre_args, _ = version_parser.parse_known_args()
+    if pre_args.version:
+        _print_version(pre_args.verbose - pre_args.quiet)
+        sys.exit(0)
+
     parser = argparse.ArgumentParser(
         description="Stress-test your web app.",
         epilog="See also https://github.com/mar10/stressor",
@@ -157,6 +180,24 @@ def run():
         default=0.0,
         help="Stop after N seconds (overrides `config.max_time`)",
     )
+    sp.add_argument(
+        "--profile",
+        action="store_true",
+        help="Measure stressor's own time per phase and activity type and "
+        "print a report at the end of the run",
+    )
+    sp.add_argument(
+        "--profile-output",
+        metavar="PATH",
+        help="Implies --profile. Also sample session thread stacks and write "
+        "them to PATH in 'collapsed' (flamegraph-compatible) format",
+    )
+    sp.add_argument(
+        "--cache",
+        action="store_true",
+        help="Re-use a cached version of the resolved configuration if it is "
+        "up to date (see `STRESSOR_CACHE_DIR`)",
+    )
 
     sp.set_defaults(command=handle_run_command)
 
@@ -177,7 +218,8 @@ def run():
         "--import",
         dest="har_file",
         # required=True,
-        help="optional HAR file that is converted",
+        help="optional HAR file that is converted (a folder or glob pattern "
+        "creates one sequence per HAR file)",
     )
     sp.add_argument(
         "--force",
@@ -245,15 +287,6 @@ def run():
         # Enable snazzy colors and emojis if terminal supports them
         enable_colors(True, force=False)
 
-    if getattr(args, "version", None):
-        if args.verbose >= 4:
-            info = version_info
-            info += f"\nPython from: {sys.executable}"
-        else:
-            info = __version__
-        print(info)  # noqa: T201
-        sys.exit(0)
-
     if not callable(getattr(args, "command", None)):
         parser.error("missing command")
 
@@ -0,0 +1,216 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+Generate CPU, memory, and file I/O load on the local machine.
+
+Used by the `Cpu`, `Memory`, and `File` activities to stress co-located
+services.
+"""
+import mmap
+import multiprocessing
+import os
+import tempfile
+import time
+
+#: Key of the per-session resources in `session.data`
+SESSION_DATA_KEY = "system_load"
+
+#: Default block size of file operations
+DEFAULT_BLOCK_SIZE = 64 * 1024
+
+
+def _burn(duration):
+    """Keep one core busy for `duration` seconds (0: until terminated)."""
+    end = time.monotonic() + duration if duration else None
+    x = 1
+    while True:
+        for _ in range(100_000):
+            x = (x * 1103515245 + 12345) & 0x7FFFFFFF
+        if end and time.monotonic() > end:
+            return
+
+
+class CpuLoad:
+    """
+    Keep `cores` CPU cores busy, using one process per core.
+
+    Processes are used (instead of threads), so the burners don't compete for
+    the GIL with the session threads.
+
+    Args:
+        cores (int): Number of processes
+        duration (float): Stop after `duration` seconds (0: until stopped)
+    """
+
+    #: Seconds between two checks of the stop request in :meth:`wait`
+    STOP_CHECK_INTERVAL = 0.1
+
+    def __init__(self, cores=1, duration=0):
+        self.cores = cores
+        self.duration = duration
+        self.start_time = None
+        self._processes = []
+
+    def __str__(self):
+        return f"CpuLoad<{self.cores} cores, {self.duration or 'unlimited'} sec>"
+
+    def start(self):
+        # 'spawn' is safe in a process that runs threads (unlike 'fork')
+        ctx = multiprocessing.get_context("spawn")
+        self._processes = [
+            ctx.Process(
+                target=_burn, args=(self.duration,), name="cpu_load", daemon=True
+            )
+            for _ in range(self.cores)
+        ]
+        self.start_time = time.monotonic()
+        for p in self._processes:
+            p.start()
+
+    @property
+    def is_alive(self):
+        return any(p.is_alive() for p in self._processes)
+
+    def wait(self, stop_event=None):
+        """Block until all processes finished (or `stop_event` is set)."""
+        while self.is_alive:
+            if stop_event is not None and stop_event.wait(self.STOP_CHECK_INTERVAL):
+                break
+            if stop_event is None:
+                time.sleep(self.STOP_CHECK_INTERVAL)
+
+    def stop(self):
+        """Terminate all processes and return the consumed core-seconds."""
+        for p in self._processes:
+            if p.is_alive():
+                p.terminate()
+        for p in self._processes:
+            p.join()
+        elap = time.monotonic() - self.start_time
+        if self.duration:
+            elap = min(elap, self.duration)
+        self._processes = []
+        return self.cores * elap
+
+
+def allocate_memory(size):
+    """Return a `bytearray` of `size` bytes, that is backed by physical memory.
+
+    A fresh buffer may be mapped lazily by the OS, so one byte per page is
+    written (in a single slice assignment).
+    """
+    buf = bytearray(size)
+    page = mmap.PAGESIZE
+    buf[::page] = b"\x01" * len(range(0, size, page))
+    return buf
+
+
+def write_file(path, size, block_size=DEFAULT_BLOCK_SIZE, fsync=False, use_mmap=False):
+    """Write `size` random bytes to `path` in blocks and return the byte count.
+
+    Args:
+        fsync (bool): Flush to disk before returning (fsync or mmap.flush)
+        use_mmap (bool): Write to a memory map instead of calling `write()`
+    """
+    block = memoryview(os.urandom(block_size))  # Defeat compression
+    if use_mmap:
+        with open(path, "w+b") as f:
+            f.truncate(size)
+            if not size:
+                return 0
+            with mmap.mmap(f.fileno(), size) as mm:
+                for ofs in range(0, size, block_size):
+                    n = min(block_size, size - ofs)
+                    mm[ofs : ofs + n] = block[:n]
+                if fsync:
+                    mm.flush()
+        return size
+
+    with open(path, "wb", buffering=0) as f:
+        for ofs in range(0, size, block_size):
+            # A raw (unbuffered) file may write less than requested
+            data = block[: min(block_size, size - ofs)]
+            while data:
+                data = data[f.write(data) :]
+        if fsync:
+            os.fsync(f.fileno())
+    return size
+
+
+def read_file(path, block_size=DEFAULT_BLOCK_SIZE, size=0, use_mmap=False):
+    """Read `path` in blocks (max. `size` bytes) and return the byte count.
+
+    Blocks are read into one pre-allocated buffer.
+
+    Args:
+        use_mmap (bool): Copy from a memory map instead of calling `readinto()`
+    """
+    buf = bytearray(block_size)
+    total = 0
+    with open(path, "rb", buffering=0) as f:
+        if use_mmap:
+            fd = f.fileno()
+            file_size = os.fstat(fd).st_size
+            if size:
+                file_size = min(size, file_size)
+            if not file_size:
+                return 0
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as mv:
+                for ofs in range(0, file_size, block_size):
+                    n = min(block_size, file_size - ofs)
+                    buf[:n] = mv[ofs : ofs + n]
+            return file_size
+
+        view = memoryview(buf)
+        while True:
+            if size and size - total < block_size:
+                n = f.readinto(view[: size - total])
+            else:
+                n = f.readinto(view)
+            if not n:
+                break
+            total += n
+            if size and total >= size:
+                break
+    return total
+
+
+def get_temp_path(session):
+    """Return the path of a session's default temp file (deleted when it ends)."""
+    name = f"stressor_{os.getpid()}_{session.session_id}.dat"
+    return os.path.join(tempfile.gettempdir(), name)
+
+
+def get_session_load(session):
+    """Return the dict of system load resources of a session."""
+    res = session.data.get(SESSION_DATA_KEY)
+    if res is None:
+        res = session.data[SESSION_DATA_KEY] = {
+            "cpu": [],
+            "memory": [],
+            "temp_files": set(),
+        }
+    return res
+
+
+def stop_cpu_load(session):
+    """Stop all CPU loads of a session and return the consumed core-seconds."""
+    res = get_session_load(session)
+    core_seconds = 0.0
+    while res["cpu"]:
+        core_seconds += res["cpu"].pop().stop()
+    if core_seconds:
+        session.stats.report_system_load(session, "cpu", core_seconds, core_seconds)
+    return core_seconds
+
+
+def release_session_load(session):
+    """Stop CPU loads, free memory, and delete temp files of a session."""
+    stop_cpu_load(session)
+    res = session.data.pop(SESSION_DATA_KEY)
+    res["memory"].clear()
+    for path in res["temp_files"]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
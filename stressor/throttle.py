@@ -0,0 +1,210 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+Simulate slow network links by shaping the bandwidth and latency of sessions.
+"""
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+
+from stressor.util import parse_duration
+
+
+class Throttle:
+    """
+    Network conditions of a session: bandwidth limits and added round-trip time.
+
+    Example::
+
+        sessions:
+          throttle:  # Simulate a '3G' mobile connection
+            download_kbps: 1600
+            upload_kbps: 750
+            rtt: 150ms
+
+    Args:
+        opts (dict):
+            `download_kbps` and `upload_kbps` (kbit per second) and `rtt`
+            (seconds or a duration string like '150ms').
+    Raises:
+        TypeError: if the definition has an unexpected type
+        ValueError: if the definition is invalid
+    """
+
+    KNOWN_ARGS = frozenset(("download_kbps", "upload_kbps", "rtt"))
+
+    def __init__(self, opts):
+        if not isinstance(opts, dict):
+            raise TypeError("throttle must be a dict")
+        unknown = set(opts) - self.KNOWN_ARGS
+        if unknown:
+            raise ValueError(f"throttle: unknown option(s) {sorted(unknown)}")
+
+        #: (float) Download rate limit in bytes per second (0: unlimited)
+        self.download = self._get_rate(opts, "download_kbps")
+        #: (float) Upload rate limit in bytes per second (0: unlimited)
+        self.upload = self._get_rate(opts, "upload_kbps")
+        #: (float) Added latency per request in seconds
+        self.rtt = parse_duration(opts.get("rtt") or 0)
+        if self.rtt < 0:
+            raise ValueError("throttle: `rtt` must not be negative")
+
+    def __str__(self):
+        down = self.download * 8 / 1000
+        up = self.upload * 8 / 1000
+        return f"Throttle<down: {down:g} kbps, up: {up:g} kbps, rtt: {self.rtt:g} sec>"
+
+    @staticmethod
+    def _get_rate(opts, key):
+        value = opts.get(key) or 0
+        try:
+            value = float(value)  # CSV user files contain strings
+        except (TypeError, ValueError):
+            raise ValueError(f"throttle: `{key}` must be a number: {value!r}")
+        if value < 0:
+            raise ValueError(f"throttle: `{key}` must not be negative")
+        return value * 1000 / 8
+
+    @classmethod
+    def from_session(cls, sessions, user=None):
+        """Return a :class:`Throttle` for a session or None (unlimited).
+
+        Options are read from `sessions.throttle`. User attributes with the
+        same names (e.g. a `download_kbps` column of a CSV user file) take
+        precedence.
+        """
+        opts = dict(sessions.get("throttle") or {})
+        if user is not None:
+            attributes = user.attributes
+            for key in cls.KNOWN_ARGS:
+                value = attributes.get(key)
+                if value not in (None, ""):
+                    opts[key] = value
+        res = cls(opts)
+        if not (res.download or res.upload or res.rtt):
+            return None
+        return res
+
+
+class TokenBucket:
+    """Thread-safe token bucket that limits the average rate of a resource.
+
+    Tokens are refilled with `rate` per second, up to `burst`.
+    Consumers may overdraw the bucket, and then have to wait until the debt
+    is paid off, so chunks of any size are supported.
+    """
+
+    #: Default burst size in seconds of `rate`
+    BURST_TIME = 0.1
+
+    def __init__(self, rate, burst=None):
+        #: (float) Tokens per second
+        self.rate = float(rate)
+        #: (float) Max. tokens
+        self.burst = float(burst or self.rate * self.BURST_TIME)
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, count):
+        """Take `count` tokens and return the time in seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._stamp) * self.rate
+            )
+            self._stamp = now
+            self._tokens -= count
+            tokens = self._tokens
+        return max(0.0, -tokens / self.rate)
+
+
+class ThrottledHTTPAdapter(HTTPAdapter):
+    """
+    Transport adapter for ``requests`` that applies a :class:`Throttle`.
+
+    Every request is delayed by the `rtt`. Request bodies are sent in chunks
+    and response bodies are read in chunks, so that the average rates do not
+    exceed the limits. The server sees a slow client, that holds the
+    connection open accordingly.
+    The buckets are shared by all threads that use the session (e.g. the
+    workers of `StaticRequests`), like the link of a real device.
+    """
+
+    #: Chunk size in bytes for uploads
+    CHUNK_SIZE = 16 * 1024
+
+    def __init__(self, throttle, stop_event=None, **kwargs):
+        super().__init__(**kwargs)
+        self.throttle = throttle
+        self.stop_event = stop_event
+        self.download_bucket = (
+            TokenBucket(throttle.download) if throttle.download else None
+        )
+        self.upload_bucket = TokenBucket(throttle.upload) if throttle.upload else None
+
+    def _wait(self, delay):
+        if delay <= 0:
+            return
+        if self.stop_event:
+            self.stop_event.wait(delay)
+        else:
+            time.sleep(delay)
+
+    def _iter_upload(self, body):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        if isinstance(body, bytes):
+            chunks = (
+                body[i : i + self.CHUNK_SIZE]
+                for i in range(0, len(body), self.CHUNK_SIZE)
+            )
+        elif hasattr(body, "read"):
+            chunks = iter(lambda: body.read(self.CHUNK_SIZE), b"")
+        else:
+            chunks = body
+        for chunk in chunks:
+            self._wait(self.upload_bucket.consume(len(chunk)))
+            yield chunk
+
+    def send(self, request, **kwargs):
+        if self.throttle.rtt:
+            self._wait(self.throttle.rtt)
+
+        if self.upload_bucket:
+            header_size = sum(len(k) + len(v) + 4 for k, v in request.headers.items())
+            self._wait(self.upload_bucket.consume(header_size))
+            if request.body:
+                # Don't modify the original, which is re-used for redirects
+                request = request.copy()
+                request.body = self._iter_upload(request.body)
+
+        resp = super().send(request, **kwargs)
+
+        bucket = self.download_bucket
+        if bucket:
+            header_size = sum(len(k) + len(v) + 4 for k, v in resp.headers.items())
+            self._wait(bucket.consume(header_size))
+            raw = resp.raw
+            read = raw.read
+
+            def _read(*args, **kwargs):
+                # Count compressed bytes, as read from the socket
+                start = raw.tell()
+                data = read(*args, **kwargs)
+                self._wait(bucket.consume(max(0, raw.tell() - start)))
+                return data
+
+            def _read_chunked(*args, **kwargs):
+                # `Transfer-Encoding: chunked` bypasses `read()` and `tell()`,
+                # so count the (decoded) chunks instead
+                for chunk in read_chunked(*args, **kwargs):
+                    self._wait(bucket.consume(len(chunk)))
+                    yield chunk
+
+            raw.read = _read
+            read_chunked = getattr(raw, "read_chunked", None)
+            if read_chunked:
+                raw.read_chunked = _read_chunked
+        return resp
@@ -0,0 +1,164 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+Choose sequences at random to model a traffic mix.
+"""
+import random
+
+
+class AliasSampler:
+    """
+    Draw indexes with given weights in constant time (Vose's alias method).
+
+    The table is built once in O(n); every draw takes one random number,
+    regardless of the number of choices.
+
+    Args:
+        weights (list[float]): non-negative weights (at least one > 0)
+    """
+
+    def __init__(self, weights):
+        n = len(weights)
+        total = float(sum(weights))
+        if not n or total <= 0 or min(weights) < 0:
+            raise ValueError("expected non-negative weights with a positive sum")
+
+        #: (list[float]) Probability of every choice (weights normalized to 1)
+        self.probabilities = [w / total for w in weights]
+        self._prob = [0.0] * n
+        self._alias = list(range(n))
+
+        scaled = [p * n for p in self.probabilities]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, g = small.pop(), large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = g
+            scaled[g] -= 1.0 - scaled[s]
+            (small if scaled[g] < 1.0 else large).append(g)
+        # Remaining entries are 1.0 (up to rounding errors)
+        for i in small + large:
+            self._prob[i] = 1.0
+
+    def __len__(self):
+        return len(self._prob)
+
+    def sample(self, rng=random):
+        """Return a random index (`rng` is a :class:`random.Random` instance)."""
+        x = rng.random() * len(self._prob)
+        i = int(x)
+        return i if x - i < self._prob[i] else self._alias[i]
+
+
+class SequenceMix:
+    """
+    Pick the sequence of every loop iteration of a `mix` scenario entry.
+
+    Example::
+
+        scenario:
+          - sequence: init
+          - mix:  # Relative weights
+              browse: 70
+              search: 20
+              checkout: 10
+            # Optional: weights of the next sequence, depending on the previous
+            transitions:
+              checkout:
+                browse: 1
+            duration: 600
+          - sequence: end
+
+    Without `transitions`, iterations are independent draws from `mix`.
+    Otherwise the sequences form a Markov chain: after a sequence that has
+    a `transitions` entry, the next one is drawn from this entry (else from
+    `mix`). The target mix is then the long-run share of every sequence.
+
+    Args:
+        mix (dict): sequence names and weights
+        transitions (dict, optional): sequence names and dicts of weights
+        name (str): used in the statistics
+    Raises:
+        TypeError: if the definition has an unexpected type
+        ValueError: if the definition is invalid
+    """
+
+    def __init__(self, mix, transitions=None, name="mix"):
+        if not isinstance(mix, dict):
+            raise TypeError("`mix` must be a dict of sequence names and weights")
+        if not isinstance(transitions, (dict, type(None))):
+            raise TypeError("`transitions` must be a dict of sequence names and dicts")
+
+        names = list(mix.keys())
+        for weights in (transitions or {}).values():
+            if not isinstance(weights, dict):
+                raise TypeError("`transitions` entries must be dicts of weights")
+            names.extend(n for n in weights if n not in names)
+        names.extend(n for n in transitions or {} if n not in names)
+
+        #: (str)
+        self.name = name
+        #: (list[str]) All sequence names that may be chosen
+        self.names = names
+        self._index = {n: i for i, n in enumerate(names)}
+        self._start = self._make_sampler(mix, "mix")
+        self._transitions = {}
+        for seq_name, weights in (transitions or {}).items():
+            self._transitions[seq_name] = self._make_sampler(
+                weights, f"transitions.{seq_name}"
+            )
+        #: (dict) Expected share of every sequence name (sum: 1.0)
+        self.target = dict(zip(names, self._get_target()))
+
+    def __str__(self):
+        return "SequenceMix<{}: {}>".format(
+            self.name, ", ".join(f"{n}: {p:.1%}" for n, p in self.target.items())
+        )
+
+    def _make_sampler(self, weights, info):
+        """Return a sampler over all names, using `weights` (missing names: 0)."""
+        row = [0.0] * len(self.names)
+        for name, weight in weights.items():
+            if not isinstance(weight, (int, float)) or isinstance(weight, bool):
+                raise TypeError(f"`{info}.{name}`: expected a number, got {weight!r}")
+            row[self._index[name]] = float(weight)
+        try:
+            return AliasSampler(row)
+        except ValueError as e:
+            raise ValueError(f"`{info}`: {e}") from None
+
+    def _get_target(self, max_iterations=10_000, epsilon=1e-12):
+        """Return the long-run share of every name (in `names` order)."""
+        dist = self._start.probabilities
+        if not self._transitions:
+            return dist
+        n = len(self.names)
+        rows = [
+            self._transitions.get(name, self._start).probabilities
+            for name in self.names
+        ]
+        # Power iteration of the 'lazy' chain (P + I) / 2, which has the same
+        # stationary distribution, but also converges for periodic chains
+        for _ in range(max_iterations):
+            next_dist = [0.5 * p for p in dist]
+            for i, p_i in enumerate(dist):
+                if p_i:
+                    row = rows[i]
+                    for j in range(n):
+                        next_dist[j] += 0.5 * p_i * row[j]
+            delta = max(abs(a - b) for a, b in zip(dist, next_dist))
+            dist = next_dist
+            if delta < epsilon:
+                break
+        return dist
+
+    def choose(self, rng=random, prev=None):
+        """Return the name of the next sequence.
+
+        Args:
+            rng (:class:`random.Random`): random number generator
+            prev (str, optional): name of the previous sequence of this mix
+        """
+        sampler = self._transitions.get(prev, self._start)
+        return self.names[sampler.sample(rng)]
@@ -2,21 +2,31 @@
 # Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
 """
 """
+import atexit
+import itertools
 import logging
 import os
 import platform
+import queue
 import random
 import re
 import sys
+import threading
 import types
 import warnings
 from datetime import datetime
 from urllib.parse import urljoin, urlparse
 
-from dateutil.parser import isoparse
+import yaml
 
 from stressor import __version__
 
+try:
+    # Use the (much faster) libyaml based loader, if available
+    from yaml import CSafeLoader as YamlSafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader as YamlSafeLoader
+
 logger = logging.getLogger("stressor")
 
 # Use logger.important("message even in -q mode")
@@ -133,6 +143,11 @@ class PathStack:
         return self.delimiter + self.delimiter.join(stack)
 
 
+def yaml_load(stream):
+    """Parse YAML like `yaml.safe_load()`, but use libyaml if available."""
+    return yaml.load(stream, Loader=YamlSafeLoader)
+
+
 def timetag(seconds=True, ms=False):
     """Return a time stamp string that can be used as (part of a) filename (also sorts well)."""
     now = datetime.now()
@@ -157,8 +172,245 @@ def check_cli_verbose(default=3):
     return verbose
 
 
-def init_logging(verbose=3, path=None):
-    """CLI calls this."""
+class AsyncLogHandler(logging.Handler):
+    """Decouple logging calls from writing to the console and log files.
+
+    Records are put into a queue without acquiring a lock. A background
+    thread collects all records that are available, and writes them as batch
+    to the target `handlers`: one write and flush per stream handler, instead
+    of one per record.
+
+    The queue is bounded: if the background thread cannot keep up, new
+    records are dropped (and counted in `dropped`) instead of growing the
+    memory without limit.
+
+    If `skip_record_info` is true, the process-wide `logging` settings that
+    collect caller, process, and multiprocessing information are disabled
+    (see 'Optimization' in the `logging` docs). They are restored by
+    :meth:`close`.
+    """
+
+    #: Max. number of records per batch
+    BATCH_SIZE = 1000
+    #: Max. number of pending records
+    MAX_QUEUE_SIZE = 100_000
+
+    def __init__(self, handlers, *, max_queue_size=None, skip_record_info=False):
+        super().__init__()
+        #: (list) Handlers that are called by the background thread
+        self.handlers = list(handlers)
+        if max_queue_size is None:
+            max_queue_size = self.MAX_QUEUE_SIZE
+        self.queue = queue.Queue(max_queue_size)
+        #: (int) Number of records that were discarded, because the queue was full
+        self.dropped = 0
+        self._drop_lock = threading.Lock()
+        self._saved_record_info = None
+        if skip_record_info:
+            self._saved_record_info = (
+                logging._srcfile,
+                logging.logProcesses,
+                logging.logMultiprocessing,
+            )
+            logging._srcfile = None
+            logging.logProcesses = False
+            logging.logMultiprocessing = False
+        self._thread = threading.Thread(
+            target=self._run, name="AsyncLogHandler", daemon=True
+        )
+        self._thread.start()
+
+    def handle(self, record):
+        # Bypass the handler lock: the queue is thread-safe
+        if self.filter(record):
+            self.emit(record)
+        return True
+
+    def emit(self, record):
+        if record.args:
+            # Merge now, since the arguments may be modified later
+            record.msg = record.getMessage()
+            record.args = None
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += 1
+
+    def _run(self):
+        q = self.queue
+        while True:
+            batch = [q.get()]
+            try:
+                while len(batch) < self.BATCH_SIZE:
+                    batch.append(q.get_nowait())
+            except queue.Empty:
+                pass
+            stop = None in batch
+            self._write([r for r in batch if r is not None])
+            if stop:
+                return
+
+    def _write(self, batch):
+        for hdlr in self.handlers:
+            records = [r for r in batch if r.levelno >= hdlr.level and hdlr.filter(r)]
+            if not records:
+                continue
+            if not isinstance(hdlr, logging.StreamHandler) or hdlr.stream is None:
+                for record in records:
+                    hdlr.handle(record)
+                continue
+            hdlr.acquire()
+            try:
+                hdlr.stream.write(
+                    "".join(hdlr.format(r) + hdlr.terminator for r in records)
+                )
+                hdlr.flush()
+            except Exception:
+                hdlr.handleError(records[0])
+            finally:
+                hdlr.release()
+
+    def close(self):
+        """Write pending records, stop the background thread, and restore
+        the `logging` settings."""
+        if self._thread.is_alive():
+            try:
+                self.queue.put(None, timeout=5.0)
+                self._thread.join(5.0)
+            except queue.Full:
+                pass
+        if self.dropped and not self._thread.is_alive():
+            self._write(
+                [
+                    logging.makeLogRecord(
+                        {
+                            "name": logger.name,
+                            "levelno": logging.WARNING,
+                            "levelname": "WARNING",
+                            "msg": f"AsyncLogHandler dropped {self.dropped:,} "
+                            "records (queue was full)",
+                        }
+                    )
+                ]
+            )
+        if self._saved_record_info is not None:
+            (
+                logging._srcfile,
+                logging.logProcesses,
+                logging.logMultiprocessing,
+            ) = self._saved_record_info
+            self._saved_record_info = None
+        super().close()
+
+
+class LogSampler:
+    """Decide if a message of a frequent log channel should be logged.
+
+    Example: ``LogSampler({"activity": 100})`` logs only one of 100
+    'Execute ...' lines. Channels that are not listed are always logged.
+    See also ``config.log_sampling``.
+    """
+
+    #: Channel names, see ``config.log_sampling``
+    CHANNELS = frozenset(("activity", "debug"))
+
+    def __init__(self, rates=None):
+        rates = rates or {}
+        if not isinstance(rates, dict):
+            raise TypeError("log_sampling must be a dict")
+        for channel, rate in rates.items():
+            if channel not in self.CHANNELS:
+                raise ValueError(f"log_sampling: unknown channel {channel!r}")
+            if not isinstance(rate, int) or isinstance(rate, bool) or rate < 1:
+                raise ValueError(f"log_sampling.{channel}: expected an int >= 1")
+        #: (dict) Log one of N messages, by channel name
+        self.rates = {k: v for k, v in rates.items() if v > 1}
+        self._counters = {k: itertools.count() for k in self.rates}
+
+    def check(self, channel):
+        """Return True if the next message of `channel` should be logged."""
+        rate = self.rates.get(channel)
+        if rate is None:
+            return True
+        # `next()` on itertools.count is atomic (thread-safe)
+        return next(self._counters[channel]) % rate == 0
+
+
+class ResultRetention:
+    """Decide how an activity result is stored as `context.last_result`.
+
+    Policies (see ``config.result_retention``):
+
+    - 'full': store the result as is
+    - 'truncated:N': store strings shortened to N characters (other
+      non-scalar results are stored as shortened `repr()`)
+    - 'none': never store the result
+    - 'only-when-referenced': store the result as is, but only if the next
+      activity reads `last_result` (detected at compile time)
+    """
+
+    #: Default policy
+    DEFAULT = "full"
+    POLICIES = frozenset(("full", "truncated", "none", "only-when-referenced"))
+
+    def __init__(self, policy=None):
+        policy = policy or self.DEFAULT
+        if not isinstance(policy, str):
+            raise TypeError("result_retention must be a string")
+        name, _, arg = policy.partition(":")
+        if name not in self.POLICIES:
+            raise ValueError(f"result_retention: unknown policy {policy!r}")
+        #: (int) Max. characters for 'truncated' policy
+        self.max_chars = None
+        if name == "truncated":
+            try:
+                self.max_chars = int(arg)
+                if self.max_chars < 20:
+                    raise ValueError
+            except ValueError:
+                raise ValueError(
+                    f"result_retention: expected 'truncated:N' with N >= 20: {policy!r}"
+                ) from None
+        elif arg:
+            raise ValueError(f"result_retention: unexpected argument: {policy!r}")
+        #: (str) Policy name
+        self.policy = name
+
+    def __str__(self):
+        if self.max_chars:
+            return f"ResultRetention<{self.policy}:{self.max_chars}>"
+        return f"ResultRetention<{self.policy}>"
+
+    def apply(self, result, is_referenced=True):
+        """Return the value that should be stored as `last_result`.
+
+        Args:
+            result (any): the activity result
+            is_referenced (bool): False if the next activity is known not to
+                read `last_result`
+        """
+        policy = self.policy
+        if policy == "full":
+            return result
+        elif policy == "only-when-referenced":
+            return result if is_referenced else None
+        elif policy == "none" or result is None:
+            return None
+        if isinstance(result, (bool, int, float)):
+            return result
+        if not isinstance(result, str):
+            result = repr(result)
+        return shorten_string(result, self.max_chars, self.max_chars // 5)
+
+
+def init_logging(verbose=3, path=None, async_log=True):
+    """CLI calls this.
+
+    If `async_log` is true, the handlers of the 'stressor' logger are
+    driven by an :class:`AsyncLogHandler`, so session threads don't block on
+    console or file I/O.
+    """
     if verbose < 1:
         level = logging.CRITICAL
     elif verbose < 2:
@@ -204,6 +456,17 @@ def init_logging(verbose=3, path=None):
         # redirect `logger` to our special log file as well:
         logger.addHandler(hdlr)
 
+    if async_log and not any(isinstance(h, AsyncLogHandler) for h in logger.handlers):
+        handlers = list(logger.handlers)
+        if logger.propagate:
+            handlers.extend(logging.getLogger().handlers)
+        # Our formats don't use caller or process info, so skip the costly
+        # lookups while the handler is active
+        async_handler = AsyncLogHandler(handlers, skip_record_info=True)
+        logger.handlers = [async_handler]
+        logger.propagate = False
+        atexit.register(async_handler.close)
+
     # Silence requests `InsecureRequestWarning` messages
     if verbose < 3:
         warnings.filterwarnings("ignore", message="Unverified HTTPS request")
@@ -607,6 +870,51 @@ def get_random_number(num_or_tuple):
     return v
 
 
+def parse_duration(value):
+    """Return a duration in seconds from a number or a string like '2.5s'.
+
+    Supported string units are 'ms', 's', 'm', and 'h' (default: seconds).
+
+    Raises:
+        ValueError: if `value` is not a valid duration
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    check_arg(value, str)
+    s = value.strip().lower()
+    for unit, factor in (("ms", 0.001), ("s", 1.0), ("m", 60.0), ("h", 3600.0)):
+        if s.endswith(unit):
+            return float(s[: -len(unit)].strip()) * factor
+    return float(s)
+
+
+def parse_size(value):
+    """Return a byte count from a number or a string like '64kB' or '1.5 GiB'.
+
+    Supported string units are 'B', 'kB', 'MB', 'GB' (powers of 1000) and
+    'KiB', 'MiB', 'GiB' (powers of 1024). Units are case-insensitive.
+
+    Raises:
+        ValueError: if `value` is not a valid size
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    check_arg(value, str)
+    s = value.strip().lower()
+    for unit, factor in (
+        ("kib", 1 << 10),
+        ("mib", 1 << 20),
+        ("gib", 1 << 30),
+        ("kb", 1000),
+        ("mb", 1000**2),
+        ("gb", 1000**3),
+        ("b", 1),
+    ):
+        if s.endswith(unit):
+            return int(float(s[: -len(unit)].strip()) * factor)
+    return int(float(s))
+
+
 def datetime_to_iso(dt=None, microseconds=False):
     """Return current UTC datetime as ISO formatted string."""
     if dt is None:
@@ -618,6 +926,8 @@ def datetime_to_iso(dt=None, microseconds=False):
 
 def iso_to_datetime(iso):
     """Convert as ISO formatted datetime string to datetime."""
+    from dateutil.parser import isoparse
+
     # dt = datetime.strptime(iso, "%Y-%m-%dT%H:%M:%S.%fZ")
     dt = isoparse(iso)
 
@@ -703,6 +1013,18 @@ def format_rate(count, time, unit=None, high_prec=False):
     return res
 
 
+def format_bytes(num):
+    """Return a byte count with a decimal unit, e.g. '1.23 MB'."""
+    num = float(num or 0)
+    for unit in ("B", "kB", "MB", "GB"):
+        if num < 1000.0 or unit == "GB":
+            break
+        num /= 1000.0
+    if unit == "B":
+        return f"{int(num)} B"
+    return f"{format_num(num)} {unit}"
+
+
 # def format_relative_datetime(dt, as_html=False):
 #     """Format a datetime object as relative expression (i.e. '3 minutes ago')."""
 #     try:
@@ -0,0 +1,183 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+Run the WebSocket connections of all sessions on a shared asyncio event loop.
+
+Requires the optional `websockets` package (``pip install stressor[websockets]``).
+"""
+import asyncio
+import concurrent.futures
+import re
+import threading
+import time
+from collections import deque
+
+from stressor.session_manager import StoppedError
+from stressor.util import logger
+
+#: Key of the connection dict in `session.data`
+SESSION_DATA_KEY = "websockets"
+
+
+def _get_size(message):
+    return len(message.encode("utf-8") if isinstance(message, str) else message)
+
+
+class WsLoop:
+    """
+    Shared asyncio event loop that drives all :class:`WsConnection` instances.
+
+    The loop runs in one daemon thread, so idle sockets need no thread.
+    Session threads submit coroutines with :meth:`run` and block until they
+    complete (or the session's stop request is set).
+    """
+
+    #: Seconds between two checks of the stop request while waiting
+    STOP_CHECK_INTERVAL = 0.1
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            name="ws_loop", target=self.loop.run_forever, daemon=True
+        )
+        self._thread.start()
+
+    def __str__(self):
+        return f"WsLoop<{len(asyncio.all_tasks(self.loop))} tasks>"
+
+    @classmethod
+    def get(cls):
+        """Return the shared instance."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def run(self, coro, timeout=None, stop_event=None):
+        """Run `coro` on the loop and return its result.
+
+        Raises:
+            TimeoutError: if `timeout` seconds elapsed (the builtin class, also
+                on Python < 3.11, where `asyncio.TimeoutError` is distinct)
+            StoppedError: if `stop_event` was set (the coroutine is cancelled)
+        """
+        if timeout:
+            coro = asyncio.wait_for(coro, timeout)
+        fut = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        while True:
+            concurrent.futures.wait([fut], timeout=self.STOP_CHECK_INTERVAL)
+            if fut.done():
+                try:
+                    return fut.result()
+                except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
+                    raise TimeoutError from None
+            if stop_event is not None and stop_event.is_set():
+                fut.cancel()
+                raise StoppedError
+
+
+class WsConnection:
+    """
+    WebSocket connection of a session, created by the `WsConnect` activity.
+
+    Round-trip latencies are measured from a sent message to the next message
+    that matches a `WsExpect` activity. Several messages may be sent before
+    they are expected (e.g. a request/response protocol with pipelining).
+    Skipped messages (e.g. server pushes) don't count as responses.
+
+    Args:
+        session (:class:`~stressor.session_manager.SessionManager`):
+        key (str): Name of the stats bucket, e.g. the activity's compile path
+        url (str): Absolute URL (``ws://`` or ``wss://``)
+    """
+
+    def __init__(self, session, key, url):
+        self.session = session
+        self.key = key
+        self.url = url
+        self._ws = None
+        # Monotonic send times of messages that wait for a response
+        self._pending = deque()
+
+    def __str__(self):
+        return f"WsConnection<{self.session.session_id}, {self.url}>"
+
+    @property
+    def is_open(self):
+        return self._ws is not None
+
+    def _run(self, coro, timeout):
+        return WsLoop.get().run(coro, timeout, self.session.stop_request)
+
+    def open(self, headers=None, timeout=None):
+        """Connect and perform the opening handshake."""
+        from websockets.asyncio.client import connect
+
+        async def _connect():
+            return await connect(
+                self.url,
+                additional_headers=headers,
+                open_timeout=None,  # `timeout` is applied by `WsLoop.run()`
+                close_timeout=timeout,
+            )
+
+        self._ws = self._run(_connect(), timeout)
+
+    def send(self, message, timeout=None):
+        """Send a text or binary message."""
+        self._run(self._ws.send(message), timeout)
+        self._pending.append(time.monotonic())
+        self.session.add_transfer(_get_size(message), 0)
+        self.session.stats.report_ws(self.session, self.key, sent=1)
+
+    def expect(self, pattern=None, timeout=None):
+        """Return the next message that matches the regular expression `pattern`.
+
+        Messages that don't match are discarded.
+
+        Returns:
+            (str|bytes, int) the message and the number of skipped messages
+        Raises:
+            TimeoutError:
+        """
+        rex = re.compile(pattern) if pattern else None
+        return self._run(self._expect(rex), timeout)
+
+    async def _expect(self, rex):
+        skipped = 0
+        session = self.session
+        while True:
+            message = await self._ws.recv()
+            now = time.monotonic()
+            session.add_transfer(0, _get_size(message))
+            text = (
+                message
+                if isinstance(message, str)
+                else message.decode(errors="replace")
+            )
+            if rex is None or rex.match(text):
+                rtt = now - self._pending.popleft() if self._pending else None
+                session.stats.report_ws(session, self.key, received=1, rtt=rtt)
+                return message, skipped
+            session.stats.report_ws(session, self.key, received=1)
+            skipped += 1
+
+    def close(self, timeout=None):
+        """Perform the closing handshake (errors are ignored)."""
+        ws, self._ws = self._ws, None
+        if ws is None:
+            return
+        try:
+            WsLoop.get().run(ws.close(), timeout)
+        except Exception as e:
+            logger.warning(f"{self}: close failed: {e!r}")
+
+
+def close_session_connections(session, timeout=None):
+    """Close all WebSocket connections of a session (called when it ends)."""
+    connections = session.data.pop(SESSION_DATA_KEY, None) or {}
+    for conn in connections.values():
+        conn.close(timeout)
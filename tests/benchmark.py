@@ -0,0 +1,400 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+Self-overhead benchmarks for the stressor engine.
+
+Measure how much time and memory stressor itself spends per activity, so
+regressions in the engine become visible.
+
+Usage::
+
+    $ python -m tests.benchmark
+    $ python -m tests.benchmark --quick --output build/benchmark/latest.json
+
+Results are printed as table and written as JSON file (default:
+`build/benchmark/benchmark_<timetag>.json`).
+"""
+# ruff: noqa: T201, T203 `print` found
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from textwrap import dedent
+
+from stressor import __version__
+from stressor.config_manager import replace_var_macros
+from stressor.plugin_manager import PluginManager
+from stressor.run_manager import RunManager
+from stressor.statistic_manager import StatisticManager
+from stressor.util import PYTHON_VERSION, AsyncLogHandler, logger, timetag
+
+SCENARIO_TMPL = """\
+file_version: stressor#0
+config:
+  name: benchmark_{name}
+  base_url: {base_url}
+  request_timeout: 5.0
+context:
+  item_id: 42
+  search_term: foo
+sessions:
+  users:
+    - name: bench_user
+      password: secret
+  count: {count}
+scenario:
+  - sequence: main
+    repeat: {repeat}
+sequences:
+  main:
+{activities}
+"""
+
+SLEEP_ACTIVITY = """\
+    - activity: Sleep
+      duration: 0
+"""
+
+HTTP_ACTIVITY = """\
+    - activity: GetRequest
+      url: /item/$(item_id)?q=$(search_term)
+"""
+
+
+class _NoOpHandler(BaseHTTPRequestHandler):
+    """Return an empty `204 No Content` response for every GET request."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class NoOpServer:
+    """In-process HTTP server that runs in a daemon thread."""
+
+    def __init__(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _NoOpHandler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(
+            name="benchmark.noop_server", target=self.httpd.serve_forever, daemon=True
+        )
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _FakeSession:
+    """Minimal stand-in for :class:`SessionManager` as used by StatisticManager."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.user = _FakeUser()
+        self.context_stack = f"/h1/p1/{session_id}"
+        self.pending_sequence = None
+        self.sequence_start = None
+        self.pending_activity = None
+        self.activity_start = None
+
+    def pop_transfer(self):
+        return (0, 0)
+
+    pop_branch_transfer = pop_transfer
+
+
+class _FakeUser:
+    name = "bench_user"
+
+
+class _FakeActivity:
+    compile_path = "/main/#01/Sleep(duration=0)"
+    monitor = False
+    ignore_timing = False
+
+
+def _time_loop(fn, count):
+    """Call `fn()` `count` times and return the mean duration in microseconds."""
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return 1e6 * (time.perf_counter() - start) / count
+
+
+def bench_replace_var_macros(count):
+    context = {
+        "base_url": "http://127.0.0.1:8082",
+        "item_id": 42,
+        "user": {"name": "joe", "password": "secret"},
+    }
+    template = {
+        "url": "$(base_url)/item/$(item_id)",
+        "params": {"user": "$(user.name)", "page": 3},
+        "timeout": 5.0,
+    }
+
+    def _run():
+        replace_var_macros(dict(template, params=dict(template["params"])), context)
+
+    return _time_loop(_run, count)
+
+
+def bench_stats_report(count):
+    stats = StatisticManager()
+    stats.register_sequence("main")
+    session = _FakeSession("t01")
+    stats.register_session(session)
+    activity = _FakeActivity()
+
+    def _run():
+        stats.report_start(session, "main", activity, path="/h1/p1/t01")
+        stats.report_end(session, "main", activity)
+
+    # One start/end pair is two `_report()` calls:
+    return _time_loop(_run, count) / 2
+
+
+def bench_publish(count, hook_count):
+    rm = RunManager()
+    for _ in range(hook_count):
+        rm.subscribe("end_activity", lambda channel, *args, **kwargs: None)
+
+    def _run():
+        rm.publish("end_activity", session=None, path="/h1/p1/t01", elap=0.0)
+
+    return _time_loop(_run, count)
+
+
+def bench_logging(count, async_log):
+    """Return the cost in the calling thread of writing a log line to a file."""
+    bench_logger = logging.getLogger("stressor.benchmark")
+    bench_logger.propagate = False
+    bench_logger.setLevel(logging.INFO)
+    with tempfile.TemporaryDirectory() as folder:
+        file_handler = logging.FileHandler(os.path.join(folder, "bench.log"))
+        file_handler.setFormatter(
+            logging.Formatter("%(asctime)s <%(thread)05d> %(levelname)-7s %(message)s")
+        )
+        handler = AsyncLogHandler([file_handler]) if async_log else file_handler
+        bench_logger.addHandler(handler)
+
+        def _run():
+            bench_logger.info("Execute /h1/p1/t01/main/#01/Sleep(duration=0)")
+
+        try:
+            res = _time_loop(_run, count)
+        finally:
+            bench_logger.removeHandler(handler)
+            handler.close()
+            file_handler.close()
+    return res
+
+
+def run_scenario(folder, name, count, repeat, activity_count, base_url, http):
+    """Run a generated scenario and return a dict of measured values.
+
+    The scenario is run twice: first for timing, then again with `tracemalloc`
+    enabled (which slows down execution considerably) to measure memory.
+    """
+    activities = (HTTP_ACTIVITY if http else SLEEP_ACTIVITY) * activity_count
+    scenario = SCENARIO_TMPL.format(
+        name=name,
+        base_url=base_url,
+        count=count,
+        repeat=repeat,
+        activities=activities,
+    )
+    path = os.path.join(folder, f"{name}.yaml")
+    with open(path, "w") as f:
+        f.write(scenario)
+
+    options = {"monitor": False, "log_summary": False}
+
+    rm = RunManager()
+    rm.load_config(path)
+    gc.collect()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    res = rm.run(options)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    act_count = rm.stats["act_count"]
+
+    rm = RunManager()
+    rm.load_config(path)
+    gc.collect()
+    tracemalloc.start()
+    mem_base = tracemalloc.get_traced_memory()[0]
+    res = rm.run(options) and res
+    _mem_cur, mem_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "name": name,
+        "ok": res,
+        "sessions": count,
+        "activities": act_count,
+        "wall_sec": wall,
+        "cpu_sec": cpu,
+        # Activities per CPU-second of the stressor process
+        "act_per_sec_per_core": act_count / cpu if cpu else None,
+        "act_per_sec": act_count / wall if wall else None,
+        "overhead_usec_per_act": 1e6 * cpu / act_count if act_count else None,
+        "mem_peak_bytes": mem_peak - mem_base,
+        "mem_bytes_per_session": (mem_peak - mem_base) / count,
+    }
+
+
+def run_benchmarks(quick=False, session_counts=(1, 100, 1000)):
+    loops = 2_000 if quick else 20_000
+    act_total = 2_000 if quick else 20_000
+    results = {
+        "meta": {
+            "stressor_version": __version__,
+            "python": PYTHON_VERSION,
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": timetag(),
+            "quick": quick,
+        },
+        "micro": {
+            "replace_var_macros_usec": bench_replace_var_macros(loops),
+            "stats_report_usec": bench_stats_report(loops),
+            "publish_no_hooks_usec": bench_publish(loops, 0),
+            "publish_one_hook_usec": bench_publish(loops, 1),
+            "log_sync_usec": bench_logging(loops, async_log=False),
+            "log_async_usec": bench_logging(loops, async_log=True),
+        },
+        "scenarios": [],
+    }
+
+    with tempfile.TemporaryDirectory() as folder, NoOpServer() as server:
+        for count in session_counts:
+            # Distribute (roughly) the same total activity count over all
+            # sessions, but run at least one sequence with ten activities each
+            repeat = max(1, act_total // (10 * count))
+            results["scenarios"].append(
+                run_scenario(
+                    folder,
+                    f"sleep0_s{count}",
+                    count,
+                    repeat,
+                    10,
+                    server.base_url,
+                    http=False,
+                )
+            )
+        results["scenarios"].append(
+            run_scenario(
+                folder,
+                "http_noop_s1",
+                1,
+                max(1, act_total // 100),
+                10,
+                server.base_url,
+                http=True,
+            )
+        )
+    return results
+
+
+def format_results(results):
+    lines = []
+    ap = lines.append
+    meta = results["meta"]
+    ap(
+        "Stressor {stressor_version} benchmark, Python {python} ({implementation}), "
+        "{cpu_count} CPUs".format(**meta)
+    )
+    ap("Micro benchmarks (µs per call):")
+    for k, v in results["micro"].items():
+        ap(f"  {k:<28} {v:>10.2f}")
+    ap("Scenarios:")
+    ap(
+        "  {:<16} {:>8} {:>10} {:>12} {:>14} {:>14}".format(
+            "name", "sessions", "acts", "acts/sec/core", "µs/activity", "bytes/session"
+        )
+    )
+    for s in results["scenarios"]:
+        ap(
+            "  {:<16} {:>8,} {:>10,} {:>12,.0f} {:>14.1f} {:>14,.0f}{}".format(
+                s["name"],
+                s["sessions"],
+                s["activities"],
+                s["act_per_sec_per_core"] or 0,
+                s["overhead_usec_per_act"] or 0,
+                s["mem_bytes_per_session"],
+                "" if s["ok"] else "  (ERRORS)",
+            )
+        )
+    return "\n".join(lines)
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description=dedent(__doc__).strip().split("\n")[0],
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="run fewer iterations (for smoke tests)"
+    )
+    parser.add_argument(
+        "--sessions",
+        default="1,100,1000",
+        help="comma separated list of session counts (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--output",
+        help="path of the JSON result file "
+        "(default: build/benchmark/benchmark_<timetag>.json)",
+    )
+    args = parser.parse_args()
+
+    # We want to measure the engine, not the console:
+    logging.basicConfig(level=logging.ERROR, format="%(message)s")
+    logger.setLevel(logging.ERROR)
+
+    PluginManager.register_plugins(arg_parser=None)
+
+    session_counts = [int(s) for s in args.sessions.split(",")]
+    results = run_benchmarks(quick=args.quick, session_counts=session_counts)
+
+    output = args.output
+    if not output:
+        output = os.path.join(
+            "build",
+            "benchmark",
+            "benchmark_{}.json".format(results["meta"]["timestamp"]),
+        )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(format_results(results))
+    print(f"Wrote results to {output}")
+    return 0 if all(s["ok"] for s in results["scenarios"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -3,9 +3,11 @@
 """
 """
 import os
+import shutil
 
 import pytest
 
+from stressor.config_cache import ConfigCache
 from stressor.config_manager import (
     ConfigManager,
     ConfigurationError,
@@ -80,6 +82,51 @@ class TestConfigReader:
 
         return
 
+    def test_config_cache(self, tmp_path, monkeypatch):
+        cache_dir = tmp_path / "cache"
+        monkeypatch.setenv("STRESSOR_CACHE_DIR", str(cache_dir))
+        for name in ("test_dry_run.yaml", "users.yaml", "script_1.py"):
+            shutil.copy(os.path.join(self.fixtures_path, name), tmp_path)
+        path = str(tmp_path / "test_dry_run.yaml")
+
+        cm = ConfigManager(StatisticManager())
+        cm.read(path, use_cache=True)
+        assert cm.dependencies[0][:2] == ("file", str(tmp_path / "users.yaml"))
+        assert len(os.listdir(cache_dir)) == 1
+
+        # Cache hit: activities are still instantiated
+        cm = ConfigManager(StatisticManager())
+        cm.read(path, use_cache=True)
+        assert cm.dependencies == [], "YAML was not compiled again"
+        activity_dict = cm.sequences["init"][1]
+        assert activity_dict["activity"].__class__.__name__ == "SleepActivity"
+        assert cm.sessions["users"][0]["name"] == "User_1"
+
+        # A modified `$load()` dependency invalidates the entry
+        users = (tmp_path / "users.yaml").read_text()
+        (tmp_path / "users.yaml").write_text(users.replace("User_1", "User_X"))
+        cm = ConfigManager(StatisticManager())
+        cm.read(path, use_cache=True)
+        assert cm.dependencies, "YAML was compiled again"
+        assert cm.sessions["users"][0]["name"] == "User_X"
+
+        # Configurations that read environment variables are never cached
+        monkeypatch.setenv("STRESSOR_TEST_SECRET", "s3cret")
+        env_path = tmp_path / "test_env.yaml"
+        env_path.write_text(
+            (tmp_path / "test_dry_run.yaml")
+            .read_text()
+            .replace('new_title: "test"', "new_title: $env(STRESSOR_TEST_SECRET)")
+        )
+        cm = ConfigManager(StatisticManager())
+        cm.read(str(env_path), use_cache=True)
+        assert cm.config_all["context"]["new_title"] == "s3cret"
+        assert len(os.listdir(cache_dir)) == 1
+
+        # An empty cache folder disables caching
+        monkeypatch.setenv("STRESSOR_CACHE_DIR", "")
+        assert ConfigCache().folder is None
+
     # def test_read_scenario_2(self):
     #     path = os.path.join(self.fixtures_path, "test_mock_server")
     #     cr = ConfigManager(None)
@@ -7,7 +7,7 @@ import os
 
 import pytest
 
-from stressor.context_stack import ContextStack
+from stressor.context_stack import ContextFrame, ContextStack
 
 
 class TestContextStack:
@@ -61,3 +61,78 @@ class TestContextStack:
         with pytest.raises(RuntimeError):
             for i in range(ContextStack.MAX_DEPTH + 1):
                 cm.push(f"t{i:02}", {})
+
+    def test_copy_on_write(self):
+        users = [{"name": f"user_{i}"} for i in range(1000)]
+        base = {"users": users, "url": "page_1"}
+        cm = ContextStack("root", base)
+        ctx = cm.context
+        assert isinstance(ctx, ContextFrame)
+        assert ctx["users"] is users, "not copied"
+
+        # Writes are stored in the frame, not in the original dict
+        ctx["url"] = "page_2"
+        ctx.setdefault("session_id", "t1")
+        assert base == {"users": users, "url": "page_1"}
+        assert ctx == {"users": users, "url": "page_2", "session_id": "t1"}
+        assert dict.keys(ctx) == {"url", "session_id"}
+
+        # A new scope shares all entries and discards changes on pop
+        cm.push("t2", {"url": "page_3"}, copy_data=True)
+        assert cm.get_attr("users.[1].name") == "user_1"
+        assert cm.get_attr("url") == "page_3"
+        del cm.context["users"]
+        assert "users" not in cm.context
+        assert cm.context.get("users") is None
+        assert cm.context.copy() == {"url": "page_3", "session_id": "t1"}
+        cm.pop()
+        assert cm.context["users"] is users
+
+        # The flattened parent dict is invalidated when the parent changes
+        child = ContextFrame(ctx)
+        assert child["url"] == "page_2"
+        ctx["url"] = "page_4"
+        assert child["url"] == "page_4"
+        assert child.pop("url") == "page_4"
+        assert "url" not in child and ctx["url"] == "page_4"
+        child.update(url="page_5")
+        assert sorted(child.items()) == [
+            ("session_id", "t1"),
+            ("url", "page_5"),
+            ("users", users),
+        ]
+        child.clear()
+        assert len(child) == 0 and len(ctx) == 3
+
+        # Writes to a frame don't rebuild the flattened dicts of its ancestors
+        grandchild = ContextFrame(child)
+        ctx_flat = ctx.flatten()
+        grandchild["last_result"] = 1
+        child["last_result"] = 2
+        assert ctx.flatten() is ctx_flat
+        assert grandchild["last_result"] == 1 and child["last_result"] == 2
+        ctx["url"] = "page_6"
+        assert ctx.flatten() is ctx_flat
+        assert "url" not in grandchild
+        child["url"] = "page_7"
+        assert grandchild["url"] == "page_7"
+
+        assert child.popitem() == ("url", "page_7")
+        assert child.popitem() == ("last_result", 2)
+        with pytest.raises(KeyError):
+            child.popitem()
+
+    def test_branch(self):
+        cm = ContextStack("root", {"url": "page_1"})
+        cm.push("t1")
+        cm.context["user"] = "u1"
+        branch = cm.branch()
+        assert branch.path() == cm.path() == "/root/t1"
+        assert branch.context["user"] == "u1"
+        # Writes are isolated
+        branch.context["url"] = "page_2"
+        assert cm.context["url"] == "page_1"
+        assert list(branch.context.own_items()) == [("url", "page_2")]
+        with branch.enter("#01"):
+            assert branch.path() == "/root/t1/#01"
+        assert cm.path() == "/root/t1"
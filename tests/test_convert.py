@@ -3,12 +3,19 @@
 """
 """
 
+import io
+import json
 import os
+import shutil
 import tempfile
 
 import pytest
 
+from stressor.config_manager import ConfigManager
 from stressor.convert.har_converter import HarConverter
+from stressor.convert.har_stream import JsonStream, SortedSpool, iter_har_entries
+from stressor.plugin_manager import PluginManager
+from stressor.statistic_manager import StatisticManager
 
 
 class TestConvert:
@@ -37,6 +44,153 @@ class TestConvert:
         # assert 'url: "http://127.0.0.1:8082/test1.json"' in yaml
         # assert 0
 
+    def _convert(self, har_name, target_folder, **opts):
+        opts.update(
+            {
+                "fspec": os.path.join(self.fixtures_path, har_name),
+                "target_folder": target_folder,
+            }
+        )
+        conv = HarConverter(opts)
+        conv.run()
+        with open(os.path.join(target_folder, "main_sequence.yaml")) as fp:
+            lines = [line for line in fp if "Auto-generated" not in line]
+        return conv, lines
+
+    def test_streaming(self, tmp_path, monkeypatch):
+        # Use tiny chunks and runs, so buffer boundaries and merging are tested
+        monkeypatch.setattr(JsonStream, "CHUNK_SIZE", 13)
+        (tmp_path / "a").mkdir()
+        (tmp_path / "b").mkdir()
+        conv, lines = self._convert("har_4.har", str(tmp_path / "a"), streaming=False)
+        conv_2, lines_2 = self._convert(
+            "har_4.har", str(tmp_path / "b"), streaming=True, sort_run_size=5
+        )
+        assert conv_2._spool.run_count == 0, "closed"
+        assert lines_2 == lines
+        assert conv_2.stats == conv.stats
+        assert conv_2.har_version == conv.har_version
+
+    def test_json_stream(self):
+        data = {
+            "log": {
+                "entries": [
+                    {
+                        "startedDateTime": "2020-01-01T00:00:01Z",
+                        "request": {"url": 'http://x/"\\\\'},
+                        "response": {
+                            "status": 200,
+                            "content": {"size": 12, "text": 'a \\" [{ b'},
+                        },
+                    },
+                    {"startedDateTime": 12.5e3, "_custom": [1, {"a": "}"}]},
+                ],
+                "version": "1.2",
+            }
+        }
+        fp = io.StringIO(json.dumps(data))
+        JsonStream.CHUNK_SIZE, prev = 3, JsonStream.CHUNK_SIZE
+        try:
+            log_info = {}
+            entries = list(iter_har_entries(fp, log_info))
+        finally:
+            JsonStream.CHUNK_SIZE = prev
+        assert entries == [
+            {
+                "startedDateTime": "2020-01-01T00:00:01Z",
+                "request": {"url": 'http://x/"\\\\'},
+                "response": {"content": {"size": 12}},
+            },
+            {"startedDateTime": 12.5e3},
+        ]
+        assert log_info == {"version": "1.2"}
+
+    def test_sorted_spool(self):
+        spool = SortedSpool(key=lambda e: e[0], run_size=3)
+        items = [(5, "a"), (1, "b"), (5, "c"), (0, "d"), (1, "e"), (9, "f"), (5, "g")]
+        for item in items:
+            spool.append(item)
+        assert len(spool) == 7
+        assert spool.run_count == 2
+        assert list(spool) == sorted(items, key=lambda e: e[0])
+        spool.close()
+
+    def test_default_target(self, tmp_path, monkeypatch):
+        har_folder = tmp_path / "hars"
+        har_folder.mkdir()
+        shutil.copy(os.path.join(self.fixtures_path, "har_1.har"), har_folder)
+        work_folder = tmp_path / "work"
+        work_folder.mkdir()
+        monkeypatch.chdir(work_folder)
+        get_target = HarConverter._get_default_target
+        assert get_target(str(har_folder / "har_1.har")) == str(work_folder / "har_1")
+        assert get_target(str(har_folder)) == str(work_folder / "hars")
+        assert get_target(str(har_folder / "*.har")) == str(work_folder / "hars")
+        expected = str(work_folder / tmp_path.name)
+        assert get_target(str(tmp_path / "h*" / "*.har")) == expected
+        # Never write into the source folder
+        monkeypatch.chdir(tmp_path)
+        assert get_target(str(har_folder / "*.har")) == str(tmp_path / "hars_scenario")
+
+    def test_batch(self, tmp_path):
+        har_folder = tmp_path / "hars"
+        har_folder.mkdir()
+        for name in ("har_1.har", "har_3.har", "har_4.har"):
+            shutil.copy(os.path.join(self.fixtures_path, name), har_folder)
+        # An identical request chain
+        shutil.copy(har_folder / "har_1.har", har_folder / "1 copy.har")
+        target_folder = tmp_path / "scenario"
+
+        conv = HarConverter(
+            {
+                "fspec": str(har_folder),
+                "target_folder": str(target_folder),
+                "max_workers": 2,
+                "skip_externals": False,
+            }
+        )
+        conv.run()
+
+        assert [j["name"] for j in conv.journeys] == [
+            "seq_1_copy",
+            "har_1",
+            "har_3",
+            "har_4",
+        ]
+        assert conv.stats["shared_sequences"] == 1
+        assert sorted(os.listdir(target_folder)) == [
+            "har_3_sequence.yaml",
+            "har_4_sequence.yaml",
+            "scenario.yaml",
+            "seq_1_copy_sequence.yaml",
+            "users.yaml",
+        ]
+
+        PluginManager.register_plugins(arg_parser=None)
+        cm = ConfigManager(StatisticManager())
+        cm.read(str(target_folder / "scenario.yaml"))
+        assert [s["sequence"] for s in cm.scenario] == [
+            "init",
+            "seq_1_copy",
+            "har_1",
+            "har_3",
+            "har_4",
+            "end",
+        ]
+        urls = [a.get("url") for a in cm.sequences["har_1"]]
+        assert urls == [a.get("url") for a in cm.sequences["seq_1_copy"]]
+
+        # Glob patterns are supported as well
+        conv = HarConverter(
+            {
+                "fspec": str(har_folder / "har_[34].har"),
+                "target_folder": str(tmp_path / "scenario_2"),
+                "max_workers": 1,
+            }
+        )
+        conv.run()
+        assert [j["name"] for j in conv.journeys] == ["har_3", "har_4"]
+
     def test_2(self):
         # This test is only useful to inspect the folder while developing
         # TODO: remove later
@@ -0,0 +1,107 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+"""
+import os
+from collections import defaultdict
+
+import pytest
+
+from stressor.feeder import Feeder, FeederExhaustedError
+from stressor.plugin_manager import PluginManager
+from stressor.run_manager import RunManager
+
+
+class TestFeeder:
+    def setup_method(self):
+        self.fixtures_path = os.path.join(os.path.dirname(__file__), "fixtures")
+        self.csv_path = os.path.join(self.fixtures_path, "feed_products.csv")
+        self.jsonl_path = os.path.join(self.fixtures_path, "feed_terms.jsonl")
+        PluginManager.register_plugins(arg_parser=None)
+
+    def _read_all(self, feeder, session_index=0):
+        res = []
+        while True:
+            try:
+                res.append(feeder.next_row(session_index))
+            except FeederExhaustedError:
+                return res
+
+    def test_sequential(self):
+        feeder = Feeder("products", self.csv_path)
+        assert feeder.fieldnames == ["sku", "name"]
+        rows = self._read_all(feeder)
+        assert len(rows) == 20
+        assert rows[0] == {"sku": "P001", "name": "Product 1"}
+        assert rows[-1]["sku"] == "P020"
+        feeder.close()
+
+    def test_circular(self):
+        feeder = Feeder("terms", self.jsonl_path, mode="circular")
+        terms = [feeder.next_row()["term"] for _ in range(7)]
+        assert terms == ["foo", "bar", "baz", "foo", "bar", "baz", "foo"]
+        feeder.close()
+
+    def test_partition(self):
+        feeder = Feeder("products", self.csv_path, mode="partition", partitions=3)
+        parts = [self._read_all(feeder, i) for i in range(3)]
+        skus = [row["sku"] for part in parts for row in part]
+        # All rows are used exactly once and in order
+        assert skus == [f"P{i:03}" for i in range(1, 21)]
+        assert all(len(part) >= 5 for part in parts)
+        feeder.close()
+
+    def test_random(self):
+        feeder = Feeder("products", self.csv_path, mode="random")
+        skus = {feeder.next_row()["sku"] for _ in range(200)}
+        assert len(skus) > 10
+        assert skus.issubset({f"P{i:03}" for i in range(1, 21)})
+        feeder.close()
+
+    def test_random_uniform(self, tmp_path):
+        # Rows of very different lengths (and a blank line) have the same chance
+        path = tmp_path / "terms.jsonl"
+        rows = ["a", "b" * 1000, "", "c", "d" * 200, ""]
+        path.write_text("".join(f'{{"t": "{t}"}}\n' if t else "\n" for t in rows))
+        feeder = Feeder("terms", str(path), mode="random", random_seed=42)
+        counts = defaultdict(int)
+        for _ in range(4000):
+            counts[feeder.next_row()["t"][0]] += 1
+        feeder.close()
+        assert sorted(counts.keys()) == ["a", "b", "c", "d"]
+        assert all(850 < n < 1150 for n in counts.values())
+
+        # Seeded feeders are reproducible
+        feeder = Feeder("terms", str(path), mode="random", random_seed=42)
+        counts_2 = defaultdict(int)
+        for _ in range(4000):
+            counts_2[feeder.next_row()["t"][0]] += 1
+        feeder.close()
+        assert counts_2 == counts
+
+    def test_errors(self):
+        with pytest.raises(ValueError):
+            Feeder("products", self.csv_path, mode="foo")
+        with pytest.raises(ValueError, match="path"):
+            Feeder.check_options("products", {"mode": "circular"})
+        with pytest.raises(ValueError, match="unsupported"):
+            Feeder.check_options("products", {"path": "x.csv", "foo": 1})
+
+    def test_run(self):
+        config_path = os.path.join(self.fixtures_path, "test_feeders.yaml")
+        rm = RunManager()
+        skus = defaultdict(list)
+
+        def notify_hook(channel, *args, **kwargs):
+            if kwargs["sequence"] is rm.config_manager.sequences["main"]:
+                feed = kwargs["context"]["feed"]
+                skus[kwargs["session_id"]].append(feed["products"]["sku"])
+
+        rm.subscribe("end_activity", notify_hook)
+        rm.load_config(config_path)
+        res = rm.run({})
+        assert res is True
+        assert set(skus.keys()) == {"t01", "t02"}
+        assert skus["t01"] == ["P001", "P002", "P003", "P004", "P005"]
+        assert len(skus["t02"]) == 5
+        assert not set(skus["t01"]).intersection(skus["t02"])
@@ -0,0 +1,96 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+"""
+from types import SimpleNamespace
+
+from stressor.http_cache import HttpCache, parse_cache_control
+
+NOW = 1_600_000_000.0  # 2020-09-13 12:26:40 GMT
+
+
+def _response(status=200, size=100, **headers):
+    headers = {k.replace("_", "-"): v for k, v in headers.items()}
+    return SimpleNamespace(status_code=status, headers=headers, content=b"x" * size)
+
+
+class TestHttpCache:
+    def test_cache_control(self):
+        assert parse_cache_control("public, max-age=60") == {
+            "public": None,
+            "max-age": "60",
+        }
+        assert parse_cache_control('No-Cache="Set-Cookie"') == {
+            "no-cache": "Set-Cookie"
+        }
+        assert parse_cache_control(None) == {}
+
+    def test_freshness(self):
+        cache = HttpCache(10_000)
+        assert cache.lookup("/a", now=NOW) == (False, {})
+
+        assert cache.store("/a", _response(Cache_Control="max-age=60"), now=NOW)
+        assert cache.lookup("/a", now=NOW + 59) == (True, {})
+        # Expired and no validators
+        assert cache.lookup("/a", now=NOW + 61) == (False, {})
+
+        assert not cache.store("/b", _response(Cache_Control="no-store"), now=NOW)
+        assert not cache.store("/b", _response(status=404, ETag='"1"'), now=NOW)
+        # Neither fresh nor validatable
+        assert not cache.store("/b", _response(), now=NOW)
+
+        # Expires relative to the server's date
+        cache.store(
+            "/c",
+            _response(
+                Date="Sun, 13 Sep 2020 12:00:00 GMT",
+                Expires="Sun, 13 Sep 2020 13:00:00 GMT",
+            ),
+            now=NOW,
+        )
+        assert cache.lookup("/c", now=NOW + 3599)[0]
+        assert not cache.lookup("/c", now=NOW + 3601)[0]
+
+        # Heuristic: 10% of 10 days
+        cache.store(
+            "/d",
+            _response(
+                Date="Sun, 13 Sep 2020 12:00:00 GMT",
+                Last_Modified="Thu, 03 Sep 2020 12:00:00 GMT",
+            ),
+            now=NOW,
+        )
+        assert cache.lookup("/d", now=NOW + 86_000)[0]
+        assert cache.lookup("/d", now=NOW + 86_500) == (
+            False,
+            {"If-Modified-Since": "Thu, 03 Sep 2020 12:00:00 GMT"},
+        )
+
+    def test_revalidation(self):
+        cache = HttpCache(10_000)
+        cache.store("/a", _response(Cache_Control="no-cache", ETag='"v1"'), now=NOW)
+        assert cache.lookup("/a", now=NOW) == (False, {"If-None-Match": '"v1"'})
+
+        # 304 makes the entry fresh again
+        cache.store("/a", _response(304, 0, Cache_Control="max-age=10"), now=NOW)
+        assert cache.lookup("/a", now=NOW + 5) == (True, {})
+        assert cache.lookup("/a", now=NOW + 15) == (False, {"If-None-Match": '"v1"'})
+        assert cache.size == 100
+
+        # 304 for an unknown URL is ignored
+        assert not cache.store("/b", _response(304, 0), now=NOW)
+
+    def test_lru(self):
+        cache = HttpCache(250)
+        for url in ("/a", "/b"):
+            cache.store(url, _response(Cache_Control="max-age=60"), now=NOW)
+        # Access '/a', so '/b' is the least recently used entry
+        assert cache.lookup("/a", now=NOW)[0]
+        cache.store("/c", _response(Cache_Control="max-age=60"), now=NOW)
+        assert len(cache) == 2
+        assert cache.size == 200
+        assert cache.lookup("/a", now=NOW)[0]
+        assert not cache.lookup("/b", now=NOW)[0]
+        # Responses that exceed the max. size are not stored
+        assert not cache.store("/d", _response(size=300, ETag='"1"'), now=NOW)
+        assert len(cache) == 2
@@ -0,0 +1,183 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+"""
+import os
+import time
+
+import pytest
+
+from stressor.load_profile import KneeFinder, LoadProfile
+from stressor.plugin_manager import PluginManager
+from stressor.run_manager import RunManager
+from stressor.statistic_manager import LatencyHistogram
+
+
+class _FakeStats:
+    """Return predefined step results for :class:`KneeFinder`."""
+
+    def __init__(self, p99_by_target):
+        self.p99_by_target = p99_by_target
+        self.stats = {}
+        self.targets = {}
+
+    def get_load_stage_info(self, name):
+        target = self.targets[name]
+        return {
+            "name": name,
+            "target": target,
+            "p99": self.p99_by_target[target],
+            "error_rate": 0.0,
+            "act_rate": 10.0 * target,
+        }
+
+
+def _run_knee_finder(kf, stats):
+    elap = 0.0
+    targets = []
+    while True:
+        stage, target = kf.get_target(elap)
+        if stage is None:
+            break
+        stats.targets[stage["name"]] = stage["target"]
+        targets.append(target)
+        elap += 1.0
+    return targets
+
+
+class TestLoadProfile:
+    def setup_method(self):
+        self.fixtures_path = os.path.join(os.path.dirname(__file__), "fixtures")
+        PluginManager.register_plugins(arg_parser=None)
+
+    def test_curve(self):
+        lp = LoadProfile(
+            [
+                {"name": "up", "target": 100, "duration": 10},
+                {"name": "hold", "target": 100, "duration": 10},
+                {"name": "spike", "target": 300, "duration": 5, "ramp": 0},
+                {"target": 0, "duration": 10},
+            ]
+        )
+        assert lp.duration == 35
+        assert lp.max_target == 300
+
+        def _get(elap):
+            stage, target = lp.get_target(elap)
+            return (stage["name"] if stage else None, target)
+
+        assert _get(0) == ("up", 0)
+        assert _get(5) == ("up", 50)
+        assert _get(10) == ("hold", 100)
+        assert _get(19.9) == ("hold", 100)
+        assert _get(20) == ("spike", 300)
+        assert _get(25) == ("stage_4", 300)
+        assert _get(30) == ("stage_4", 150)
+        assert _get(35) == (None, 0)
+
+    def test_errors(self):
+        with pytest.raises(ValueError, match="at least one stage"):
+            LoadProfile([])
+        with pytest.raises(ValueError, match="missing"):
+            LoadProfile([{"target": 1}])
+        with pytest.raises(ValueError, match="unsupported"):
+            LoadProfile([{"target": 1, "duration": 1, "foo": 1}])
+        with pytest.raises(ValueError, match="expected"):
+            LoadProfile([{"target": 1, "duration": 1, "ramp": 2}])
+        with pytest.raises(ValueError, match="duplicate"):
+            LoadProfile(
+                [
+                    {"name": "a", "target": 1, "duration": 1},
+                    {"name": "a", "target": 1, "duration": 1},
+                ]
+            )
+
+    def test_run(self):
+        config_path = os.path.join(self.fixtures_path, "test_load_profile.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        res = rm.run({})
+        assert res is True
+
+        stages = rm.stats["load_stages"]
+        assert list(stages.keys()) == ["ramp_up", "plateau", "spike", "ramp_down"]
+        assert stages["spike"]["sess_running_max"] == 4
+        assert stages["plateau"]["act_count"] > 0
+        assert rm.stats["sess_running"] == 0
+        assert rm.stats["load_stage"] is None
+        # All sessions were retired gracefully, i.e. ran the 'end' sequence:
+        assert rm.stats["sequence_stats"]["end"]["seq_count"] == rm.stats["sess_count"]
+        assert "Load profile stages:" in rm.get_cli_summary()
+
+    def test_run_limits(self):
+        config_path = os.path.join(self.fixtures_path, "test_load_profile.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        rm.config_manager.config["max_time"] = 0.4
+        start = time.monotonic()
+        res = rm.run({})
+        assert res is False
+        # Sessions that stopped at the limit are not replaced
+        assert time.monotonic() - start < 1.0
+        assert rm.stats["sess_count"] <= 4
+        assert rm.stats["run_limit_reached"]
+
+    def test_histogram(self):
+        hist = LatencyHistogram()
+        assert hist.percentile(99) is None
+        for i in range(1, 101):
+            hist.add(i / 1000.0)
+        assert hist.count == 100
+        pct = hist.get_percentiles()
+        assert pct["p50"] == pytest.approx(0.050, rel=0.05)
+        assert pct["p99"] == pytest.approx(0.099, rel=0.05)
+
+    def test_knee_finder(self):
+        opts = {
+            "start": 10,
+            "step": 10,
+            "step_duration": 2,
+            "max_sessions": 50,
+            "slo": {"p99": 0.5},
+        }
+        p99_by_target = {10: 0.1, 20: 0.2, 30: 0.4, 40: 0.8, 50: 1.6}
+
+        stats = _FakeStats(p99_by_target)
+        kf = KneeFinder(opts, stats)
+        targets = _run_knee_finder(kf, stats)
+        assert targets == [10, 10, 20, 20, 30, 30, 40, 40]
+        assert kf.result["saturation_sessions"] == 30
+        assert kf.result["breach_step"] == "step_4"
+        assert stats.stats["knee"] is kf.result
+        assert "Saturation point: 30 sessions" in kf.format_result()
+
+        stats = _FakeStats(p99_by_target)
+        kf = KneeFinder(dict(opts, on_breach="back_off"), stats)
+        targets = _run_knee_finder(kf, stats)
+        assert targets[-4:] == [40, 40, 30, 30]
+        assert kf.stages[-1]["name"] == "back_off"
+        assert kf.result["saturation_sessions"] == 30
+
+        stats = _FakeStats(dict.fromkeys(p99_by_target, 0.1))
+        kf = KneeFinder(opts, stats)
+        targets = _run_knee_finder(kf, stats)
+        assert targets[-1] == 50
+        assert kf.result["breach_step"] is None
+        assert "not violated up to 50" in kf.format_result()
+
+        with pytest.raises(ValueError, match="missing"):
+            KneeFinder({"step_duration": 1, "max_sessions": 10})
+        with pytest.raises(ValueError, match="slo"):
+            KneeFinder({"step_duration": 1, "max_sessions": 10, "slo": {"p42": 1}})
+
+    def test_run_knee_finder(self):
+        config_path = os.path.join(self.fixtures_path, "test_find_knee.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        res = rm.run({})
+        assert res is True
+
+        assert list(rm.stats["load_stages"].keys()) == ["step_1", "step_2", "step_3"]
+        assert rm.stats["load_stages"]["step_3"]["p99"] > 0
+        assert rm.stats["knee"]["saturation_sessions"] == 3
+        assert "SLO not violated" in rm.get_cli_summary()
@@ -2,7 +2,9 @@
 # Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
 """
 """
-from stressor.plugin_manager import PluginManager
+import os
+
+from stressor.plugin_manager import PluginManager, iter_entry_points
 
 
 class TestPluginManager:
@@ -13,3 +15,13 @@ class TestPluginManager:
         pm = PluginManager
         pm.register_plugins(arg_parser=None)
         assert "PsAlloc" in pm.activity_plugin_map
+
+    def test_entry_point_index(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("STRESSOR_CACHE_DIR", str(tmp_path))
+        scanned = list(iter_entry_points(PluginManager.namespace))
+        assert os.path.isfile(tmp_path / "entry_points.json")
+        cached = list(iter_entry_points(PluginManager.namespace))
+        assert [ep.name for ep in cached] == [ep.name for ep in scanned]
+        ep = next(ep for ep in cached if ep.name == "ps")
+        assert ep.dist.startswith("stressor")
+        assert callable(ep.load())
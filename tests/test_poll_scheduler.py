@@ -0,0 +1,106 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+"""
+import os
+import threading
+import time
+import types
+
+import requests
+
+from stressor.plugin_manager import PluginManager
+from stressor.poll_scheduler import Poller, PollScheduler
+from stressor.run_manager import RunManager
+
+
+class _FakePoller:
+    def __init__(self, interval, max_count):
+        self.interval = interval
+        self.max_count = max_count
+        self.count = 0
+        self.threads = set()
+
+    @property
+    def is_active(self):
+        return self.count < self.max_count
+
+    def run_once(self):
+        self.threads.add(threading.current_thread().name)
+        self.count += 1
+
+
+class TestPollScheduler:
+    def setup_method(self):
+        self.fixtures_path = os.path.join(os.path.dirname(__file__), "fixtures")
+        PluginManager.register_plugins(arg_parser=None)
+
+    def test_scheduler(self):
+        scheduler = PollScheduler(max_workers=4)
+        pollers = [_FakePoller(0.01, 5) for _ in range(500)]
+        for poller in pollers:
+            scheduler.schedule(poller)
+        start = time.monotonic()
+        # The scheduler thread also stops while all pollers run in a worker,
+        # so wait for the pollers
+        while time.monotonic() - start < 5 and not (
+            scheduler._thread is None and all(p.count == 5 for p in pollers)
+        ):
+            time.sleep(0.01)
+        assert all(p.count == 5 for p in pollers)
+        # All pollers share one scheduler thread and a few workers
+        threads = set().union(*(p.threads for p in pollers))
+        assert 1 <= len(threads) <= 4
+        assert scheduler._thread is None, "stopped when idle"
+
+        scheduler.close()
+        assert not any(t.name.startswith("poll_") for t in threading.enumerate())
+        scheduler.schedule(_FakePoller(0.01, 5))  # Ignored when closed
+        assert scheduler._heap == []
+
+    def test_poller_browser_session(self):
+        session = types.SimpleNamespace(
+            session_id="t01", browser_session=requests.Session()
+        )
+        session.browser_session.headers["X-Test"] = "1"
+        session.browser_session.cookies.set("a", "1")
+        poller = Poller(session, "key", "GET", "http://localhost", {}, 1.0)
+        ps = poller._browser_session
+        assert ps is not session.browser_session
+        assert ps.headers is not session.browser_session.headers
+        assert ps.headers["X-Test"] == "1"
+        assert ps.cookies is not session.browser_session.cookies
+        assert ps.cookies["a"] == "1"
+        # Cookies that the server sets are merged back
+        resp = requests.Response()
+        resp.cookies.set("b", "2")
+        poller._merge_cookies(resp)
+        assert session.browser_session.cookies["b"] == "2"
+
+    def test_poll_request(self, mock_wsgidav_server_fixture):
+        config_path = os.path.join(self.fixtures_path, "test_poll_request.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        res = rm.run({})
+        assert res is True
+        stats = rm.stats.stats
+        (poll_stats,) = stats["pollers"].values()
+        # 3 sessions, polling every 50 ms for ~0.6 sec
+        assert 15 < poll_stats["poll_count"] < 45
+        assert poll_stats["errors"] == 0
+        assert stats["poll_count"] == poll_stats["poll_count"]
+        assert stats["act_count"] == 15, "polls are not activities"
+        assert poll_stats["bytes_received"] > 0
+        assert "Background polls:" in rm.get_cli_summary()
+        for session in rm.session_list:
+            assert session.pollers == {}
+        assert PollScheduler._instance is None, "shut down after the run"
+
+        # `--single` sends one request
+        rm = RunManager()
+        rm.load_config(config_path)
+        rm.config_manager.config["force_single"] = True
+        res = rm.run({})
+        assert res is True
+        assert rm.stats.stats["pollers"] == {}
+        assert rm.stats.stats["errors"] == 0
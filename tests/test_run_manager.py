@@ -5,18 +5,105 @@
 # ruff: noqa: T201, T203 `print` found
 
 import os
+import threading
+import time
+from copy import deepcopy
 
+import pytest
+
+from stressor.config_manager import ConfigurationError
+from stressor.plugin_manager import PluginManager
+from stressor.profiler import PhaseProfiler
 from stressor.run_manager import RunManager
-from stressor.session_manager import User
+from stressor.session_manager import SessionManager, User
 
 
 class TestRunManager:
     def setup_method(self):
         self.fixtures_path = os.path.join(os.path.dirname(__file__), "fixtures")
+        PluginManager.register_plugins(arg_parser=None)
 
     def test_user(self):
         user = User("Joe", "secret")
         assert user.auth == ("Joe", "secret")
+        assert vars(user) == {}
+        with pytest.raises(AttributeError):
+            user.custom  # noqa: B018
+
+        user = User("Joe", None, custom="foo", age=42)
+        assert user.auth is None
+        assert (user.custom, user.age) == ("foo", 42)
+        # Arbitrary attributes can be set (and override custom attributes)
+        user.token = "abc"
+        user.age = 43
+        assert vars(user) == {"token": "abc", "age": 43}
+        assert user.attributes == {"custom": "foo", "age": 43, "token": "abc"}
+        user_2 = deepcopy(user)
+        assert user_2 is not user
+        assert (user_2.name, user_2.custom) == ("Joe", "foo")
+        assert (user_2.token, user_2.age) == ("abc", 43)
+
+    def test_users_csv(self):
+        config_path = os.path.join(self.fixtures_path, "test_users_csv.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        res = rm.run({})
+        assert res is True
+
+        users = [sess.user for sess in rm.session_list]
+        # Users are re-used round-robin
+        assert [u.name for u in users] == ["User_1", "User_2", "User_3", "User_1"]
+        assert users[0].custom == "foo"
+        assert users[0].auth == ("User_1", "secret")
+        # Users from the same file share the map of custom attribute names
+        assert users[0]._keys is users[1]._keys
+
+    def test_users_jsonl(self, tmp_path, caplog):
+        with open(os.path.join(self.fixtures_path, "test_users_csv.yaml")) as f:
+            config = f.read()
+        config_path = tmp_path / "test.yaml"
+        config_path.write_text(config.replace("users.csv", "users.jsonl"))
+        users_path = tmp_path / "users.jsonl"
+
+        # `password` is optional
+        users_path.write_text(
+            '{"name": "User_1", "custom": "foo"}\n'
+            '{"name": "User_2", "password": "secret", "custom": "bar"}\n'
+            '{"password": "secret"}\n'
+        )
+        rm = RunManager()
+        rm.load_config(str(config_path))
+        assert rm.run({}) is True
+        users = [sess.user for sess in rm.session_list]
+        assert [u.name for u in users] == ["User_1", "User_2", "User_1", "User_2"]
+        assert users[0].auth is None
+        assert users[1].auth == ("User_2", "secret")
+        assert users[0]._keys is users[1]._keys
+        # Invalid rows are skipped
+        assert "skipping invalid user {'password': 'secret'}" in caplog.text
+
+        # The first row is checked when the configuration is loaded
+        users_path.write_text('{"password": "secret"}\n')
+        with pytest.raises(ConfigurationError):
+            RunManager().load_config(str(config_path))
+        assert "sessions.users: Expected a non-empty string `name`" in caplog.text
+
+    def test_invalid_users(self, tmp_path, caplog):
+        with open(os.path.join(self.fixtures_path, "test_users_csv.yaml")) as f:
+            config = f.read()
+        config_path = tmp_path / "test.yaml"
+        config_path.write_text(config)
+        (tmp_path / "users.csv").write_text("login,password\nUser_1,secret\n")
+        with pytest.raises(ConfigurationError):
+            RunManager().load_config(str(config_path))
+        assert "must have a 'name' column" in caplog.text
+
+        config_path.write_text(
+            config.replace("users: users.csv", "users:\n    - password: secret")
+        )
+        with pytest.raises(ConfigurationError):
+            RunManager().load_config(str(config_path))
+        assert "sessions.users#00: Expected a non-empty string `name`" in caplog.text
 
     def test_dry_run(self):
         config_path = os.path.join(self.fixtures_path, "test_dry_run.yaml")
@@ -65,6 +152,198 @@ class TestRunManager:
         # assert activities == []
         # assert 0
 
+    def test_profile(self):
+        config_path = os.path.join(self.fixtures_path, "test_dry_run.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        res = rm.run({"profile": True}, {"dry_run": True})
+        assert res is True
+
+        results = rm.profiler.get_results()
+        assert set(results.keys()) == {
+            "PostRequest",
+            "Sleep",
+            "RunScript",
+            "DeleteRequest",
+        }
+        # 2 sessions, 4 sleep activities each:
+        assert results["Sleep"]["macros"][0] == 8
+        assert results["Sleep"]["execute"][0] == 8
+        assert "Sleep" in rm.profiler.format_report()
+
+        # Phases that raise are recorded too
+        profiler = PhaseProfiler()
+        with pytest.raises(RuntimeError), profiler.phase("Sleep", "execute"):
+            raise RuntimeError
+        assert profiler.get_results()["Sleep"]["execute"][0] == 1
+
+    def test_pace(self):
+        config_path = os.path.join(self.fixtures_path, "test_pace.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        start = time.monotonic()
+        res = rm.run({})
+        elap = time.monotonic() - start
+        assert res is True
+
+        main_stats = rm.stats["sequence_stats"]["main"]
+        slow_stats = rm.stats["sequence_stats"]["slow"]
+        # 2 sessions, 5 paced iterations with 0.1 sec interval each
+        assert main_stats["paced_count"] == 10
+        assert main_stats.get("paced_late", 0) == 0
+        assert elap >= 0.4
+        # 'slow' takes longer than its pace
+        assert slow_stats["paced_late"] == 4
+        assert rm.stats["paced_late"] == 4
+        assert "Paced iterations:  14, late: 4" in rm.get_cli_summary()
+
+    def test_har_replay(self, mock_wsgidav_server_fixture):
+        config_path = os.path.join(self.fixtures_path, "test_har_replay.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        activity = rm.config_manager.sequences["main"][0]["activity"]
+        assert len(activity.replay_entries) == 5
+        assert activity.replay_entries[0][:3] == (0.0, "GET", "/")
+        assert 8.5 < activity.duration < 8.7
+        start = time.monotonic()
+        res = rm.run({})
+        elap = time.monotonic() - start
+        assert res is True
+        assert rm.stats["errors"] == 0
+        # Recorded offsets are preserved, but scaled by 1/20
+        assert 0.4 < elap < 4
+
+        # Recorded headers are replayed, except those computed by `requests`
+        headers = activity.replay_entries[0][4]
+        assert headers["Accept"].startswith("text/html")
+        assert "Host" not in headers
+
+        # After a stop request, only the requests that were sent are reported
+        session = SessionManager(rm, dict(rm.config_manager.context), "t01", None)
+        rm.stop_request.set()
+        res = activity.execute(session, time_scale=20)
+        assert res["requests"] < len(activity.replay_entries)
+        session.run()  # Shuts down the worker pool
+        assert "har_replay_pools" not in session.data
+
+    def test_http_cache(self, mock_wsgidav_server_fixture):
+        config_path = os.path.join(self.fixtures_path, "test_http_cache.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        res = rm.run({})
+        assert res is True
+        stats = rm.stats.stats
+        assert stats["errors"] == 0
+        # WsgiDAV sends no 'Cache-Control', but ETags
+        assert stats["cache_misses"] == 3
+        assert stats["cache_hits"] + stats["cache_revalidated"] == 6
+        assert "HTTP cache:" in rm.get_cli_summary()
+        # Fresh entries are not requested, so fewer bytes than 3 full runs
+        received = stats["bytes_received"]
+        assert received > 0
+        (sess_stats,) = stats["sessions"].values()
+        assert sess_stats["bytes_received"] == received
+        assert stats["sequence_stats"]["main"]["bytes_received"] == received
+        assert "Transfer:" in rm.get_cli_summary()
+
+    def test_result_retention(self):
+        config_path = os.path.join(self.fixtures_path, "test_result_retention.yaml")
+        last_results = []
+
+        def notify_hook(channel, *args, **kwargs):
+            value = kwargs["context"]["last_result"]
+            last_results.append(len(value) if isinstance(value, str) else value)
+
+        for policy, expected in (
+            (None, [100_000, {"count": 42}, {"count": 7}, None, 100_000]),
+            ("only-when-referenced", [None, {"count": 42}, {"count": 7}, None, None]),
+        ):
+            rm = RunManager()
+            rm.load_config(config_path)
+            activities = [a["activity"] for a in rm.config_manager.sequences["main"]]
+            # Detected at compile time: scripts, nested functions, and macros
+            assert [a.result_is_referenced for a in activities] == [
+                False,
+                True,
+                True,
+                True,
+                False,
+            ]
+            if policy:
+                rm.config_manager.config["result_retention"] = policy
+
+            last_results.clear()
+            rm.subscribe("end_activity", notify_hook)
+            res = rm.run({})
+            assert res is True
+            assert last_results == expected
+
+        # Error details show the complete result, even if it is not retained
+        rm = RunManager()
+        rm.load_config(config_path)
+        rm.config_manager.config["result_retention"] = "only-when-referenced"
+        rm.config_manager.sequences["main"][0]["assert_match"] = "y"
+        assert rm.run({}) is False
+        ((_fp, info),) = rm.stats.get_top_errors()
+        assert "'last_result': 'xxxxx" in rm.stats.error_samples[info["id"]][0]
+
+    def test_parallel(self, mock_wsgidav_server_fixture):
+        config_path = os.path.join(self.fixtures_path, "test_parallel.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        assert rm.config_manager.context["jobs"] == [{"parallel": 4, "name": "foo"}]
+        block = rm.config_manager.sequences["main"][1]
+        assert "parallel" not in block, "children are owned by the activity"
+        assert block["activity"].get_info() == (
+            "Parallel(Sleep, Sleep, GetRequest, RunScript)"
+        )
+        paths = []
+        threads = set()
+
+        def notify_hook(channel, *args, **kwargs):
+            paths.append(str(kwargs["path"]))
+            threads.add(threading.current_thread().name)
+
+        rm.subscribe("end_activity", notify_hook)
+        start = time.monotonic()
+        res = rm.run({})
+        assert res is True
+        # 2 iterations with 2 sleeps of 0.3 sec, that run concurrently
+        assert time.monotonic() - start < 1.1
+        stats = rm.stats.stats
+        assert stats["errors"] == 0
+        # 2 sessions x 2 iterations x (2 + 4 children + block)
+        assert stats["act_count"] == 28
+        (block_stats,) = stats["monitored"].values()
+        assert block_stats["act_count"] == 4
+        assert 0.3 <= block_stats["act_time_min"] < 0.6
+        # The block includes the bytes of its children (once per iteration)
+        assert block_stats["bytes_received"] > 0
+        assert block_stats["bytes_received"] * 2 == stats["bytes_received"]
+        # Children have their own path below the block
+        block_path = "/Parallel(Sleep, Sleep, GetRequest, RunScript)/"
+        child_paths = [p for p in paths if block_path in p]
+        assert len(child_paths) == 16
+        assert any(p.endswith(block_path + "GetRequest(/test1.json)") for p in paths)
+        assert any("-parallel_" in t for t in threads)
+        for session in rm.session_list:
+            assert session._parallel_pool is None
+
+    def test_parallel_run_limits(self, caplog):
+        config_path = os.path.join(self.fixtures_path, "test_parallel.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        rm.start_stamp = time.monotonic() - 10
+        session = SessionManager(rm, dict(rm.config_manager.context), "t01", None)
+        session.max_time = 1.0
+        branches = [session.make_branch() for _ in range(3)]
+        # Branches share the limit state of their session
+        assert not any(b.check_run_limits("main") for b in branches)
+        assert session._cancelled_seq == "main"
+        assert not session.check_run_limits("main")
+        assert session.check_run_limits("end")
+        assert caplog.text.count("Reached max. run time limit") == 1
+
     def test_mock_server(self, mock_wsgidav_server_fixture):
         config_path = os.path.join(self.fixtures_path, "test_mock_server.yaml")
         rm = RunManager()
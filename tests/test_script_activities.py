@@ -7,10 +7,15 @@
 import os
 from textwrap import dedent
 
+from stressor.plugin_manager import PluginManager
+from stressor.plugins.script_activities import get_script_names
+from stressor.run_manager import RunManager
+
 
 class TestScripts:
     def setup_method(self):
         self.fixtures_path = os.path.join(os.path.dirname(__file__), "fixtures")
+        PluginManager.register_plugins(arg_parser=None)
 
     def test_script(self):
         # config_path = os.path.join(self.fixtures_path, "test_mock_server.yaml")
@@ -60,3 +65,50 @@ class TestScripts:
         print(f"Globals: {global_vars.keys()}")
         print(f"Locals: {local_vars}")
         # assert 0
+
+    def test_script_names(self):
+        script = """
+        import re
+        x = a + len(b)
+        y += 1
+        del z
+        def f(arg):
+            return arg + c
+        result = f(x)
+        """
+        code = compile(dedent(script), "<string>", "exec")
+        assert get_script_names(code) == (
+            {"a", "b", "len", "y", "z", "f", "x"},
+            {"re", "x", "y", "z", "f", "result"},
+        )
+        code = compile("def f():\n    return locals()", "<string>", "exec")
+        assert get_script_names(code) == (None, {"f"})
+
+    def test_exports(self):
+        config_path = os.path.join(self.fixtures_path, "test_script_exports.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        activity = rm.config_manager.sequences["main"][0]["activity"]
+        assert activity.input_names == {
+            "factor",
+            "lookup",
+            "math",
+            "sorted",
+            "the_answer",
+        }
+        contexts = {}
+
+        def notify_hook(channel, *args, **kwargs):
+            contexts[kwargs["session_id"]] = kwargs["context"].copy()
+
+        rm.subscribe("end_activity", notify_hook)
+        res = rm.run({})
+        assert res is True
+        assert rm.stats["errors"] == 0
+        assert len(contexts) == 2
+        for context in contexts.values():
+            assert context["the_answer"] == 42
+            assert context["names"] == ["a"]
+            assert context["counter"] == 2
+            assert context["factor"] == 6
+            assert "unused" not in context
@@ -0,0 +1,90 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+"""
+import logging
+import os
+
+from stressor.plugin_manager import PluginManager
+from stressor.run_manager import RunManager
+from stressor.statistic_manager import RateLimitedLogger
+
+
+class TestStatisticManager:
+    def setup_method(self):
+        self.fixtures_path = os.path.join(os.path.dirname(__file__), "fixtures")
+        PluginManager.register_plugins(arg_parser=None)
+
+    def test_rate_limited_logger(self, caplog):
+        log = RateLimitedLogger(logging.getLogger("stressor.test"), rate=3)
+        with caplog.at_level(logging.INFO, logger="stressor.test"):
+            res = [log.log(logging.ERROR, f"error {i}") for i in range(10)]
+        assert res == [True] * 3 + [False] * 7
+        assert log.suppressed == 7
+        assert [r.message for r in caplog.records] == ["error 0", "error 1", "error 2"]
+
+        # The next message reports the suppressed ones
+        log._window_start -= 1.0
+        caplog.clear()
+        with caplog.at_level(logging.INFO, logger="stressor.test"):
+            assert log.log(logging.ERROR, "error 10")
+        assert [r.message for r in caplog.records] == [
+            "Suppressed 7 log messages (limit: 3/sec).",
+            "error 10",
+        ]
+
+    def test_error_fingerprints(self, mock_wsgidav_server_fixture):
+        config_path = os.path.join(self.fixtures_path, "test_error_storm.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        res = rm.run({})
+        assert res is False
+        stats = rm.stats
+        assert stats["errors"] == 40
+
+        top_errors = stats.get_top_errors()
+        assert len(top_errors) == 2
+        fingerprints = sorted(fp for fp, _info in top_errors)
+        assert fingerprints[0].startswith("ActivityAssertionError at /main/")
+        assert fingerprints[0].endswith("(200)")
+        assert fingerprints[1].startswith("HTTPError at /main/")
+        assert fingerprints[1].endswith("(404)")
+        for _fp, info in top_errors:
+            assert info["count"] == 20
+            # Details are kept for the first errors only
+            assert len(stats.error_samples[info["id"]]) == 3
+            assert "Execution path:" in stats.error_samples[info["id"]][0]
+
+        info = stats.get_error_info({"type": "error", "key": "1"})
+        assert info.startswith("First 3 Error Samples")
+        assert "Top errors:" in rm.get_cli_summary()
+        monitor_info = stats.get_monitor_info(rm.config_manager.config_all)
+        assert monitor_info["error_stats"][0]["cols"][0] == 20
+
+    def test_release_session(self):
+        config_path = os.path.join(self.fixtures_path, "test_traffic_mix.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        assert rm.run({}) is True
+        stats = rm.stats
+        act_count = sum(info["act_count"] for info in stats["sessions"].values())
+        for sess in list(rm.session_list):
+            rm._release_session(sess)
+        assert rm.session_list == []
+
+        # Stats of terminated sessions are kept in one bucket
+        (key,) = stats["sessions"].keys()
+        assert key == stats.FINISHED_SESSIONS
+        info = stats["sessions"][key]
+        assert info["sess_count"] == stats["sess_count"] == 2
+        assert info["act_count"] == act_count
+        assert info["act_time_avg"] == info["act_time"] / act_count
+        assert info["act_time_min"] <= info["act_time_avg"] <= info["act_time_max"]
+        assert stats.get_monitor_info(rm.config_manager.config_all)["sess_stats"]
+
+        # A poll that completes after the session was released (see
+        # `stop_pollers()`) is still counted, but not per session
+        stats.report_poll(sess, "/main/poll", 0.1, 100, 200)
+        assert stats["poll_count"] == 1
+        assert stats["pollers"]["/main/poll"]["bytes_received"] == 200
+        assert stats["sessions"][key] == info
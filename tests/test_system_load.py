@@ -0,0 +1,74 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+"""
+import os
+import tempfile
+import time
+
+import pytest
+
+from stressor.plugin_manager import PluginManager
+from stressor.run_manager import RunManager
+from stressor.system_load import CpuLoad, allocate_memory, read_file, write_file
+
+
+class TestSystemLoad:
+    def setup_method(self):
+        self.fixtures_path = os.path.join(os.path.dirname(__file__), "fixtures")
+        PluginManager.register_plugins(arg_parser=None)
+
+    def test_file_io(self, tmp_path):
+        path = str(tmp_path / "test.dat")
+        for use_mmap in (False, True):
+            assert write_file(path, 100_000, 4096, fsync=True, use_mmap=use_mmap)
+            assert os.path.getsize(path) == 100_000
+            assert read_file(path, 4096, use_mmap=use_mmap) == 100_000
+            assert read_file(path, 4096, size=5000, use_mmap=use_mmap) == 5000
+            # Random data (not compressible)
+            with open(path, "rb") as f:
+                data = f.read(4096)
+            assert len(set(data)) > 200
+        assert write_file(path, 0, use_mmap=True) == 0
+        assert read_file(path, use_mmap=True) == 0
+
+    def test_memory(self):
+        buf = allocate_memory(1_000_001)
+        assert len(buf) == 1_000_001
+        assert buf[0] == 1
+
+    def test_cpu_load(self):
+        load = CpuLoad(cores=2, duration=0.2)
+        load.start()
+        assert load.is_alive
+        load.wait()
+        assert not load.is_alive
+        assert load.stop() == pytest.approx(0.4)
+
+        # Stopped early
+        load = CpuLoad(cores=1)
+        load.start()
+        time.sleep(0.1)
+        core_seconds = load.stop()
+        assert 0.1 <= core_seconds < 1
+        assert not load.is_alive
+
+    def test_activities(self):
+        config_path = os.path.join(self.fixtures_path, "test_system_load.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        start = time.monotonic()
+        res = rm.run({})
+        assert res is True
+        assert time.monotonic() - start < 10, "CPU load was stopped"
+        load_stats = rm.stats.stats["system_load"]
+        assert load_stats["memory"]["amount"] == 2 * 2 * 1024 * 1024
+        assert load_stats["file_write"]["amount"] == 2 * 1_000_000
+        assert load_stats["file_read"]["count"] == 2
+        assert 0 < load_stats["cpu"]["amount"] < 20
+        assert "System load:" in rm.get_cli_summary()
+        for session in rm.session_list:
+            assert "system_load" not in session.data
+        prefix = f"stressor_{os.getpid()}_"
+        temp_files = os.listdir(tempfile.gettempdir())
+        assert not [name for name in temp_files if name.startswith(prefix)]
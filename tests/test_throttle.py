@@ -0,0 +1,134 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+"""
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from stressor.config_manager import ConfigurationError
+from stressor.plugin_manager import PluginManager
+from stressor.run_manager import RunManager
+from stressor.session_manager import User
+from stressor.throttle import Throttle, ThrottledHTTPAdapter, TokenBucket
+
+
+class TestThrottle:
+    def test_options(self):
+        t = Throttle({"download_kbps": 1600, "upload_kbps": 800, "rtt": "150ms"})
+        assert t.download == 200_000
+        assert t.upload == 100_000
+        assert t.rtt == pytest.approx(0.15)
+
+        with pytest.raises(TypeError):
+            Throttle([])
+        with pytest.raises(ValueError, match="unknown option"):
+            Throttle({"download": 1})
+        with pytest.raises(ValueError, match="must be a number"):
+            Throttle({"download_kbps": "fast"})
+        with pytest.raises(ValueError, match="must not be negative"):
+            Throttle({"rtt": -1})
+
+        assert Throttle.from_session({}) is None
+        sessions = {"throttle": {"download_kbps": 1600, "rtt": 0.1}}
+        # User attributes (e.g. from a CSV file) take precedence
+        user = User("u1", "", download_kbps="400", rtt="")
+        t = Throttle.from_session(sessions, user)
+        assert t.download == 50_000
+        assert t.rtt == 0.1
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(1000, burst=100)
+        assert bucket.consume(100) == 0
+        # Overdraw: the caller must wait until the debt is paid off
+        assert bucket.consume(500) == pytest.approx(0.5, abs=0.01)
+        assert bucket.consume(100) == pytest.approx(0.6, abs=0.01)
+
+    def test_adapter(self, mock_wsgidav_server_fixture):
+        url = "http://127.0.0.1:8082/throttle_test.bin"
+        data = b"x" * 60_000
+        throttle = Throttle({"download_kbps": 1600, "upload_kbps": 1600, "rtt": 0.1})
+        bs = requests.Session()
+        adapter = ThrottledHTTPAdapter(throttle)
+        bs.mount("http://", adapter)
+        try:
+            # 60 kB at 200 kB/s, minus a burst of 20 kB, plus the RTT
+            start = time.monotonic()
+            bs.put(url, data=data).raise_for_status()
+            assert time.monotonic() - start > 0.25
+
+            start = time.monotonic()
+            res = bs.get(url)
+            res.raise_for_status()
+            assert res.content == data
+            assert time.monotonic() - start > 0.25
+        finally:
+            bs.delete(url)
+
+    def test_adapter_chunked(self):
+        class ChunkedHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for _ in range(6):
+                    self.wfile.write(b"2710\r\n" + b"x" * 10_000 + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), ChunkedHandler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{httpd.server_port}/"
+        throttle = Throttle({"download_kbps": 1600})
+        bs = requests.Session()
+        bs.mount("http://", ThrottledHTTPAdapter(throttle))
+        try:
+            # 60 kB at 200 kB/s, minus a burst of 20 kB
+            start = time.monotonic()
+            res = bs.get(url)
+            res.raise_for_status()
+            assert res.content == b"x" * 60_000
+            assert time.monotonic() - start > 0.15
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+    def test_invalid_user_values(self, tmp_path, caplog):
+        PluginManager.register_plugins(arg_parser=None)
+        fixtures_path = os.path.join(os.path.dirname(__file__), "fixtures")
+        with open(os.path.join(fixtures_path, "test_users_csv.yaml")) as f:
+            config = f.read()
+        config_path = tmp_path / "test.yaml"
+
+        # Users of the config file are checked when it is loaded
+        config_path.write_text(
+            config.replace(
+                "users: users.csv",
+                "users:\n    - name: u1\n      password: ''\n      download_kbps: fast",
+            )
+        )
+        with pytest.raises(ConfigurationError):
+            RunManager().load_config(str(config_path))
+        assert "sessions.users#00" in caplog.text
+
+        # Users of CSV files are checked when their session starts
+        (tmp_path / "users.csv").write_text(
+            "name,password,custom,download_kbps\n"
+            "User_1,secret,foo,\n"
+            "User_2,secret,bar,fast\n"
+        )
+        config_path.write_text(config.replace("count: 4", "count: 2"))
+        rm = RunManager()
+        rm.load_config(str(config_path))
+        assert rm.run({}) is False
+        assert rm.stats["errors"] == 1
+        assert rm.stats["seq_count"] == 1
+        assert "Skipping session t02 (User<User_2>)" in caplog.text
@@ -0,0 +1,116 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+"""
+import os
+import random
+
+import pytest
+
+from stressor.config_manager import ConfigurationError
+from stressor.plugin_manager import PluginManager
+from stressor.run_manager import RunManager
+from stressor.traffic_mix import AliasSampler, SequenceMix
+
+
+class TestTrafficMix:
+    def setup_method(self):
+        self.fixtures_path = os.path.join(os.path.dirname(__file__), "fixtures")
+        PluginManager.register_plugins(arg_parser=None)
+
+    def test_alias_sampler(self):
+        sampler = AliasSampler([5, 0, 3, 2])
+        assert sampler.probabilities == [0.5, 0.0, 0.3, 0.2]
+        rng = random.Random(1)
+        counts = [0] * len(sampler)
+        for _ in range(100_000):
+            counts[sampler.sample(rng)] += 1
+        assert counts[1] == 0
+        for count, p in zip(counts, sampler.probabilities):
+            assert count / 100_000 == pytest.approx(p, abs=0.01)
+
+        assert AliasSampler([1]).sample() == 0
+        with pytest.raises(ValueError):
+            AliasSampler([])
+        with pytest.raises(ValueError):
+            AliasSampler([0, 0])
+        with pytest.raises(ValueError):
+            AliasSampler([2, -1])
+
+    def test_mix(self):
+        mix = SequenceMix({"a": 3, "b": 1})
+        assert mix.target == {"a": 0.75, "b": 0.25}
+
+        # a -> b -> c -> a: the chain is periodic, but has a stationary mix
+        mix = SequenceMix({"a": 1}, {"a": {"b": 1}, "b": {"c": 1}, "c": {"a": 1}})
+        assert mix.names == ["a", "b", "c"]
+        for p in mix.target.values():
+            assert p == pytest.approx(1 / 3)
+        rng = random.Random(1)
+        prev = None
+        choices = []
+        for _ in range(6):
+            prev = mix.choose(rng, prev)
+            choices.append(prev)
+        assert choices == ["a", "b", "c", "a", "b", "c"]
+
+        # b is only reached from a (with 50%) and then returns to a
+        mix = SequenceMix({"a": 1}, {"a": {"a": 1, "b": 1}})
+        assert mix.target["a"] == pytest.approx(2 / 3)
+        assert mix.target["b"] == pytest.approx(1 / 3)
+
+    def test_errors(self):
+        with pytest.raises(TypeError):
+            SequenceMix(["a", "b"])
+        with pytest.raises(TypeError):
+            SequenceMix({"a": 1}, ["b"])
+        with pytest.raises(TypeError):
+            SequenceMix({"a": "1"})
+        with pytest.raises(ValueError, match="mix"):
+            SequenceMix({"a": 0})
+        with pytest.raises(ValueError, match="transitions.a"):
+            SequenceMix({"a": 1}, {"a": {}})
+
+    def test_run(self):
+        config_path = os.path.join(self.fixtures_path, "test_traffic_mix.yaml")
+
+        def _run():
+            rm = RunManager()
+            rm.load_config(config_path)
+            res = rm.run({})
+            assert res is True
+            return rm
+
+        rm = _run()
+        mixes = rm.stats["sequence_mixes"]
+        mix = mixes["mix_1"]
+        assert mix["total"] == 1000
+        assert mix["target"] == {"browse": 0.7, "search": 0.2, "checkout": 0.1}
+        for seq_name, target in mix["target"].items():
+            assert mix["counts"][seq_name] / 1000 == pytest.approx(target, abs=0.05)
+        assert mixes["alternate"]["counts"] == {"browse": 10, "search": 10}
+        assert rm.stats["sequence_stats"]["search"]["seq_count"] == (
+            mix["counts"]["search"] + 10
+        )
+        summary = rm.get_cli_summary()
+        assert "Sequence mix 'mix_1': 1,000 iterations, browse: " in summary
+
+        # `config.random_seed` makes runs reproducible
+        assert _run().stats["sequence_mixes"] == mixes
+
+    def test_config_errors(self, tmp_path, caplog):
+        with open(os.path.join(self.fixtures_path, "test_traffic_mix.yaml")) as f:
+            config = f.read()
+        path = tmp_path / "test.yaml"
+        path.write_text(config.replace("checkout: 10", "undefined: 10"))
+        rm = RunManager()
+        with pytest.raises(ConfigurationError):
+            rm.load_config(str(path))
+        assert "sequence 'undefined' is not defined" in caplog.text
+
+        # Mix names are unique (explicit or generated)
+        path.write_text(config.replace("name: alternate", "name: mix_1"))
+        rm = RunManager()
+        with pytest.raises(ConfigurationError):
+            rm.load_config(str(path))
+        assert "`mix`: duplicate name 'mix_1'" in caplog.text
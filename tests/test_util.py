@@ -2,13 +2,20 @@
 # Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
 """
 """
+import io
+import logging
+
 import pytest
 
 from stressor.util import (
+    AsyncLogHandler,
+    LogSampler,
     PathStack,
+    ResultRetention,
     assert_always,
     check_arg,
     coerce_str,
+    format_bytes,
     format_elap,
     format_num,
     format_rate,
@@ -16,7 +23,9 @@ from stressor.util import (
     get_random_number,
     is_yaml_keyword,
     parse_args_from_str,
+    parse_duration,
     parse_option_args,
+    parse_size,
     shorten_string,
 )
 
@@ -52,6 +61,32 @@ class TestBasics:
         with pytest.raises(TypeError):
             get_random_number("1")
 
+    def test_parse_duration(self):
+        assert parse_duration(2) == 2.0
+        assert parse_duration(0.5) == 0.5
+        assert parse_duration("2.0s") == 2.0
+        assert parse_duration("500ms") == 0.5
+        assert parse_duration(" 1.5 m") == 90.0
+        assert parse_duration("1h") == 3600.0
+        assert parse_duration("3") == 3.0
+        with pytest.raises(ValueError):
+            parse_duration("2 weeks")
+        with pytest.raises(TypeError):
+            parse_duration(None)
+
+    def test_parse_size(self):
+        assert parse_size(100) == 100
+        assert parse_size("64kB") == 64_000
+        assert parse_size("64 KiB") == 65_536
+        assert parse_size("1.5MB") == 1_500_000
+        assert parse_size("2GiB") == 2 << 30
+        assert parse_size("512b") == 512
+        assert parse_size("10") == 10
+        with pytest.raises(ValueError):
+            parse_size("10 pages")
+        with pytest.raises(TypeError):
+            parse_size(None)
+
     def test_is_yaml_keyword(self):
         assert is_yaml_keyword(None) is False
         assert is_yaml_keyword("") is False
@@ -138,6 +173,13 @@ class TestBasics:
         assert format_elap(367, high_prec=True) == "6:07.00 min"
         assert format_elap(12.34, count=10) == "12.3 sec, 0.8 items/sec"
 
+    def test_format_bytes(self):
+        assert format_bytes(None) == "0 B"
+        assert format_bytes(999) == "999 B"
+        assert format_bytes(123_456) == "123.5 kB"
+        assert format_bytes(12_345_678) == "12.35 MB"
+        assert format_bytes(2_500_000_000_000) == "2,500 GB"
+
     def test_format_num(self):
         assert format_num(1000.2345) == "1,000"
         assert format_num(100.2345) == "100.2"
@@ -252,3 +294,98 @@ class TestBasics:
         enable_colors(True, True)
         assert red("error") == "\x1b[91merror\x1b[39m"
         assert green("ok") == "\x1b[32mok\x1b[39m"
+
+    def test_async_log_handler(self):
+        stream = io.StringIO()
+        stream_handler = logging.StreamHandler(stream)
+        stream_handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+        stream_handler.setLevel(logging.INFO)
+        handler = AsyncLogHandler([stream_handler])
+        test_logger = logging.getLogger("stressor.test_async")
+        test_logger.propagate = False
+        test_logger.setLevel(logging.DEBUG)
+        test_logger.addHandler(handler)
+        try:
+            args = ["a"]
+            test_logger.info("line %s", args)
+            args.append("b")  # Arguments are merged when the call is made
+            test_logger.debug("hidden")
+            for i in range(2000):
+                test_logger.warning(f"line {i}")
+        finally:
+            test_logger.removeHandler(handler)
+            handler.close()  # Writes pending records
+        lines = stream.getvalue().splitlines()
+        assert len(lines) == 2001
+        assert lines[0] == "INFO line ['a']"
+        assert lines[-1] == "WARNING line 1999"
+
+    def test_async_log_handler_bounded(self):
+        stream = io.StringIO()
+        stream_handler = logging.StreamHandler(stream)
+        stream_handler.setFormatter(logging.Formatter("%(message)s"))
+        src_file = logging._srcfile
+        handler = AsyncLogHandler(
+            [stream_handler], max_queue_size=1, skip_record_info=True
+        )
+        assert logging._srcfile is None
+        assert logging.logProcesses is False
+        # Block the writer thread, so the queue fills up
+        stream_handler.acquire()
+        try:
+            for i in range(100):
+                handler.handle(
+                    logging.makeLogRecord(
+                        {"msg": f"line {i}", "levelno": logging.WARNING}
+                    )
+                )
+        finally:
+            stream_handler.release()
+        handler.close()
+        assert 0 < handler.dropped < 100
+        assert logging._srcfile == src_file
+        assert logging.logProcesses is True
+        lines = stream.getvalue().splitlines()
+        assert len(lines) == 100 - handler.dropped + 1
+        assert lines[-1].startswith(f"AsyncLogHandler dropped {handler.dropped}")
+
+    def test_log_sampler(self):
+        sampler = LogSampler({"activity": 3, "debug": 1})
+        assert [sampler.check("activity") for _ in range(6)] == [
+            True,
+            False,
+            False,
+        ] * 2
+        assert all(sampler.check("debug") for _ in range(3))
+        with pytest.raises(ValueError, match="unknown channel"):
+            LogSampler({"foo": 2})
+        with pytest.raises(ValueError, match="expected an int"):
+            LogSampler({"activity": 0})
+        with pytest.raises(TypeError):
+            LogSampler(100)
+
+    def test_result_retention(self):
+        data = {"text": "x" * 1000}
+        assert ResultRetention().policy == "full"
+        assert ResultRetention().apply(data, is_referenced=False) is data
+        lazy = ResultRetention("only-when-referenced")
+        assert lazy.apply(data) is data
+        assert lazy.apply(data, is_referenced=False) is None
+        assert ResultRetention("full").apply(data, is_referenced=False) is data
+        assert ResultRetention("none").apply(data) is None
+
+        truncated = ResultRetention("truncated:100")
+        assert len(truncated.apply("x" * 1000)) == 100
+        assert truncated.apply("short") == "short"
+        assert truncated.apply(42) == 42
+        res = truncated.apply(data)
+        assert isinstance(res, str) and len(res) == 100
+
+        with pytest.raises(ValueError, match="unknown policy"):
+            ResultRetention("partial")
+        with pytest.raises(ValueError, match="expected 'truncated:N'"):
+            ResultRetention("truncated:x")
+        with pytest.raises(ValueError, match="unexpected argument"):
+            ResultRetention("full:10")
+        with pytest.raises(TypeError):
+            ResultRetention(100)
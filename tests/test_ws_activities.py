@@ -0,0 +1,99 @@
+# (c) 2020-2024 Martin Wendt and contributors; see https://github.com/mar10/stressor
+# Licensed under the MIT license: https://www.opensource.org/licenses/mit-license.php
+"""
+"""
+import asyncio
+import os
+import threading
+
+import pytest
+
+from stressor.plugin_manager import PluginManager
+from stressor.run_manager import RunManager
+from stressor.ws_client import WsLoop
+
+pytest.importorskip("websockets")
+
+
+@pytest.fixture(scope="module")
+def ws_echo_server_fixture():
+    from websockets.asyncio.server import serve
+
+    async def _echo(ws):
+        async for message in ws:
+            await ws.send(message)
+
+    started = threading.Event()
+    loop = asyncio.new_event_loop()
+
+    async def _serve():
+        async with serve(_echo, "127.0.0.1", 8083) as server:
+            started.set()
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    task = loop.create_task(_serve())
+    thread = threading.Thread(target=loop.run_until_complete, args=(task,))
+    thread.start()
+    assert started.wait(5)
+    yield
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(5)
+
+
+class TestWsActivities:
+    def setup_method(self):
+        self.fixtures_path = os.path.join(os.path.dirname(__file__), "fixtures")
+        PluginManager.register_plugins(arg_parser=None)
+
+    def test_echo(self, ws_echo_server_fixture):
+        config_path = os.path.join(self.fixtures_path, "test_websockets.yaml")
+        rm = RunManager()
+        rm.load_config(config_path)
+        threads_before = threading.active_count()
+        stored = []
+
+        def _on_end(channel, *, activity, context, **kwargs):
+            if activity.get_script_name() == "WsClose":
+                stored.append(context.get("echo_session"))
+
+        rm.subscribe("end_activity", _on_end)
+        res = rm.run({})
+        assert res is True
+        stats = rm.stats.stats
+        assert stats["errors"] == 0
+        assert sorted(stored) == [s.session_id for s in rm.session_list]
+        (ws_stats,) = stats["websockets"].values()
+        # 5 sessions x 3 loops x 2 messages
+        assert ws_stats["ws_sent"] == ws_stats["ws_received"] == 30
+        assert ws_stats["ws_rtt_count"] == 30
+        assert 0 < ws_stats["ws_rtt_time_avg"] < 1
+        assert stats["bytes_received"] > 0
+        assert "WebSocket messages:" in rm.get_cli_summary()
+        for session in rm.session_list:
+            assert session.data.get("websockets") == {}
+        # All sockets share one loop thread (sessions may already have ended)
+        assert threading.active_count() <= threads_before + 1
+        assert WsLoop.get()._thread.is_alive()
+
+    def test_errors(self, ws_echo_server_fixture):
+        rm = RunManager()
+        rm.load_config(os.path.join(self.fixtures_path, "test_websockets.yaml"))
+        main = rm.config_manager.config_all["sequences"]["main"]
+        # Wait for a message that never arrives
+        main[3].update({"match": "pong", "timeout": 0.2})
+        res = rm.run({})
+        assert res is False
+        stats = rm.stats.stats
+        assert stats["errors"] == 15
+        assert "ActivityTimeoutError" in str(rm.stats.get_top_errors())
+        # Skipped messages are received, but not paired with a sent message
+        (ws_stats,) = stats["websockets"].values()
+        assert ws_stats["ws_received"] == 30
+        assert ws_stats["ws_rtt_count"] == 15
+
+        # The builtin TimeoutError is raised, also on Python < 3.11
+        with pytest.raises(TimeoutError):
+            WsLoop.get().run(asyncio.sleep(1), timeout=0.05)